@@ -0,0 +1,226 @@
+"""
+Micro-benchmarks for the envipyengine package.
+
+The benchmarks run against the stub taskengine bundled with the test suite, so
+no ENVI installation is required.  They measure the Python side of a job:
+
+==================== ===========================================================
+Benchmark            Description
+==================== ===========================================================
+config_resolution    Reading the engine, engine-args and environment settings
+                     as done for every call to taskengine.execute.
+json_encode_<size>   Encoding a job with a payload of the given size.
+json_decode_<size>   Decoding a result with a payload of the given size.
+normalize_definition Normalizing a QueryTask definition as done by taskinfo().
+spawn_baseline       Spawning the stub engine directly with subprocess.
+execute              A full taskengine.execute call against the stub engine.
+execute_overhead     execute minus spawn_baseline: the per-call Python overhead.
+throughput_<n>       Jobs per second with n concurrent jobs.
+==================== ===========================================================
+
+Run the benchmarks and save the results::
+
+    python benchmarks/run.py --output results-1.0.9.json
+
+Compare two result files::
+
+    python benchmarks/run.py --compare results-1.0.9.json results-new.json
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from envipyengine import config
+from envipyengine.diagnostics import percentile
+from envipyengine import test
+from envipyengine.taskengine import taskengine
+from envipyengine.taskengine.task import normalize_definition
+from envipyengine.test import stubengine
+
+PAYLOAD_SIZES = OrderedDict([('1k', 1024),
+                             ('64k', 64 * 1024),
+                             ('1m', 1024 * 1024),
+                             ('16m', 16 * 1024 * 1024)])
+CONCURRENCY_LEVELS = (1, 2, 4, 8)
+
+
+def summarize(samples, unit='s'):
+    """Returns summary statistics for a list of timings."""
+    return OrderedDict([('unit', unit),
+                        ('samples', len(samples)),
+                        ('mean', sum(samples) / len(samples)),
+                        ('p50', percentile(samples, 0.50)),
+                        ('p95', percentile(samples, 0.95)),
+                        ('p99', percentile(samples, 0.99)),
+                        ('min', min(samples)),
+                        ('max', max(samples))])
+
+
+def timeit(func, samples):
+    """Returns a list of wall times of calling func."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_config(samples):
+    """Measures the config lookups done for every job."""
+    def resolve():
+        config.get('engine')
+        config.get('engine-args', default=None)
+        config.get_environment()
+    return summarize(timeit(resolve, samples))
+
+
+def bench_json(samples):
+    """Measures encoding jobs and decoding results of various sizes."""
+    results = OrderedDict()
+    for label, size in PAYLOAD_SIZES.items():
+        count = max(3, samples // (1 + size // (64 * 1024)))
+        job = {'taskName': 'SpectralIndex',
+               'inputParameters': {'INPUT_RASTER': {'url': 'x' * size,
+                                                    'factory': 'URLRaster'}}}
+        encoded = json.dumps(job, ensure_ascii=False).encode('utf-8')
+        results['json_encode_' + label] = summarize(timeit(
+            lambda: json.dumps(job, ensure_ascii=False).encode('utf-8'), count))
+        results['json_decode_' + label] = summarize(timeit(
+            lambda: json.loads(encoded.decode('utf-8'), object_pairs_hook=OrderedDict),
+            count))
+    return results
+
+
+def bench_normalize(samples):
+    """Measures normalizing a QueryTask definition."""
+    definition = stubengine.TASKS['SpectralIndex']
+    copies = [copy.deepcopy(definition) for _ in range(samples)]
+    timings = []
+    for task_def in copies:
+        start = time.perf_counter()
+        normalize_definition(task_def)
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def bench_execute(samples):
+    """Measures taskengine.execute against spawning the stub directly."""
+    job = {'taskName': 'Sleep', 'inputParameters': {'SECONDS': 0}}
+    encoded = json.dumps(job).encode('utf-8')
+
+    def spawn():
+        process = subprocess.Popen([test.stub_engine(), 'ENVI'],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        process.communicate(encoded)
+
+    baseline = timeit(spawn, samples)
+    execute = timeit(lambda: taskengine.execute(job, 'ENVI'), samples)
+    overhead = [max(0.0, value - base)
+                for value, base in zip(sorted(execute), sorted(baseline))]
+    return OrderedDict([('spawn_baseline', summarize(baseline)),
+                        ('execute', summarize(execute)),
+                        ('execute_overhead', summarize(overhead))])
+
+
+def bench_throughput(samples, delay):
+    """Measures jobs per second at increasing concurrency."""
+    job = {'taskName': 'Sleep', 'inputParameters': {'SECONDS': delay}}
+    results = OrderedDict()
+    for workers in CONCURRENCY_LEVELS:
+        count = max(workers, samples // 4) * workers
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: taskengine.execute(job, 'ENVI'), range(count)))
+            elapsed = time.perf_counter() - start
+        results['throughput_%d' % workers] = OrderedDict(
+            [('unit', 'jobs/s'), ('samples', count), ('mean', count / elapsed)])
+    return results
+
+
+def run(samples, delay, label=None):
+    """Runs all benchmarks and returns the results document."""
+    benchmarks = OrderedDict()
+    with test.stub_config():
+        benchmarks['config_resolution'] = bench_config(samples)
+        benchmarks.update(bench_json(samples))
+        benchmarks['normalize_definition'] = bench_normalize(samples)
+        benchmarks.update(bench_execute(samples))
+        benchmarks.update(bench_throughput(samples, delay))
+    return OrderedDict([('version', label or _version()),
+                        ('python', platform.python_version()),
+                        ('platform', platform.platform()),
+                        ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+                        ('samples', samples),
+                        ('benchmarks', benchmarks)])
+
+
+def compare(baseline_file, current_file):
+    """Prints the ratio of the mean of each benchmark between two result files."""
+    with open(baseline_file) as baseline_input:
+        baseline = json.load(baseline_input)
+    with open(current_file) as current_input:
+        current = json.load(current_input)
+    print('{0:24} {1:>14} {2:>14} {3:>8}'.format(
+        'benchmark', baseline['version'], current['version'], 'ratio'))
+    for name, result in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        old = baseline['benchmarks'][name]['mean']
+        new = result['mean']
+        print('{0:24} {1:14.6g} {2:14.6g} {3:8.2f}'.format(
+            name, old, new, new / old if old else float('nan')))
+
+
+def _version():
+    """Returns the installed envipyengine version, if known."""
+    try:
+        from importlib import metadata
+        return metadata.version('envipyengine')
+    except Exception:  # pylint: disable=broad-except
+        return 'unknown'
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Runs the envipyengine micro-benchmarks.')
+    parser.add_argument('-o', '--output', help='file to write the JSON results to')
+    parser.add_argument('-n', '--samples', type=int, default=50,
+                        help='number of samples per benchmark')
+    parser.add_argument('--delay', type=float, default=0.05,
+                        help='seconds each stub job takes in the throughput benchmark')
+    parser.add_argument('--label',
+                        help='version label for the results, defaults to the installed version')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run(args.samples, args.delay, args.label)
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(document + '\n')
+    else:
+        print(document)
+
+
+if __name__ == '__main__':
+    main()
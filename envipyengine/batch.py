@@ -0,0 +1,298 @@
+"""
+Runs batches of task engine jobs read as JSON lines.
+
+Every input line is a job object::
+
+    {"id": "scene-1", "task": "SpectralIndex", "parameters": {...}}
+
+``task`` is a task name or a task uri such as 'ENVI:SpectralIndex'.  The
+optional ``id`` defaults to the line number and ``cwd`` sets the working
+directory of the engine.  Jobs are read lazily and only a small window of
+them is in flight at any time, so batches of any size run in constant memory.
+
+One JSON line is written for each job as soon as it finishes::
+
+    {"id": "scene-1", "task": "ENVI:SpectralIndex", "status": "succeeded",
+     "duration": 4.2, "result": {...}}
+
+Failed jobs have the status 'failed' and an ``error`` instead of a result.
+With ``--resume`` the jobs that already succeeded in the output file are
+skipped, and new results are appended to it.
+
+:Example:
+
+    envipyengine-run jobs.jsonl -o results.jsonl --max-workers 4 --timeout 3600
+
+"""
+from __future__ import absolute_import
+
+import argparse
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED, FIRST_COMPLETED
+
+from .taskengine import threads as thread_budget
+from .taskengine.task import Task
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Progress(object):
+    """
+    Counts finished jobs and periodically reports them to a stream.
+
+    :param stream: The stream the reports are written to, or None to stay quiet.
+    :param interval: The minimum number of seconds between reports.
+    """
+
+    def __init__(self, stream=None, interval=5.0):
+        self.stream = stream
+        self.interval = interval
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.running = 0
+        self.start = time.time()
+        self._reported = self.start
+
+    @property
+    def done(self):
+        """
+        The number of jobs that finished in this run.
+        """
+        return self.succeeded + self.failed
+
+    def update(self, force=False):
+        """
+        Writes a report if the interval has passed since the last one.
+
+        :param force: Set to True to report regardless of the interval.
+        """
+        now = time.time()
+        if self.stream is None or (not force and now - self._reported < self.interval):
+            return
+        self._reported = now
+        elapsed = max(now - self.start, 1e-9)
+        self.stream.write(
+            '{0} done ({1} failed, {2} skipped), {3} running, {4:.2f} jobs/s\n'.format(
+                self.done, self.failed, self.skipped, self.running, self.done / elapsed))
+        self.stream.flush()
+
+
+def run(lines, output, max_workers=1, timeout=None, engine='ENVI', completed=None,
+        progress=None):
+    """
+    Runs the jobs read from an iterable of JSON lines and writes one JSON line
+    per job to output as they finish.
+
+    :param lines: An iterable of JSON job lines, e.g. an open file.
+    :param output: A text stream the results are written to.
+    :param max_workers: The maximum number of jobs run concurrently.
+    :param timeout: Optionally specify the number of seconds after which a job is killed.
+    :param engine: The engine of jobs whose task is not a task uri.
+    :param completed: Optionally specify a container of job ids to skip.
+    :param progress: Optionally specify a :class:`Progress` object to update.
+    :return: The :class:`Progress` object with the job counts.
+    """
+    progress = progress or Progress()
+    completed = completed or ()
+    window = max_workers * 2
+    threads = thread_budget.budget(max_workers)
+    pending = {}
+
+    def _drain(return_when):
+        finished, _ = wait(pending, return_when=return_when)
+        for future in finished:
+            _write(output, future.result(), progress)
+            del pending[future]
+        progress.running = len(pending)
+        progress.update()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                job_id, uri, parameters, cwd = _parse(line, line_number, engine)
+            except ValueError as error:
+                _write(output, _record(line_number, None, error=error), progress)
+                continue
+            if str(job_id) in completed:
+                progress.skipped += 1
+                continue
+            while len(pending) >= window:
+                _drain(FIRST_COMPLETED)
+            future = executor.submit(_execute, job_id, uri, parameters, cwd, timeout, threads)
+            pending[future] = job_id
+            progress.running = len(pending)
+    except BaseException:
+        # Jobs already running are finished and recorded, even on interrupt,
+        # so a resumed run does not repeat them.
+        for future in list(pending):
+            if future.cancel():
+                del pending[future]
+        raise
+    finally:
+        if pending:
+            _drain(ALL_COMPLETED)
+        executor.shutdown(wait=True)
+    progress.running = 0
+    return progress
+
+
+def completed_jobs(filename):
+    """
+    Returns the ids of the jobs that succeeded according to a results file.
+
+    :param filename: The path of a results file written by :func:`run`.
+    :return: A set of job ids as strings.
+    """
+    completed = set()
+    try:
+        with io.open(filename, encoding='utf-8') as results:
+            for line in results:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short when the previous run was killed
+                    continue
+                if isinstance(record, dict) and record.get('status') == SUCCEEDED:
+                    completed.add(str(record.get('id')))
+    except (IOError, OSError):
+        pass
+    return completed
+
+
+def _ends_with_newline(filename):
+    """
+    Returns False if a file does not end with a newline.  Empty files do.
+    """
+    with io.open(filename, 'rb') as results:
+        results.seek(0, io.SEEK_END)
+        if results.tell() == 0:
+            return True
+        results.seek(-1, io.SEEK_END)
+        return results.read(1) == b'\n'
+
+
+def _parse(line, line_number, engine):
+    """
+    Returns the id, task uri, parameters and working directory of a job line.
+    """
+    try:
+        job = json.loads(line)
+    except ValueError as error:
+        raise ValueError('Invalid job on line {0}: {1}'.format(line_number, error))
+    if not isinstance(job, dict) or 'task' not in job:
+        raise ValueError('Invalid job on line {0}: no task specified'.format(line_number))
+    task = str(job['task'])
+    uri = task if ':' in task else ':'.join((job.get('engine', engine), task))
+    return (job.get('id', line_number), uri, job.get('parameters') or {},
+            job.get('cwd'))
+
+
+def _execute(job_id, uri, parameters, cwd, timeout, threads=None):
+    """
+    Executes a job and returns its result record.  Errors are recorded
+    instead of raised.
+    """
+    start = time.time()
+    try:
+        result = Task(uri=uri).execute(parameters, cwd=cwd, timeout=timeout,
+                                       threads=threads)
+    except Exception as error:  # pylint: disable=broad-except
+        return _record(job_id, uri, error=error, duration=time.time() - start)
+    return _record(job_id, uri, result=result, duration=time.time() - start)
+
+
+def _record(job_id, uri, result=None, error=None, duration=None):
+    record = {'id': job_id, 'task': uri}
+    if error is None:
+        record['status'] = SUCCEEDED
+        record['result'] = result
+    else:
+        record['status'] = FAILED
+        record['error'] = str(error)
+        record['error_type'] = type(error).__name__
+    if duration is not None:
+        record['duration'] = round(duration, 6)
+    return record
+
+
+def _write(output, record, progress):
+    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    output.flush()
+    if record['status'] == SUCCEEDED:
+        progress.succeeded += 1
+    else:
+        progress.failed += 1
+
+
+def main(argv=None):
+    """
+    Entry point of the envipyengine-run command.
+
+    :return: 0 if all jobs succeeded, 1 if any failed.
+    """
+    parser = argparse.ArgumentParser(
+        description='Runs envipyengine jobs read as JSON lines and writes their '
+                    'results as JSON lines.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='the job file, defaults to standard input')
+    parser.add_argument('-o', '--output', default='-',
+                        help='the results file, defaults to standard output')
+    parser.add_argument('--max-workers', type=int, default=1,
+                        help='number of jobs run concurrently')
+    parser.add_argument('--timeout', type=float,
+                        help='seconds after which a job is killed')
+    parser.add_argument('--engine', default='ENVI',
+                        help='engine of jobs whose task is not a task uri')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip jobs that succeeded in the results file and append to it')
+    parser.add_argument('--progress-interval', type=float, default=5.0,
+                        help='seconds between progress reports')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not report progress')
+    args = parser.parse_args(argv)
+    if args.resume and args.output == '-':
+        parser.error('--resume requires an --output file')
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1')
+
+    completed = completed_jobs(args.output) if args.resume else None
+    progress = Progress(None if args.quiet else sys.stderr, args.progress_interval)
+
+    if args.input == '-':
+        lines = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    else:
+        lines = io.open(args.input, encoding='utf-8')
+    if args.output == '-':
+        output = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    else:
+        output = io.open(args.output, 'a' if args.resume else 'w', encoding='utf-8')
+        if args.resume and not _ends_with_newline(args.output):
+            # Terminate a line cut short when the previous run was killed
+            output.write('\n')
+
+    try:
+        run(lines, output, max_workers=args.max_workers, timeout=args.timeout,
+            engine=args.engine, completed=completed, progress=progress)
+    except KeyboardInterrupt:
+        progress.update(force=True)
+        return 130
+    finally:
+        output.flush()
+        if args.input != '-':
+            lines.close()
+        if args.output != '-':
+            output.close()
+    progress.update(force=True)
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+The catalog module indexes the task definitions of an engine for searching.
+
+A :class:`Catalog` holds the normalized definition of every task, as returned
+by ``Task.taskinfo()``, along with an inverted index over the task names,
+display names, description keywords and the parameter names, types and
+directions.  Queries are answered from the index with set intersections.
+
+``Engine.catalog`` builds the catalog of an engine once and persists it, with
+the definitions, in the ``catalog-dir`` directory.  The file is keyed on the
+engine executable, its arguments and environment, so installing another
+version or adding custom task directories builds a new catalog.
+
+:meth:`Catalog.from_task_files` builds a catalog without running the engine
+by parsing the .task files of the install's task directories and the custom
+task directories on the engine's IDL_PATH in parallel.  The definitions are
+normalized like those of ``Task.taskinfo()``.  Definitions that only exist
+inside the engine, such as those of tasks compiled into save files without a
+.task file, are not included.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> catalog = Engine('ENVI').catalog
+>>> catalog.find(input_type='ENVIRASTER', keyword='classification')
+['ClassActivation', 'ClassificationAggregation', ...]
+>>> catalog.find(input_type='ENVIRASTER', output_type='ENVIROI')
+['ClassificationToROI', ...]
+>>> catalog['SpectralIndex']['displayName']
+'Spectral Index'
+
+Build a catalog from the .task files only:
+
+>>> from envipyengine.catalog import Catalog
+>>> catalog = Catalog.from_task_files()
+>>> catalog.find(keyword='spectral index')
+['SpectralIndex', ...]
+
+"""
+from __future__ import absolute_import
+
+import bisect
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+
+_LOGGER = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 1
+_WORD = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+# Directories of the .task files of an install, relative to its root
+_INSTALL_TASK_DIRS = (os.path.join('resource', 'task'), os.path.join('resource', 'tasks'),
+                      'custom_code')
+_IDL_DEFAULT = '<IDL_DEFAULT>'
+_STOP_WORDS = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+                         'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this',
+                         'to', 'with'))
+
+
+class Catalog(object):
+    """
+    Searchable task definitions.
+
+    :param definitions: A dictionary of task names to normalized task
+                        definitions, as returned by ``Task.taskinfo()``.
+    :param index: Optionally specify a prebuilt index as returned by the
+                  ``index`` attribute.  It is built from the definitions if
+                  not given.
+    """
+
+    def __init__(self, definitions, index=None):
+        self.definitions = dict(definitions)
+        self.index = index if index is not None else _build_index(self.definitions)
+        self._sets = dict((field, dict((key, frozenset(names))
+                                       for key, names in entries.items()))
+                          for field, entries in self.index.items())
+        self._keywords = sorted(self._sets['keyword'])
+
+    @classmethod
+    def build(cls, engine, max_workers=4):
+        """
+        Builds the catalog of an engine by querying the definition of every task.
+
+        :param engine: An Engine object.
+        :param max_workers: The number of task definitions queried concurrently
+                            if the engine cannot query them all at once.
+        :return: A :class:`Catalog`.
+        """
+        return cls(engine.definitions(max_workers=max_workers))
+
+    @classmethod
+    def from_task_files(cls, directories=None, engine_name='ENVI', max_workers=8,
+                        profile=None, version=None):
+        """
+        Builds a catalog from .task files, without running the engine.  When a
+        task is defined in more than one directory, the first one wins, as in
+        the engine.  Files that cannot be parsed are skipped with a warning.
+
+        :param directories: Optionally specify a list of directories to scan.
+                            Defaults to the directories returned by
+                            :func:`task_directories`.
+        :param engine_name: The name of the engine whose task directories are
+                            scanned by default.
+        :param max_workers: The number of files parsed concurrently.
+        :param profile: Optionally specify the name of the engine profile
+                        whose task directories are scanned by default.
+        :param version: Optionally specify the version of the engine profiles.
+        :return: A :class:`Catalog`.
+        """
+        if directories is None:
+            directories = task_directories(engine_name, profile, version)
+        filenames = []
+        for directory in directories:
+            if os.path.isdir(directory):
+                filenames.extend(os.path.join(directory, filename)
+                                 for filename in sorted(os.listdir(directory))
+                                 if filename.lower().endswith('.task'))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(_read_task_file, filenames))
+        definitions = {}
+        for definition in parsed:
+            if definition is not None and definition['name'] not in definitions:
+                definitions[definition['name']] = definition
+        return cls(definitions)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads a catalog saved with :meth:`save`.
+
+        :param filename: The path of the catalog file.
+        :return: A :class:`Catalog`.
+        """
+        with io.open(filename, encoding='utf-8') as catalog_file:
+            document = json.load(catalog_file)
+        if document.get('version') != _FORMAT_VERSION:
+            raise ValueError('Unsupported catalog format: {0}'.format(document.get('version')))
+        return cls(document['definitions'], document['index'])
+
+    def save(self, filename):
+        """
+        Saves the definitions and the index to a file.  The file is replaced
+        atomically, so concurrent readers never see a partial catalog.
+
+        :param filename: The path of the catalog file.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        document = {'version': _FORMAT_VERSION,
+                    'definitions': self.definitions,
+                    'index': self.index}
+        handle, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with io.open(handle, 'w', encoding='utf-8') as catalog_file:
+                catalog_file.write(json.dumps(document, ensure_ascii=False))
+            os.replace(temp_name, filename)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+    def find(self, keyword=None, input_type=None, output_type=None, parameter=None):
+        """
+        Returns the names of the tasks matching all of the given criteria.
+
+        :param keyword: One or more words, each of which must prefix a word of
+                        the task name, display name or description.
+        :param input_type: A parameter type the task takes as input, e.g. 'ENVIRASTER'.
+        :param output_type: A parameter type the task outputs, e.g. 'ENVIROI'.
+        :param parameter: The name of a parameter of the task.
+        :return: A sorted list of task names.
+        """
+        matches = None
+        if input_type is not None:
+            matches = self._match(matches, 'input_type', input_type.upper())
+        if output_type is not None:
+            matches = self._match(matches, 'output_type', output_type.upper())
+        if parameter is not None:
+            matches = self._match(matches, 'parameter', parameter.upper())
+        if keyword is not None:
+            for word in _words(keyword):
+                names = set()
+                start = bisect.bisect_left(self._keywords, word)
+                for key in self._keywords[start:]:
+                    if not key.startswith(word):
+                        break
+                    names.update(self._sets['keyword'][key])
+                matches = names if matches is None else matches & names
+        if matches is None:
+            matches = self.definitions
+        return sorted(matches)
+
+    @property
+    def names(self):
+        """
+        The sorted names of all tasks in the catalog.
+        """
+        return sorted(self.definitions)
+
+    def __getitem__(self, name):
+        return self.definitions[name]
+
+    def __contains__(self, name):
+        return name in self.definitions
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def __getstate__(self):
+        # The lookup structures are rebuilt from the index when unpickled
+        return {'definitions': self.definitions, 'index': self.index}
+
+    def __setstate__(self, state):
+        self.__init__(state['definitions'], state['index'])
+
+    def _match(self, matches, field, key):
+        names = self._sets[field].get(key, frozenset())
+        return set(names) if matches is None else matches & names
+
+
+def load_or_build(engine, filename=None, profile=None, version=None):
+    """
+    Returns the catalog of an engine, loading it from the catalog directory
+    or building and saving it there.
+
+    :param engine: An Engine object.
+    :param filename: Optionally specify the catalog file.  Defaults to a file
+                     in the ``catalog-dir`` directory keyed on the engine
+                     installation.
+    :param profile: The name of the engine profile the engine runs on, if any.
+    :param version: The version of the engine profiles the engine runs on, if any.
+    :return: A :class:`Catalog`.
+    """
+    filename = filename or cache_file(engine.name, profile, version)
+    if os.path.isfile(filename):
+        try:
+            return Catalog.load(filename)
+        except (ValueError, KeyError, IOError, OSError) as error:
+            _LOGGER.warning('Rebuilding unreadable catalog %s: %s', filename, error)
+    catalog = Catalog.build(engine)
+    try:
+        catalog.save(filename)
+    except (IOError, OSError) as error:
+        _LOGGER.warning('Cannot save catalog %s: %s', filename, error)
+    return catalog
+
+
+def cache_file(engine_name, profile=None, version=None):
+    """
+    Returns the path of the persisted catalog of an engine installation.
+    The file is keyed on the executable, arguments and environment of the
+    engine profile the engine's jobs run on.
+
+    :param engine_name: The name of the engine, e.g. 'ENVI'.
+    :param profile: Optionally specify the name of the engine profile.
+    :param version: Optionally specify the version of the engine profiles.
+    """
+    from .taskengine import taskengine  # pylint: disable=import-outside-toplevel
+    selected, args, _ = taskengine.resolve_engine(engine_name, profile, version)
+    environment = config.get_environment()
+    if selected is not None:
+        environment.update(selected.environment)
+    try:
+        modified = os.path.getmtime(args[0])
+    except OSError:
+        modified = None
+    fingerprint = json.dumps([args, sorted(environment.items()), modified])
+    directory = config.get('catalog-dir', default=None) or \
+        os.path.join(os.path.dirname(config._USER_CONFIG_FILE), 'catalog')
+    return os.path.join(directory, '{0}-{1}.json'.format(
+        engine_name, hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]))
+
+
+def task_directories(engine_name='ENVI', profile=None, version=None):
+    """
+    Returns the directories of the .task files seen by an engine, in the
+    order the engine searches them: the directories on the IDL_PATH of the
+    engine, with the task directories of the install in place of
+    ``<IDL_DEFAULT>``.  Directories prefixed with '+'
+    are expanded to all of their subdirectories.
+
+    :param engine_name: The name of the engine, e.g. 'ENVI'.
+    :param profile: Optionally specify the name of the engine profile.
+    :param version: Optionally specify the version of the engine profiles.
+    :return: A list of existing directories.
+    """
+    from .taskengine import taskengine  # pylint: disable=import-outside-toplevel
+    _, args, environment = taskengine.resolve_engine(engine_name, profile, version)
+    install = install_task_dirs(args[0])
+    idl_path = (environment or os.environ).get('IDL_PATH') or _IDL_DEFAULT
+    entries = idl_path.split(os.pathsep)
+    if _IDL_DEFAULT not in entries:
+        entries.append(_IDL_DEFAULT)
+
+    directories = []
+    for entry in entries:
+        if entry == _IDL_DEFAULT:
+            directories.extend(install)
+        elif entry.startswith('+'):
+            for directory, subdirectories, _ in os.walk(os.path.expanduser(entry[1:])):
+                subdirectories.sort()
+                directories.append(directory)
+        elif entry:
+            directories.append(os.path.expanduser(entry))
+    unique = []
+    for directory in directories:
+        if os.path.isdir(directory) and directory not in unique:
+            unique.append(directory)
+    return unique
+
+
+def install_task_dirs(executable):
+    """
+    Returns the directories of the .task files of the install containing a
+    task engine executable, which are found below the ancestors of the
+    executable's directory.
+
+    :param executable: The path of the task engine executable.
+    :return: A list of existing directories.
+    """
+    directories = []
+    parent = os.path.dirname(os.path.realpath(executable))
+    for _ in range(4):
+        for relative in _INSTALL_TASK_DIRS:
+            directory = os.path.join(parent, relative)
+            if os.path.isdir(directory):
+                directories.append(directory)
+        parent = os.path.dirname(parent)
+    return directories
+
+
+def _read_task_file(filename):
+    """
+    Returns the normalized definition of a .task file, or None if it cannot be read.
+    """
+    from .taskengine import task  # pylint: disable=import-outside-toplevel
+    try:
+        definition = task.read_definition(filename)
+    except (ValueError, KeyError, TypeError, AttributeError, IOError, OSError) as error:
+        _LOGGER.warning('Skipping unreadable task file %s: %s', filename, error)
+        return None
+    return None if definition is None else task.normalize_definition(definition)
+
+
+def _words(text):
+    """
+    Returns the lower case words of a text, splitting camel case names.
+    """
+    return [word.lower() for word in _WORD.findall(str(text))]
+
+
+def _build_index(definitions):
+    """
+    Returns the inverted index of a set of definitions as a dictionary of
+    fields to dictionaries of keys to sorted lists of task names.
+    """
+    index = dict((field, {}) for field in ('keyword', 'parameter', 'input_type', 'output_type'))
+
+    def _add(field, key, name):
+        index[field].setdefault(key, set()).add(name)
+
+    for name, definition in definitions.items():
+        text = ' '.join((name, definition.get('displayName', ''),
+                         definition.get('description', '')))
+        for word in _words(text):
+            if word not in _STOP_WORDS:
+                _add('keyword', word, name)
+        _add('keyword', name.lower(), name)
+        for parameter in definition.get('parameters', []):
+            _add('parameter', parameter['name'].upper(), name)
+            field = 'output_type' if parameter.get('direction') == 'output' else 'input_type'
+            _add(field, parameter.get('type', '').upper(), name)
+
+    return dict((field, dict((key, sorted(names)) for key, names in entries.items()))
+                for field, entries in index.items())
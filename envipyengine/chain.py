@@ -0,0 +1,173 @@
+"""
+The chain module runs a linear chain of tasks as a single engine invocation.
+
+A :class:`Chain` is a sequence of steps, each a task and its input
+parameters.  As in a :class:`envipyengine.pipeline.Pipeline`, input parameter
+values may reference the output parameters of earlier steps with an
+:class:`envipyengine.pipeline.Output` object.  Unlike a pipeline, which runs
+each node in its own engine process and passes intermediate results through
+files, a chain is sent to the bundled ChainRunner task and runs in one engine
+process.  The outputs of intermediate steps are passed on as in-memory ENVI
+objects, their unspecified output URIs are set to '!' so they are never
+written to disk, and only the outputs of the last step are saved.
+
+If the engine does not know the ChainRunner task, the steps are executed one
+after the other with ``Task.execute`` instead, sharing the timeout of the
+chain.  Other failures of the chain run, such as a resource limit, are raised
+without running the steps again.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> from envipyengine.chain import Chain
+>>> envi_engine = Engine('ENVI')
+>>> chain = Chain(envi_engine)
+>>> calibrate = chain.add('calibrate', envi_engine.task('RadiometricCalibration'),
+                          dict(INPUT_RASTER=input_raster))
+>>> index = chain.add('index', envi_engine.task('SpectralIndex'),
+                      dict(INPUT_RASTER=calibrate.output('OUTPUT_RASTER'),
+                           INDEX='Normalized Difference Vegetation Index'))
+>>> result = chain.execute()
+>>> result['outputParameters']['OUTPUT_RASTER']
+
+If a step fails, a :class:`envipyengine.error.PipelineExecutionError` is raised
+with the error of the step in ``errors`` and the later steps in ``skipped``.
+
+"""
+from __future__ import absolute_import
+
+import logging
+import time
+
+from .error import PipelineError, PipelineExecutionError
+from .error import TaskEngineExecutionError, TaskEngineTimeoutError
+from .pipeline import Node, Output, _find_references, _resolve_references
+from .taskengine import taskengine
+from .taskengine.taskengine import TaskResult
+
+_LOGGER = logging.getLogger(__name__)
+
+RUNNER_TASK = 'ChainRunner'
+
+
+class Chain(object):
+    """
+    A linear chain of tasks of one engine.
+
+    :param engine: The Engine object running the chain.  Its working
+                   directory, profile and isolation settings apply to the
+                   whole chain.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._steps = []
+
+    def add(self, name, task, parameters=None):
+        """
+        Appends a step to the chain.
+
+        :param name: The unique name of the step.
+        :param task: The ENVI Py Engine Task object to execute.
+        :param parameters: A dictionary of input parameters.  Values may
+                           contain :class:`envipyengine.pipeline.Output`
+                           references to earlier steps.
+        :return: The new :class:`envipyengine.pipeline.Node` object.
+        """
+        names = [step.name for step in self._steps]
+        if name in names:
+            raise PipelineError("Step '{0}' already exists".format(name))
+        for reference in _find_references(parameters or {}):
+            if reference.node not in names:
+                raise PipelineError("Step '{0}' references unknown step '{1}'".format(
+                    name, reference.node))
+        step = Node(name, task, parameters)
+        self._steps.append(step)
+        return step
+
+    @property
+    def steps(self):
+        """
+        A list of the steps in the order they are executed.
+        """
+        return list(self._steps)
+
+    def execute(self, cwd=None, timeout=None):
+        """
+        Executes the chain in one engine run.
+
+        :param cwd: Optionally specify the current working directory the engine
+                    will run in.
+        :param timeout: Optionally specify the number of seconds after which the
+                        engine is killed and a TaskEngineTimeoutError is raised.
+        :return: A dictionary containing the output of the last step.
+        """
+        if not self._steps:
+            raise PipelineError('Chain has no steps')
+        steps = [{'NAME': step.name,
+                  'TASK_NAME': _task_name(step.task),
+                  'INPUT_PARAMETERS': _encode_references(step.parameters)}
+                 for step in self._steps]
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            result = self.engine.task(RUNNER_TASK).execute({'STEPS': steps}, cwd=cwd,
+                                                           timeout=timeout)
+        except TaskEngineExecutionError as error:
+            # Only an engine without ChainRunner runs the steps one by one, a
+            # chain that failed as a whole is not run again
+            if not taskengine.task_not_found(error, RUNNER_TASK):
+                raise
+            _LOGGER.debug('%s is not available, running the steps one by one', RUNNER_TASK)
+            return self._execute_steps(cwd, deadline)
+
+        outputs = result['outputParameters']
+        if outputs.get('FAILED_STEP'):
+            raise self._failed(outputs['FAILED_STEP'],
+                               TaskEngineExecutionError(outputs.get('ERROR')), {})
+        fused = TaskResult(outputParameters=outputs['OUTPUT_PARAMETERS'])
+        fused.resources = result.resources
+        return fused
+
+    def _execute_steps(self, cwd, deadline):
+        """
+        Executes each step in its own engine run, sharing the timeout of the chain.
+        """
+        results = {}
+        for step in self._steps:
+            parameters = _resolve_references(step.parameters, results)
+            try:
+                results[step.name] = step.task.execute(
+                    parameters, cwd=cwd, timeout=taskengine.remaining(deadline))
+            except TaskEngineTimeoutError:
+                raise
+            except TaskEngineExecutionError as error:
+                raise self._failed(step.name, error, results)
+        return results[self._steps[-1].name]
+
+    def _failed(self, name, error, results):
+        names = [step.name for step in self._steps]
+        return PipelineExecutionError(
+            "Chain step '{0}' failed: {1}".format(name, error),
+            errors={name: error}, results=results,
+            skipped=names[names.index(name) + 1:])
+
+
+def _task_name(task):
+    """
+    Returns the task name from the URI of a task, without querying the engine.
+    """
+    return task.uri.split(':', 1)[-1]
+
+
+def _encode_references(value):
+    """
+    Returns a copy of a parameter value with all Output references replaced
+    by the reference objects understood by ChainRunner.
+    """
+    if isinstance(value, Output):
+        return {'REFERENCE': {'STEP': value.node, 'PARAMETER': value.parameter}}
+    elif isinstance(value, dict):
+        return dict((key, _encode_references(item)) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [_encode_references(item) for item in value]
+    return value
@@ -10,6 +10,70 @@ engine               string     The full path to the engine executable. Example:
                                 "C:\\\\Program Files\\\\Harris\\\\ENVI54\\\\IDL86\\\\bin\\\\bin.x86_64\\\\taskengine.exe"
 engine-args          string     Any additional command line arguments that will be
                                 passed to the taskengine executable.
+scratch-dir          string     Directory used for temporary task outputs assigned
+                                by the scratch manager, ideally on a fast local
+                                filesystem such as tmpfs or NVMe.
+scratch-quota        string     Maximum size the scratch manager may hold in the
+                                scratch directory, e.g. '8G'.  Soft limit.
+scratch-keep         boolean    Set to true to keep scratch files for debugging
+                                instead of deleting them once they are released.
+metrics-file         string     File the metrics module writes Prometheus text
+                                exposition format metrics to.
+rss-sample-interval  float      Seconds between samples of the memory use of
+                                running engine processes. Sampling is off if unset.
+scheduler-memory     string     Memory budget of the scheduler, e.g. '64G'.
+scheduler-cpus       integer    CPU core budget of the scheduler. Defaults to the
+                                number of CPU cores.
+scheduler-license-   integer    Number of ENVI license seats the scheduler may
+seats                           use at once.
+queue-spool          string     Path of the SQLite spool file used by the job
+                                queue and the envipyengine-worker command.
+workdir-isolation    boolean    Set to true to run each job in its own working
+                                directory. Output files are moved to the job's
+                                cwd afterwards.
+workdir-root         string     Directory the per-job working directories are
+                                created in. Defaults to scratch-dir.
+workdir-keep         string     When to keep per-job working directories:
+                                'never' (default), 'failed' or 'always'.
+catalog-dir          string     Directory the task catalogs of Engine.catalog
+                                are saved in. Defaults to a 'catalog' directory
+                                next to the user config file.
+coalesce             boolean    Set to true to share one engine run between
+                                identical concurrent jobs.
+routing              string     How jobs are routed across engine profiles:
+                                'round-robin' (default), 'least-loaded' or
+                                'pinned'.
+profile-failures     integer    Consecutive spawn failures after which an engine
+                                profile is taken out of rotation. Default 3.
+profile-cooldown     float      Seconds before an unhealthy engine profile is
+                                tried again. Default 60.
+cpu-affinity         string     CPU cores the engine processes run on, e.g.
+                                '0-15', or 'auto' to give each job a partition
+                                of the cores in turn.
+cpu-partition-size   integer    Number of cores per partition of the 'auto' CPU
+                                affinity. Defaults to the NUMA nodes.
+nice                 integer    Nice value of the engine processes.
+ionice               string     I/O priority of the engine processes: 'idle',
+                                'best-effort:<0-7>' or 'realtime:<0-7>'.
+limit-memory         string     Memory limit of each engine process, e.g. '8G'.
+limit-cpu-seconds    integer    CPU time limit of each engine process in seconds.
+limit-open-files     integer    Maximum number of files each engine process may
+                                have open.
+limit-backend        string     How the memory limit is enforced: 'rlimit'
+                                (default), 'cgroup' or 'auto'.
+cgroup-root          string     Delegated cgroup v2 directory the per-job cgroups
+                                of the 'cgroup' limit backend are created in.
+history              boolean    Set to true to record the runtime and memory of
+                                every job for Task.estimate.
+history-file         string     Path of the SQLite database of the job history.
+                                Defaults to 'history.sqlite' next to the user
+                                config file.
+bundled-tasks        boolean    Set to false to leave the custom tasks shipped
+                                with envipyengine, such as QueryTasks, off the
+                                IDL_PATH of the engine. Default true. Only
+                                jobs of these tasks run with IDL_PATH set,
+                                which replaces an IDL_PATH set in the IDL
+                                preferences for them.
 Environment Variable string     Any valid environment variable and value pairs.
 Names                           All name/value pairs specified in this
                                 section will be interpreted as environment variables
@@ -34,6 +98,24 @@ Specify an environment variable to be used when running the task engine:
  >>> import envipyengine
  >>> envipyengine.config.set_environment(dict('IDL_PATH'=<path-to-idl-code>)
 
+Define two engine profiles, e.g. for a local and an NFS installation, and
+spread jobs across them:
+ >>> import envipyengine
+ >>> envipyengine.config.set_profile('local', {'engine': <local-executable>,
+ ...                                           'version': '5.6'})
+ >>> envipyengine.config.set_profile('nfs', {'engine': <nfs-executable>,
+ ...                                         'version': '5.6',
+ ...                                         'tasks': 'BuildMosaicRaster'},
+ ...                                 environment={'IDL_PATH': <path-to-idl-code>})
+ >>> envipyengine.config.set('routing', 'least-loaded')
+
+Profile properties are 'engine' and 'engine-args', which default to the main
+settings, 'version', 'tasks', a comma separated list of the task names
+pinned to the profile by the 'pinned' routing policy, and 'cpu-affinity',
+'nice', 'ionice', 'limit-memory', 'limit-cpu-seconds' and 'limit-open-files',
+which override the main settings.  See
+:mod:`envipyengine.taskengine.routing` for details.
+
 The locations of the configuration files are:
 
 ============================== ===================================================================
@@ -51,6 +133,7 @@ Linux System Configuration     /var/lib/envipyengine/settings.cfg
 """
 import os
 import sys
+from collections import OrderedDict
 
 import ctypes
 
@@ -73,6 +156,9 @@ _APP_DIRNAME = 'envipyengine'
 _CONFIG_FILENAME = 'settings.cfg'
 _MAIN_SECTION_NAME = 'envipyengine'
 _ENVIRONMENT_SECTION_NAME = 'engine-environment'
+_PROFILE_SECTION_PREFIX = 'profile:'
+_PROFILE_ENVIRONMENT_SUFFIX = ':environment'
+_NO_DEFAULT = object()
 
 
 def _user_config_file():
@@ -235,7 +321,84 @@ def remove_environment(environment_var_name, system=False):
     _write_config(config, config_filename)
 
 
-def get(property_name):
+def get_profiles():
+    """
+    Return all engine profiles from the config files.  A profile is stored in a
+    section named 'profile:<name>', with its environment overrides in a section
+    named 'profile:<name>:environment'.  Values stored in the user configuration
+    file take precedence over values stored in the system configuration file.
+
+    :return: An ordered dictionary of profile names to dictionaries of the
+             profile properties.  The 'environment' key of each profile holds
+             a dictionary of its environment settings.
+    """
+    profiles = OrderedDict()
+    for cfg_file in (_SYSTEM_CONFIG_FILE, _USER_CONFIG_FILE):
+        config = _read_config(cfg_file)
+        for section in config.sections():
+            if not section.startswith(_PROFILE_SECTION_PREFIX):
+                continue
+            name = section[len(_PROFILE_SECTION_PREFIX):]
+            is_environment = name.endswith(_PROFILE_ENVIRONMENT_SUFFIX)
+            if is_environment:
+                name = name[:-len(_PROFILE_ENVIRONMENT_SUFFIX)]
+            profile = profiles.setdefault(name, {'environment': {}})
+            if is_environment:
+                profile['environment'].update(config.items(section))
+            else:
+                profile.update(config.items(section))
+    return profiles
+
+
+def set_profile(name, properties, environment=None, system=False):
+    """
+    Set the properties of an engine profile in the config file.
+
+    :param name: The name of the profile.
+    :param properties: A dictionary of profile properties, e.g. 'engine',
+                       'engine-args', 'version' and 'tasks'.
+    :param environment: Optionally specify a dictionary of environment
+                        settings for the profile.
+    :keyword system: Set to True to modify the system configuration file.
+                     If not set, the user config file will be modified.
+    """
+    config_filename = \
+        _SYSTEM_CONFIG_FILE if system is True else _USER_CONFIG_FILE
+    config = _read_config(config_filename)
+
+    section = _PROFILE_SECTION_PREFIX + name
+    if not config.has_section(section):
+        config.add_section(section)
+    for key in properties.keys():
+        config.set(section, key, str(properties[key]))
+    if environment:
+        section += _PROFILE_ENVIRONMENT_SUFFIX
+        if not config.has_section(section):
+            config.add_section(section)
+        for key in environment.keys():
+            config.set(section, key, environment[key])
+    _write_config(config, config_filename)
+
+
+def remove_profile(name, system=False):
+    """
+    Remove an engine profile from the appropriate config file.
+
+    :param name: The name of the profile to remove.
+    :keyword system: Set to True to modify the system configuration file.
+                     If not set, the user config file will be modified.
+    """
+    config_filename = \
+        _SYSTEM_CONFIG_FILE if system is True else _USER_CONFIG_FILE
+    config = _read_config(config_filename)
+
+    section = _PROFILE_SECTION_PREFIX + name
+    config.remove_section(section)
+    config.remove_section(section + _PROFILE_ENVIRONMENT_SUFFIX)
+    _write_config(config, config_filename)
+
+
+def get(property_name, default=_NO_DEFAULT):
     """
     Returns the value of the specified configuration property.
     Property values stored in the user configuration file take
@@ -243,6 +406,8 @@ def get(property_name):
     file.
 
     :param property_name: The name of the property to retrieve.
+    :keyword default: The value to return if the property is not set.
+                      If not specified, a NoConfigOptionError is raised.
     :return: The value of the property.
     """
     config = _read_config(_USER_CONFIG_FILE)
@@ -256,11 +421,28 @@ def get(property_name):
             config = _read_config(_SYSTEM_CONFIG_FILE)
             property_value = config.get(section, property_name)
         except (NoOptionError, NoSectionError) as error:
+            if default is not _NO_DEFAULT:
+                return default
             raise NoConfigOptionError(error)
 
     return property_value
 
 
+def get_boolean(property_name, default=False):
+    """
+    Returns the value of the specified configuration property as a boolean.
+    The values '1', 'yes', 'true' and 'on' are interpreted as True.
+
+    :param property_name: The name of the property to retrieve.
+    :keyword default: The value to return if the property is not set.
+    :return: The boolean value of the property.
+    """
+    value = get(property_name, default=None)
+    if value is None:
+        return default
+    return str(value).strip().lower() in ('1', 'yes', 'true', 'on')
+
+
 def set(property_name, value, system=False):
     """
     Sets the configuration property to the specified value.
@@ -0,0 +1,203 @@
+"""
+The diagnostics module validates the engine configuration of a node and
+measures its task engine latency.
+
+It backs the ``doctor`` and ``bench`` sub-commands of ``envipyengineconfig.py``,
+which should be run on every new node image::
+
+    envipyengineconfig.py doctor
+    envipyengineconfig.py bench --samples 50 --max-concurrency 16
+
+:func:`bench` measures:
+
+==================== ===========================================================
+Measurement          Description
+==================== ===========================================================
+cold_spawn           Starting the engine executable until it exits, without a
+                     job.
+query_task_catalog   A QueryTaskCatalog round trip, i.e. ``Engine.tasks()``.
+query_task           A QueryTask round trip, i.e. ``Task.taskinfo()``.
+concurrency_<n>      QueryTask latency and throughput with n concurrent jobs.
+==================== ===========================================================
+
+The concurrency with the highest throughput is a good starting point for the
+number of worker slots on the node.
+"""
+from __future__ import absolute_import
+
+import os
+import subprocess
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .taskengine import routing, taskengine
+
+Check = namedtuple('Check', ['name', 'ok', 'message'])
+"""The result of a doctor check: its name, whether it passed and a message."""
+
+
+def doctor(engine='ENVI', timeout=120):
+    """
+    Validates the engine executable, arguments and environment of every
+    configured engine profile, resolved as they are for jobs, and runs a
+    QueryTaskCatalog job on each profile.  Without profiles, the main config
+    options are checked.
+
+    :param engine: The engine to check, e.g. 'ENVI' or 'IDL'.
+    :param timeout: The number of seconds the engine may take to list its tasks.
+    :return: A list of :class:`Check` results.  The checks of a profile are
+             named after it, e.g. 'engine[envi56]'.  Checks of a profile after
+             a failed prerequisite are not run.
+    """
+    # pylint: disable=protected-access
+    checks = []
+
+    config_files = [filename for filename in (config._USER_CONFIG_FILE,
+                                              config._SYSTEM_CONFIG_FILE)
+                    if os.path.isfile(filename)]
+    checks.append(Check('config', True, 'Read from ' + ', '.join(config_files)
+                        if config_files else 'No config files found'))
+
+    for profile in routing.ROUTER.profiles() or [None]:
+        checks.extend(_doctor_profile(engine, profile, timeout))
+    return checks
+
+
+def _doctor_profile(engine, profile, timeout):
+    """
+    Returns the doctor checks of one engine profile, or of the main config
+    options if profile is None.
+    """
+    # pylint: disable=too-many-return-statements
+    checks = []
+    name = None if profile is None else profile.name
+    suffix = '' if profile is None else '[{0}]'.format(name)
+
+    executable = config.get('engine', default=None) if profile is None else profile.engine
+    if not executable:
+        checks.append(Check('engine' + suffix, False, "The 'engine' config option is not set"))
+        return checks
+    if not os.path.isfile(executable):
+        checks.append(Check('engine' + suffix, False, 'Not found: ' + executable))
+        return checks
+    if not os.access(executable, os.X_OK):
+        checks.append(Check('engine' + suffix, False, 'Not executable: ' + executable))
+        return checks
+    checks.append(Check('engine' + suffix, True, executable))
+
+    try:
+        _, args, _ = taskengine.resolve_engine(engine, profile=name)
+    except ValueError as error:
+        checks.append(Check('engine-args' + suffix, False,
+                            'Cannot be parsed: {0}'.format(error)))
+        return checks
+    checks.append(Check('engine-args' + suffix, True, ' '.join(args[2:]) or 'None'))
+
+    environment = config.get_environment()
+    if profile is not None:
+        environment.update(profile.environment)
+    invalid = sorted(variable for variable in environment if not variable or '=' in variable)
+    if invalid:
+        checks.append(Check('environment' + suffix, False,
+                            'Invalid variable names: ' + ', '.join(invalid)))
+        return checks
+    checks.append(Check('environment' + suffix, True,
+                        ', '.join(sorted(environment)) if environment else 'No overrides'))
+
+    start = time.perf_counter()
+    try:
+        output = taskengine.execute({'taskName': 'QueryTaskCatalog'}, engine,
+                                    timeout=timeout, profile=name, coalesce=False)
+    except Exception as error:  # pylint: disable=broad-except
+        checks.append(Check('tasks' + suffix, False,
+                            '{0}: {1}'.format(type(error).__name__, error)))
+        return checks
+    checks.append(Check('tasks' + suffix, True, '{0} {1} tasks in {2:.2f}s'.format(
+        len(output['outputParameters']['TASKS']), engine, time.perf_counter() - start)))
+    return checks
+
+
+def bench(engine='ENVI', samples=20, max_concurrency=4, task_name=None):
+    """
+    Measures the task engine latency and throughput of the node.
+
+    :param engine: The engine to measure, e.g. 'ENVI' or 'IDL'.
+    :param samples: The number of jobs timed for each measurement.
+    :param max_concurrency: The highest number of concurrent jobs measured.
+                            Every level from 1 to max_concurrency is measured.
+    :param task_name: The task queried by QueryTask.  Defaults to the first
+                      task in the catalog.
+    :return: An ordered dictionary of measurement names to summaries with the
+             p50, p95 and p99 latency in seconds and the throughput in jobs
+             per second.  The 'best_concurrency' key holds the concurrency
+             level with the highest throughput.
+    """
+    results = OrderedDict()
+    _, args, environment = taskengine.resolve_engine(engine)
+
+    def _spawn():
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=environment)
+        process.communicate(b'')
+
+    catalog = {'taskName': 'QueryTaskCatalog'}
+    tasks = taskengine.execute(catalog, engine)['outputParameters']['TASKS']
+    query = {'taskName': 'QueryTask',
+             'inputParameters': {'Task_Name': task_name or tasks[0]}}
+
+    results['cold_spawn'] = _timed(_spawn, samples, 1)
+    # Jobs are not coalesced, so every sample measures its own engine run
+    results['query_task_catalog'] = _timed(
+        lambda: taskengine.execute(catalog, engine, coalesce=False), samples, 1)
+    results['query_task'] = _timed(
+        lambda: taskengine.execute(query, engine, coalesce=False), samples, 1)
+    for workers in range(1, max_concurrency + 1):
+        results['concurrency_{0}'.format(workers)] = _timed(
+            lambda: taskengine.execute(query, engine, coalesce=False),
+            max(samples, workers), workers)
+    levels = range(1, max_concurrency + 1)
+    results['best_concurrency'] = max(
+        levels, key=lambda level: results['concurrency_{0}'.format(level)]['throughput'])
+    return results
+
+
+def percentile(values, fraction):
+    """
+    Returns the given percentile of a list of values, interpolating between
+    the closest ranks.
+
+    :param values: A list of numbers.
+    :param fraction: The percentile as a fraction between 0.0 and 1.0.
+    :return: The percentile, or None if there are no values.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = (len(ordered) - 1) * fraction
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+def _timed(func, count, workers):
+    """
+    Calls func count times from a number of threads and summarizes the
+    latencies and the throughput.
+    """
+    def _call(_):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(_call, range(count)))
+        elapsed = time.perf_counter() - start
+    return OrderedDict([('samples', count),
+                        ('concurrency', workers),
+                        ('p50', percentile(latencies, 0.50)),
+                        ('p95', percentile(latencies, 0.95)),
+                        ('p99', percentile(latencies, 0.99)),
+                        ('throughput', count / elapsed)])
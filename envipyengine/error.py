@@ -48,4 +48,152 @@ class NoConfigOptionError(Exception):
     envipyengine.error.NoConfigOptionError: No option 'foo' in section: 'envipyengine'
 
     """
-    pass
\ No newline at end of file
+    pass
+
+
+class PipelineError(Exception):
+    """Exception is raised when a pipeline is defined incorrectly.
+
+    :Example:
+
+    >>> from envipyengine.pipeline import Pipeline
+    >>> pipeline = Pipeline()
+    >>> pipeline.add('index', task, dict(INPUT_RASTER=Output('missing', 'OUTPUT_RASTER')))
+    >>> pipeline.run()
+    # traceback information
+    envipyengine.error.PipelineError: Node 'index' references unknown node 'missing'
+
+    """
+    pass
+
+
+class PipelineExecutionError(PipelineError):
+    """Exception is raised when one or more pipeline nodes fail to execute.
+
+    The ``errors`` attribute maps the failed node names to their exceptions
+    and the ``results`` attribute holds the results of the nodes that completed.
+    Nodes that depend on a failed node are listed in ``skipped``.
+
+    """
+    def __init__(self, message, errors=None, results=None, skipped=None):
+        super(PipelineExecutionError, self).__init__(message)
+        self.errors = errors or {}
+        self.results = results or {}
+        self.skipped = skipped or []
+
+
+class ScratchQuotaExceededError(Exception):
+    """Exception is raised when a scratch space allocation would exceed its quota.
+
+    :Example:
+
+    >>> from envipyengine.scratch import ScratchSpace
+    >>> scratch = ScratchSpace('/dev/shm/envi', quota=1024)
+    >>> scratch.allocate('job', 'OUTPUT_RASTER_URI')
+    # traceback information
+    envipyengine.error.ScratchQuotaExceededError: Scratch space quota of 1024 bytes exceeded
+
+    """
+    pass
+
+
+class SchedulerError(Exception):
+    """Exception is raised when a job can never be admitted by a scheduler.
+
+    :Example:
+
+    >>> from envipyengine.scheduler import Scheduler, Cost
+    >>> scheduler = Scheduler(memory='16G')
+    >>> scheduler.execute(task, parameters, cost=Cost(memory='32G'))
+    # traceback information
+    envipyengine.error.SchedulerError: Job cost exceeds the scheduler budget
+
+    """
+    pass
+
+
+class JobFailedError(Exception):
+    """Exception is raised when retrieving the result of a queued job that failed.
+
+    :Example:
+
+    >>> from envipyengine.queue import JobQueue
+    >>> queue = JobQueue()
+    >>> job_id = queue.submit('ENVI:Foo', {})
+    >>> queue.result(job_id)
+    # traceback information
+    envipyengine.error.JobFailedError: ENVITASK: No task matches: foo
+
+    """
+    pass
+
+
+class TaskEngineTimeoutError(TaskEngineExecutionError):
+    """Exception is raised when the Task Engine does not finish a job within its timeout.
+    The engine process is killed before the exception is raised.
+
+    :Example:
+
+    >>> from envipyengine import Engine
+    >>> task = Engine('ENVI').task('SpectralIndex')
+    >>> task.execute(parameters, timeout=1)
+    # traceback information
+    envipyengine.error.TaskEngineTimeoutError: Task Engine did not finish within 1 seconds
+
+    """
+    pass
+
+
+class TaskEngineLimitError(TaskEngineExecutionError):
+    """Exception is raised when the Task Engine fails because it exceeded one of its
+    resource limits.  The ``limit`` attribute holds the name of the limit,
+    'memory', 'cpu_seconds' or 'open_files', and the ``value`` attribute its value.
+
+    :Example:
+
+    >>> from envipyengine import Engine
+    >>> task = Engine('ENVI').task('SpectralIndex')
+    >>> task.execute(parameters, limits={'memory': '8G'})
+    # traceback information
+    envipyengine.error.TaskEngineLimitError: Task Engine exceeded its memory limit of 8589934592
+
+    """
+    def __init__(self, message, limit=None, value=None):
+        super(TaskEngineLimitError, self).__init__(message)
+        self.limit = limit
+        self.value = value
+
+
+class RemoteEngineError(Exception):
+    """Exception is raised when a remote job service cannot be reached or answers
+    a request with an error that is not a Task Engine error.
+
+    :Example:
+
+    >>> from envipyengine.remote import RemoteEngine
+    >>> engine = RemoteEngine('http://envi-host:8765')
+    >>> engine.tasks()
+    # traceback information
+    envipyengine.error.RemoteEngineError: Cannot reach http://envi-host:8765: [Errno 111] Connection refused
+
+    """
+    pass
+
+
+class RemoteServiceBusyError(RemoteEngineError):
+    """Exception is raised when a remote job service refuses a job because its
+    workers and queue are full.  The ``retry_after`` attribute holds the number of
+    seconds the service asks clients to wait before submitting again.
+
+    :Example:
+
+    >>> from envipyengine.remote import RemoteEngine
+    >>> task = RemoteEngine('http://envi-host:8765').task('SpectralIndex')
+    >>> task.execute(parameters)
+    # traceback information
+    envipyengine.error.RemoteServiceBusyError: 12 jobs are pending
+
+    """
+    def __init__(self, message, retry_after=1.0):
+        super(RemoteServiceBusyError, self).__init__(message)
+        self.retry_after = retry_after
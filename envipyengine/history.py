@@ -0,0 +1,339 @@
+"""
+The history module records the runtime of past jobs and estimates new ones.
+
+When the ``history`` config option is true, every successful
+``Task.execute`` call records a run in a SQLite database: the task name, the
+dimensions, band count and data type of its input rasters, a fingerprint of
+its other parameters, its wall time and the peak memory of the engine
+process.  The database is the ``history-file`` config option, or a
+``history.sqlite`` file next to the user config file.  It can be shared by
+any number of local processes.
+
+``Task.estimate(parameters)`` predicts the duration and memory of a job from
+the runs of the same task.  Runs with the same parameter fingerprint are
+preferred.  The prediction is a least squares fit over the input raster
+size, or the mean if the input size does not vary.
+
+:Example:
+
+>>> from envipyengine import config, Engine
+>>> config.set('history', 'true')
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> # run jobs
+>>> task.estimate(parameters)
+Estimate(duration=41.7, memory=2147483648, runs=25)
+
+Order jobs shortest first, and let a scheduler admit them by their
+estimated memory:
+
+>>> jobs.sort(key=lambda parameters: task.estimate(parameters).duration)
+>>> scheduler = Scheduler(estimator=history.cost)
+
+"""
+from __future__ import absolute_import
+
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from . import config
+
+_LOGGER = logging.getLogger(__name__)
+
+_STORES = {}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    samples INTEGER,
+    lines INTEGER,
+    bands INTEGER,
+    data_type INTEGER,
+    input_bytes INTEGER,
+    wall_time REAL NOT NULL,
+    peak_rss INTEGER,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_task ON runs (task, fingerprint, created);
+'''
+
+# Bytes per sample of the ENVI header data type codes
+_DATA_TYPE_BYTES = {1: 1, 2: 2, 3: 4, 4: 4, 5: 8, 6: 8, 9: 16, 12: 2, 13: 4, 14: 8, 15: 8}
+
+Estimate = namedtuple('Estimate', ('duration', 'memory', 'runs'))
+"""The predicted seconds and bytes of a job, and the number of past runs used."""
+
+Features = namedtuple('Features', ('fingerprint', 'samples', 'lines', 'bands',
+                                   'data_type', 'input_bytes'))
+"""The properties of a job the estimates are based on."""
+
+
+class HistoryStore(object):
+    """
+    Runs of past jobs stored in a SQLite database.
+
+    :param path: The path of the database file.  It is created if it does
+                 not exist.
+    :param timeout: Seconds to wait for a database lock held by another process.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+        finally:
+            connection.close()
+
+    def record(self, task_name, parameters, wall_time, peak_rss=None):
+        """
+        Records a run.
+
+        :param task_name: The name of the task.
+        :param parameters: The input parameters of the job.
+        :param wall_time: The seconds the job took.
+        :param peak_rss: The peak memory of the engine process in bytes.
+        """
+        features = describe(parameters)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT INTO runs (task, fingerprint, samples, lines, bands, data_type, '
+                    'input_bytes, wall_time, peak_rss, created) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (task_name,) + tuple(features) + (wall_time, peak_rss, time.time()))
+        finally:
+            connection.close()
+
+    def runs(self, task_name, fingerprint=None, limit=200):
+        """
+        Returns the most recent runs of a task.
+
+        :param task_name: The name of the task.
+        :param fingerprint: Optionally only return runs with this parameter fingerprint.
+        :param limit: The maximum number of runs returned.
+        :return: A list of (input_bytes, wall_time, peak_rss) tuples, newest first.
+        """
+        statement = 'SELECT input_bytes, wall_time, peak_rss FROM runs WHERE task = ?'
+        arguments = (task_name,)
+        if fingerprint is not None:
+            statement += ' AND fingerprint = ?'
+            arguments += (fingerprint,)
+        connection = self._connect()
+        try:
+            return connection.execute(statement + ' ORDER BY created DESC LIMIT ?',
+                                      arguments + (limit,)).fetchall()
+        finally:
+            connection.close()
+
+    def estimate(self, task_name, parameters, limit=200):
+        """
+        Predicts the duration and memory of a job from past runs of its task.
+
+        :param task_name: The name of the task.
+        :param parameters: The input parameters of the job.
+        :param limit: The maximum number of past runs considered.
+        :return: An :class:`Estimate`, or None if the task has no recorded runs.
+        """
+        features = describe(parameters)
+        runs = self.runs(task_name, features.fingerprint, limit) or \
+            self.runs(task_name, limit=limit)
+        if not runs:
+            return None
+        size = features.input_bytes
+        duration = _predict([(run[0], run[1]) for run in runs], size)
+        memory = _predict([(run[0], run[2]) for run in runs if run[2] is not None], size)
+        return Estimate(duration, None if memory is None else int(memory), len(runs))
+
+    def clear(self, task_name=None):
+        """
+        Deletes the recorded runs.
+
+        :param task_name: Optionally only delete the runs of this task.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                if task_name is None:
+                    connection.execute('DELETE FROM runs')
+                else:
+                    connection.execute('DELETE FROM runs WHERE task = ?', (task_name,))
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+        connection.execute('PRAGMA busy_timeout = {0:d}'.format(int(self.timeout * 1000)))
+        return connection
+
+
+def store():
+    """
+    Returns the history store of the ``history-file`` config option, or of
+    the default file next to the user config file.
+
+    :return: A :class:`HistoryStore`, or None if the ``history`` config
+             option is not true.  The file is not created in that case.
+    """
+    if not config.get_boolean('history'):
+        return None
+    path = config.get('history-file', default=None) or \
+        os.path.join(os.path.dirname(config._USER_CONFIG_FILE), 'history.sqlite')  # pylint: disable=protected-access
+    path = os.path.abspath(path)
+    if path not in _STORES:
+        _STORES[path] = HistoryStore(path)
+    return _STORES[path]
+
+
+def record(task_name, parameters, wall_time, result=None):
+    """
+    Records a run in the history store if the ``history`` config option is
+    true.  Errors writing the store are logged and do not fail the job.
+
+    :param task_name: The name of the task.
+    :param parameters: The input parameters of the job.
+    :param wall_time: The seconds the job took.
+    :param result: Optionally specify the TaskResult of the job, for the peak
+                   memory of the engine process.
+    """
+    history_store = store()
+    if history_store is None:
+        return
+    resources = getattr(result, 'resources', None)
+    peak_rss = resources.peak_rss if resources is not None else None
+    try:
+        history_store.record(task_name, parameters, wall_time, peak_rss)
+    except (sqlite3.Error, IOError, OSError) as error:
+        _LOGGER.warning('Cannot record the run of %s: %s', task_name, error)
+
+
+def estimate(task_name, parameters):
+    """
+    Predicts the duration and memory of a job from the history store.
+
+    :param task_name: The name of the task.
+    :param parameters: The input parameters of the job.
+    :return: An :class:`Estimate`, or None if the task has no recorded runs
+             or the ``history`` config option is not true.
+    """
+    history_store = store()
+    if history_store is None:
+        return None
+    return history_store.estimate(task_name, parameters)
+
+
+def cost(task, parameters):
+    """
+    Returns the estimated memory of a job as a
+    :class:`envipyengine.scheduler.Cost`, for use as a scheduler estimator.
+
+    :param task: An ENVI Py Engine Task object.
+    :param parameters: The input parameters of the job.
+    :return: A Cost, or None if the memory cannot be estimated.
+    """
+    from .scheduler import Cost  # pylint: disable=import-outside-toplevel
+    prediction = task.estimate(parameters or {})
+    if prediction is None or prediction.memory is None:
+        return None
+    return Cost(memory=prediction.memory)
+
+
+def describe(parameters):
+    """
+    Returns the features of a job: the fingerprint of its parameters other
+    than rasters and URIs, and the dimensions of its input rasters, read from
+    their ENVI headers.  Dimensions of multiple input rasters are summed.
+
+    :param parameters: The input parameters of the job.
+    :return: A :class:`Features` tuple.  Raster features are None if no
+             input raster header was found.
+    """
+    settings = dict((key, value) for key, value in parameters.items()
+                    if not str(key).upper().endswith('_URI') and not _rasters(value))
+    fingerprint = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str)
+                               .encode('utf-8')).hexdigest()
+
+    headers = [header for header in (_read_header(raster) for raster in _rasters(parameters))
+               if header is not None]
+    if not headers:
+        return Features(fingerprint, None, None, None, None, None)
+    samples = sum(header['samples'] for header in headers)
+    lines = sum(header['lines'] for header in headers)
+    bands = sum(header['bands'] for header in headers)
+    data_type = max(header['data type'] for header in headers)
+    input_bytes = sum(header['samples'] * header['lines'] * header['bands'] *
+                      _DATA_TYPE_BYTES.get(header['data type'], 1) for header in headers)
+    return Features(fingerprint, samples, lines, bands, data_type, input_bytes)
+
+
+def _rasters(value):
+    """
+    Returns the raster references, dictionaries with a 'url', within a value.
+    """
+    if isinstance(value, dict):
+        if 'url' in value:
+            return [value]
+        return [raster for item in value.values() for raster in _rasters(item)]
+    if isinstance(value, (list, tuple)):
+        return [raster for item in value for raster in _rasters(item)]
+    return []
+
+
+def _read_header(raster):
+    """
+    Returns the samples, lines, bands and data type of a raster from its ENVI
+    header, or None if the header cannot be read.
+    """
+    url = str(raster['url'])
+    for header in (os.path.splitext(url)[0] + '.hdr', url + '.hdr'):
+        if os.path.isfile(header):
+            break
+    else:
+        return None
+    values = {}
+    try:
+        with io.open(header, encoding='utf-8', errors='replace') as header_file:
+            for line in header_file:
+                key, _, value = line.partition('=')
+                key = key.strip().lower()
+                if key in ('samples', 'lines', 'bands', 'data type'):
+                    values[key] = int(value.strip())
+    except (IOError, OSError, ValueError):
+        return None
+    if len(values) != 4:
+        return None
+    return values
+
+
+def _predict(points, x):
+    """
+    Returns the least squares prediction at x of a list of (x, y) points, or
+    the mean of y if x is unknown or the points do not vary in x.
+    """
+    if not points:
+        return None
+    ys = [point[1] for point in points]
+    mean_y = sum(ys) / float(len(ys))
+    known = [point for point in points if point[0] is not None]
+    if x is None or len(set(point[0] for point in known)) < 2:
+        return mean_y
+    mean_x = sum(point[0] for point in known) / float(len(known))
+    mean_known_y = sum(point[1] for point in known) / float(len(known))
+    variance = sum((point[0] - mean_x) ** 2 for point in known)
+    covariance = sum((point[0] - mean_x) * (point[1] - mean_known_y) for point in known)
+    slope = covariance / variance
+    return max(0.0, mean_known_y + slope * (x - mean_x))
@@ -0,0 +1,445 @@
+"""
+The metrics module aggregates job metrics and exports them for Prometheus.
+
+Once enabled, the metrics are collected for every engine invocation made by
+``Task.execute``, ``Task.taskinfo`` and ``Engine.tasks`` through the
+:mod:`envipyengine.taskengine.tracing` hooks:
+
+========================================== ========= =======================================
+Metric                                     Type      Labels
+========================================== ========= =======================================
+envipyengine_jobs_total                    counter   operation, task, engine, status
+envipyengine_job_duration_seconds          histogram operation, task
+envipyengine_job_failures_total            counter   operation, task, exception
+envipyengine_engine_processes_in_flight    gauge     engine
+envipyengine_engine_bytes_in_total         counter   operation, task
+envipyengine_engine_bytes_out_total        counter   operation, task
+envipyengine_engine_cpu_seconds_total      counter   operation, task, mode
+envipyengine_engine_peak_rss_bytes         histogram operation, task
+========================================== ========= =======================================
+
+The ``operation`` label is ``execute``, ``taskinfo`` or ``tasks``, or
+``batch``, ``chain`` or ``profile`` for jobs of the bundled BatchExecute,
+ChainRunner and ProfileTask tasks.  The ``task`` label is the task the job
+runs on behalf of, e.g. the task of the jobs of a batch, rather than the
+bundled task.
+
+The metrics are written in the Prometheus text exposition format to the file
+given by the ``metrics-file`` config option, e.g. a ``.prom`` file in the
+directory of the node exporter textfile collector.  The file is replaced
+atomically so the collector never reads a partial file.
+
+:Example:
+
+>>> from envipyengine import metrics
+>>> metrics.enable()
+>>> # run jobs
+>>> metrics.dump('/var/lib/node_exporter/textfile/envipyengine.prom')
+
+Or dump the metrics every 15 seconds to the configured file:
+
+>>> metrics.enable(interval=15)
+
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import tempfile
+import threading
+
+from . import config
+from .taskengine import tracing
+from .utils import register_at_fork
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+RSS_BUCKETS = tuple(2 ** exponent for exponent in range(24, 38))
+
+_OPERATIONS = {'QueryTask': 'taskinfo',
+               'QueryTasks': 'taskinfo',
+               'QueryTaskCatalog': 'tasks',
+               'BatchExecute': 'batch',
+               'ChainRunner': 'chain',
+               'ProfileTask': 'profile'}
+
+
+class _Metric(object):
+    """
+    Base class of the metric types.  Values are stored per label tuple.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """
+        Replaces the lock in a forked child process.
+        """
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('{0} expects labels {1}'.format(self.name, self.labelnames))
+        return tuple(str(value) for value in labels)
+
+    def samples(self):
+        """
+        Returns a list of (suffix, labels dictionary, value) tuples.
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return [('', dict(zip(self.labelnames, key)), value) for key, value in items]
+
+    def clear(self):
+        """
+        Resets all values of the metric.
+        """
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing value.
+    """
+    type_name = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        """
+        Increments the counter.
+
+        :param amount: The amount to add.
+        :param labels: The label values in the order of the label names.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels=()):
+        """
+        Returns the current value for the given labels.
+        """
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down.
+    """
+    type_name = 'gauge'
+
+    def dec(self, amount=1, labels=()):
+        """
+        Decrements the gauge.
+
+        :param amount: The amount to subtract.
+        :param labels: The label values in the order of the label names.
+        """
+        self.inc(-amount, labels)
+
+    def set(self, value, labels=()):
+        """
+        Sets the gauge to a value.
+
+        :param value: The new value.
+        :param labels: The label values in the order of the label names.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations in cumulative buckets.
+
+    :param buckets: The upper bounds of the buckets.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        """
+        Records an observation.
+
+        :param value: The observed value.
+        :param labels: The label values in the order of the label names.
+        """
+        key = self._key(labels)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, ([list(state[0])] + state[1:]))
+                     for key, state in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                samples.append(('_bucket', bucket_labels, cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+
+class Registry(object):
+    """
+    A collection of metrics that can be exported together.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry.
+
+        :param metric: A Counter, Gauge or Histogram object.
+        :return: The metric.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    @property
+    def metrics(self):
+        """
+        A list of the registered metrics.
+        """
+        return list(self._metrics)
+
+    def clear(self):
+        """
+        Resets the values of all registered metrics.
+        """
+        for metric in self._metrics:
+            metric.clear()
+
+    def exposition(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+
+        :return: A string.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, _escape_help(metric.documentation)))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.type_name))
+            for suffix, labels, value in metric.samples():
+                lines.append('{0}{1}{2} {3}'.format(metric.name, suffix,
+                                                    _format_labels(labels),
+                                                    _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, filename):
+        """
+        Atomically writes the metrics to a file for the node exporter
+        textfile collector.
+
+        :param filename: The path of the output file.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temp_name = tempfile.mkstemp(dir=directory, prefix='.envipyengine-',
+                                             suffix='.prom.tmp')
+        try:
+            with os.fdopen(handle, 'w') as output:
+                output.write(self.exposition())
+                output.flush()
+                os.fsync(output.fileno())
+            os.chmod(temp_name, 0o644)
+            os.replace(temp_name, filename)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+
+REGISTRY = Registry()
+
+JOBS = REGISTRY.register(Counter(
+    'envipyengine_jobs_total', 'Number of task engine invocations.',
+    ('operation', 'task', 'engine', 'status')))
+DURATION = REGISTRY.register(Histogram(
+    'envipyengine_job_duration_seconds', 'Wall time of task engine invocations.',
+    ('operation', 'task')))
+FAILURES = REGISTRY.register(Counter(
+    'envipyengine_job_failures_total', 'Number of failed task engine invocations.',
+    ('operation', 'task', 'exception')))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'envipyengine_engine_processes_in_flight', 'Number of running task engine invocations.',
+    ('engine',)))
+BYTES_IN = REGISTRY.register(Counter(
+    'envipyengine_engine_bytes_in_total', 'Bytes of JSON written to the task engine.',
+    ('operation', 'task')))
+BYTES_OUT = REGISTRY.register(Counter(
+    'envipyengine_engine_bytes_out_total', 'Bytes of JSON read from the task engine.',
+    ('operation', 'task')))
+CPU_SECONDS = REGISTRY.register(Counter(
+    'envipyengine_engine_cpu_seconds_total', 'CPU time used by task engine processes.',
+    ('operation', 'task', 'mode')))
+PEAK_RSS = REGISTRY.register(Histogram(
+    'envipyengine_engine_peak_rss_bytes', 'Peak resident set size of task engine processes.',
+    ('operation', 'task'), buckets=RSS_BUCKETS))
+
+
+class MetricsObserver(tracing.Observer):
+    """
+    Tracing observer that updates the job metrics.
+    """
+
+    def job_started(self, job):
+        IN_FLIGHT.inc(labels=(job.engine,))
+
+    def job_finished(self, job):
+        IN_FLIGHT.dec(labels=(job.engine,))
+        operation = operation_name(job.task)
+        task = job.target
+        status = 'success' if job.error is None else 'failure'
+        JOBS.inc(labels=(operation, task, job.engine, status))
+        DURATION.observe(job.duration, labels=(operation, task))
+        BYTES_IN.inc(job.bytes_in, labels=(operation, task))
+        BYTES_OUT.inc(job.bytes_out, labels=(operation, task))
+        resources = job.resources
+        if resources is not None and resources.user_time is not None:
+            CPU_SECONDS.inc(resources.user_time, labels=(operation, task, 'user'))
+            CPU_SECONDS.inc(resources.system_time, labels=(operation, task, 'system'))
+        if resources is not None and resources.peak_rss is not None:
+            PEAK_RSS.observe(resources.peak_rss, labels=(operation, task))
+        if job.error is not None:
+            FAILURES.inc(labels=(operation, task, type(job.error).__name__))
+
+
+_OBSERVER = MetricsObserver()
+_DUMPER = None
+
+
+@register_at_fork
+def _after_fork():
+    """
+    Replaces the metric locks in a forked child process.  The dump thread of
+    the parent does not exist in the child, so periodic dumps are stopped.
+    """
+    global _DUMPER  # pylint: disable=global-statement
+    for metric in REGISTRY.metrics:
+        metric.after_fork()
+    _DUMPER = None
+
+
+def operation_name(task_name):
+    """
+    Returns the operation label for a task name: 'taskinfo' for QueryTask and
+    QueryTasks, 'tasks' for QueryTaskCatalog, 'batch', 'chain' and 'profile'
+    for the bundled BatchExecute, ChainRunner and ProfileTask tasks, and
+    'execute' for all other tasks.
+    """
+    return _OPERATIONS.get(task_name, 'execute')
+
+
+def enable(interval=None, filename=None):
+    """
+    Starts collecting metrics for all jobs.
+
+    :param interval: Optionally dump the metrics every ``interval`` seconds.
+    :param filename: The file to dump to, defaults to the ``metrics-file`` config option.
+    """
+    global _DUMPER  # pylint: disable=global-statement
+    if _OBSERVER not in tracing.observers():
+        tracing.add_observer(_OBSERVER)
+    if interval and _DUMPER is None:
+        _DUMPER = _Dumper(interval, filename or config.get('metrics-file'))
+        _DUMPER.start()
+
+
+def disable():
+    """
+    Stops collecting metrics and stops any periodic dumps.
+    """
+    global _DUMPER  # pylint: disable=global-statement
+    tracing.remove_observer(_OBSERVER)
+    if _DUMPER is not None:
+        _DUMPER.stop()
+        _DUMPER = None
+
+
+def dump(filename=None):
+    """
+    Atomically writes the metrics in the Prometheus text exposition format.
+
+    :param filename: The output file, defaults to the ``metrics-file`` config option.
+    """
+    REGISTRY.write_textfile(filename or config.get('metrics-file'))
+
+
+class _Dumper(threading.Thread):
+    """
+    Daemon thread that periodically dumps the metrics.
+    """
+
+    def __init__(self, interval, filename):
+        super(_Dumper, self).__init__(name='envipyengine-metrics')
+        self.daemon = True
+        self.interval = interval
+        self.filename = filename
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                dump(self.filename)
+            except (IOError, OSError):
+                _LOGGER.exception('Unable to write metrics to %s', self.filename)
+
+    def stop(self):
+        """
+        Stops the thread after writing a final dump.
+        """
+        self._stopped.set()
+        dump(self.filename)
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('\\', '\\\\')
+                           .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
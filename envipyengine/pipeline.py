@@ -0,0 +1,395 @@
+"""
+The pipeline module chains ENVI Py Engine tasks into a directed acyclic graph.
+
+Each node of a pipeline is a task and its input parameters.  Input parameter
+values may reference the output parameters of other nodes with an
+:class:`Output` object; the reference is replaced with the actual output value
+once the upstream node has finished.  Nodes that do not depend on each other
+are executed in parallel.
+
+:Example:
+
+Import the modules for the example.
+
+>>> from envipyengine import Engine
+>>> from envipyengine.pipeline import Pipeline
+
+Build a pipeline that calibrates a raster and computes a spectral index from
+the calibrated result.
+
+>>> envi_engine = Engine('ENVI')
+>>> pipeline = Pipeline(max_workers=4)
+>>> calibrate = pipeline.add('calibrate',
+                             envi_engine.task('RadiometricCalibration'),
+                             dict(INPUT_RASTER=input_raster))
+>>> index = pipeline.add('index',
+                         envi_engine.task('SpectralIndex'),
+                         dict(INPUT_RASTER=calibrate.output('OUTPUT_RASTER'),
+                              INDEX='Normalized Difference Vegetation Index'))
+>>> results = pipeline.run()
+>>> results['index']['outputParameters']['OUTPUT_RASTER']
+
+If a node fails, a :class:`envipyengine.error.PipelineExecutionError` is raised.
+Calling :meth:`Pipeline.run` again only executes the nodes that have not
+completed yet; the outputs of successful nodes are reused.
+
+When the pipeline is given a :class:`envipyengine.scratch.ScratchSpace`, the
+unspecified temporary outputs of every node that has downstream consumers are
+written to the scratch space and deleted once all consumers have completed.
+
+"""
+from __future__ import absolute_import
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .error import PipelineError, PipelineExecutionError
+from .taskengine import threads as thread_budget
+
+
+class Output(object):
+    """
+    A symbolic reference to an output parameter of a pipeline node.
+
+    :param node: The name of the node producing the output.
+    :param parameter: The name of the output parameter.
+    """
+
+    def __init__(self, node, parameter):
+        self.node = node
+        self.parameter = parameter
+
+    def resolve(self, results):
+        """
+        Returns the value of the referenced output parameter.
+
+        :param results: A dictionary of node names to task results.
+        :return: The value of the output parameter.
+        """
+        try:
+            return results[self.node]['outputParameters'][self.parameter]
+        except KeyError:
+            raise PipelineError(
+                "Node '{0}' did not produce output parameter '{1}'".format(
+                    self.node, self.parameter))
+
+    def __eq__(self, other):
+        return isinstance(other, Output) and \
+            (self.node, self.parameter) == (other.node, other.parameter)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.node, self.parameter))
+
+    def __repr__(self):
+        return 'Output({0!r}, {1!r})'.format(self.node, self.parameter)
+
+
+class Node(object):
+    """
+    A single task invocation within a pipeline.
+
+    :param name: The unique name of the node within the pipeline.
+    :param task: The ENVI Py Engine Task object to execute.
+    :param parameters: A dictionary of input parameters.  Values may contain
+                       :class:`Output` references to other nodes.
+    :param cwd: Optionally specify the current working directory for the node.
+    """
+
+    def __init__(self, name, task, parameters=None, cwd=None):
+        self.name = name
+        self.task = task
+        self.parameters = parameters or {}
+        self.cwd = cwd
+
+    def output(self, parameter):
+        """
+        Returns a symbolic reference to one of the node's output parameters.
+
+        :param parameter: The name of the output parameter.
+        :return: An :class:`Output` object.
+        """
+        return Output(self.name, parameter)
+
+    @property
+    def references(self):
+        """
+        A list of all :class:`Output` references in the node's parameters.
+        """
+        return list(_find_references(self.parameters))
+
+    @property
+    def dependencies(self):
+        """
+        A set of the node names this node depends on.
+        """
+        return set(ref.node for ref in self.references)
+
+    def __repr__(self):
+        return 'Node({0!r})'.format(self.name)
+
+
+class Pipeline(object):
+    """
+    A directed acyclic graph of tasks.
+
+    :param max_workers: The maximum number of nodes executing concurrently.
+    :param scratch: Optionally specify a :class:`envipyengine.scratch.ScratchSpace`
+                    for the temporary outputs of intermediate nodes.
+    """
+
+    def __init__(self, max_workers=4, scratch=None):
+        self.max_workers = max_workers
+        self.scratch = scratch
+        self._nodes = {}
+        self._order = []
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, task, parameters=None, cwd=None):
+        """
+        Adds a node to the pipeline.
+
+        :param name: The unique name of the node.
+        :param task: The ENVI Py Engine Task object to execute.
+        :param parameters: A dictionary of input parameters.  Values may
+                           contain :class:`Output` references to other nodes.
+        :param cwd: Optionally specify the current working directory the
+                    engine will run in for this node.
+        :return: The new :class:`Node` object.
+        """
+        if name in self._nodes:
+            raise PipelineError("Node '{0}' already exists".format(name))
+        node = Node(name, task, parameters, cwd=cwd)
+        self._nodes[name] = node
+        self._order.append(name)
+        return node
+
+    def node(self, name):
+        """
+        Returns the node with the given name.
+
+        :param name: The name of the node.
+        :return: A :class:`Node` object.
+        """
+        return self._nodes[name]
+
+    @property
+    def nodes(self):
+        """
+        A list of the pipeline nodes in the order they were added.
+        """
+        return [self._nodes[name] for name in self._order]
+
+    @property
+    def results(self):
+        """
+        A dictionary of node names to the results of the completed nodes.
+        """
+        with self._lock:
+            return dict(self._results)
+
+    def reset(self, name=None):
+        """
+        Discards completed results so the nodes are executed on the next run.
+
+        :param name: The name of the node to reset.  All nodes that depend on
+                     it are reset as well.  If not specified, every node is reset.
+        """
+        with self._lock:
+            if name is None:
+                self._results.clear()
+                return
+            for stale in self.descendants(name) | set([name]):
+                self._results.pop(stale, None)
+
+    def descendants(self, name):
+        """
+        Returns the names of all nodes that directly or indirectly depend on a node.
+
+        :param name: The name of the node.
+        :return: A set of node names.
+        """
+        dependents = self._dependents()
+        found = set()
+        pending = [name]
+        while pending:
+            for child in dependents[pending.pop()]:
+                if child not in found:
+                    found.add(child)
+                    pending.append(child)
+        return found
+
+    def validate(self):
+        """
+        Verifies that all references point to existing nodes and that the
+        pipeline does not contain any cycles.
+
+        :return: A list of node names in a valid execution order.
+        """
+        for node in self.nodes:
+            for dependency in node.dependencies:
+                if dependency not in self._nodes:
+                    raise PipelineError(
+                        "Node '{0}' references unknown node '{1}'".format(
+                            node.name, dependency))
+
+        remaining = dict((node.name, set(node.dependencies)) for node in self.nodes)
+        order = []
+        while remaining:
+            ready = [name for name in self._order
+                     if name in remaining and not remaining[name]]
+            if not ready:
+                raise PipelineError(
+                    'Pipeline contains a cycle between nodes: ' +
+                    ', '.join(sorted(remaining)))
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return order
+
+    def run(self, max_workers=None):
+        """
+        Executes all nodes of the pipeline that have not completed yet.
+
+        Independent nodes run in parallel, bounded by ``max_workers``.  When a
+        node fails, the nodes that depend on it are skipped while independent
+        branches keep running.  Results of successful nodes are kept, so calling
+        run again after a failure only executes the failed and skipped nodes.
+
+        :param max_workers: Optionally override the maximum number of nodes
+                            executing concurrently.
+        :return: A dictionary of node names to task results.
+        """
+        self.validate()
+        max_workers = max_workers or self.max_workers
+        threads = thread_budget.budget(max_workers)
+
+        errors = {}
+        skipped = []
+        with self._lock:
+            results = dict(self._results)
+        pending = [name for name in self._order if name not in results]
+        dependents = self._dependents()
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            running = {}
+            while pending or running:
+                for name in list(pending):
+                    dependencies = self._nodes[name].dependencies
+                    if dependencies & set(errors) or \
+                            dependencies & set(skipped):
+                        pending.remove(name)
+                        skipped.append(name)
+                    elif dependencies.issubset(results) and \
+                            len(running) < max_workers:
+                        pending.remove(name)
+                        future = executor.submit(self._execute,
+                                                 self._nodes[name], results,
+                                                 bool(dependents[name]), threads)
+                        running[future] = name
+
+                if not running:
+                    # Everything left is blocked by failed nodes.
+                    skipped.extend(pending)
+                    pending = []
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:  # pylint: disable=broad-except
+                        errors[name] = error
+                    else:
+                        results[name] = result
+                        with self._lock:
+                            self._results[name] = result
+                        self._release_scratch(name, dependents)
+        finally:
+            executor.shutdown(wait=True)
+
+        if errors:
+            raise PipelineExecutionError(
+                'Pipeline nodes failed: ' + ', '.join(sorted(errors)),
+                errors=errors, results=results, skipped=skipped)
+        return results
+
+    def _execute(self, node, results, has_dependents, threads=None):
+        """
+        Resolves the node's references and executes its task, with the
+        engine's share of the threads of the concurrently running nodes.
+        """
+        parameters = _resolve_references(node.parameters, results)
+        if self.scratch is not None and has_dependents:
+            parameters = self.scratch.assign(node.task, parameters,
+                                             owner=self._scratch_owner(node.name))
+        return node.task.execute(parameters, cwd=node.cwd, threads=threads)
+
+    def _release_scratch(self, name, dependents):
+        """
+        Updates the scratch space after a node completed: the node's own
+        allocations are retained for its consumers and the allocations of the
+        nodes it consumed are released.
+        """
+        if self.scratch is None:
+            return
+        owner = self._scratch_owner(name)
+        if dependents[name] and self.scratch.allocations(owner):
+            self.scratch.retain(owner, len(dependents[name]))
+        for dependency in self._nodes[name].dependencies:
+            self.scratch.release(self._scratch_owner(dependency))
+
+    def _scratch_owner(self, name):
+        """
+        Returns the scratch space owner of a node.
+        """
+        return ('pipeline', id(self), name)
+
+    def _dependents(self):
+        """
+        Returns a dictionary mapping each node name to the names of the nodes
+        that directly depend on it.
+        """
+        dependents = dict((name, set()) for name in self._order)
+        for node in self.nodes:
+            for dependency in node.dependencies:
+                dependents.setdefault(dependency, set()).add(node.name)
+        return dependents
+
+
+def _find_references(value):
+    """
+    Yields all :class:`Output` references contained in a parameter value.
+    """
+    if isinstance(value, Output):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            for ref in _find_references(item):
+                yield ref
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for ref in _find_references(item):
+                yield ref
+
+
+def _resolve_references(value, results):
+    """
+    Returns a copy of a parameter value with all :class:`Output` references
+    replaced by the values produced by the upstream nodes.
+    """
+    if isinstance(value, Output):
+        return value.resolve(results)
+    elif isinstance(value, dict):
+        return dict((key, _resolve_references(item, results))
+                    for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [_resolve_references(item, results) for item in value]
+    return value
@@ -0,0 +1,108 @@
+"""
+The queue package distributes task engine jobs to worker daemons.
+
+Jobs are submitted to a :class:`JobQueue` and stored by a pluggable
+:class:`Broker`.  Worker daemons, started with the ``envipyengine-worker``
+command on any number of nodes, lease jobs from the broker, keep their leases
+alive with heartbeats while the engine runs and store the results.  Jobs whose
+lease expires because their worker died are handed out again.
+
+The default broker is a :class:`SQLiteBroker` spool file given by the
+``queue-spool`` config option, which can be shared by multiple processes on a
+host.
+
+:Example:
+
+Start a worker with four engine slots::
+
+    envipyengine-worker --spool /var/spool/envipyengine/jobs.db --slots 4
+
+Submit a job and wait for its result:
+
+>>> from envipyengine.queue import JobQueue
+>>> queue = JobQueue('/var/spool/envipyengine/jobs.db')
+>>> job_id = queue.submit('ENVI:SpectralIndex', parameters)
+>>> result = queue.result(job_id, timeout=600)
+
+"""
+from __future__ import absolute_import
+
+import time
+
+from .. import config
+from ..error import JobFailedError
+from .broker import Broker, QueuedJob, QUEUED, LEASED, SUCCEEDED, FAILED
+from .spool import SQLiteBroker
+
+
+class JobQueue(object):
+    """
+    Submits jobs to a broker and retrieves their results.
+
+    :param broker: A :class:`Broker` object, or the path of a SQLite spool
+                   file.  Defaults to the 'queue-spool' config option.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = open_broker(broker)
+
+    def submit(self, task, parameters, cwd=None, max_attempts=3):
+        """
+        Adds a job to the queue.
+
+        :param task: A Task object or a task uri such as 'ENVI:SpectralIndex'.
+        :param parameters: A dictionary of input parameters.
+        :param cwd: Optionally specify the working directory for the engine
+                    on the worker node.
+        :param max_attempts: The number of times the job is handed out
+                             before it is failed.
+        :return: The job id.
+        """
+        uri = task if isinstance(task, str) else task.uri
+        return self.broker.put(uri, parameters, cwd=cwd, max_attempts=max_attempts)
+
+    def status(self, job_id):
+        """
+        Returns the state of a job: 'queued', 'leased', 'succeeded' or 'failed'.
+
+        :param job_id: The id of the job.
+        """
+        job = self.broker.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job.state
+
+    def result(self, job_id, timeout=None, poll_interval=0.5):
+        """
+        Waits for a job to finish and returns its result.
+
+        :param job_id: The id of the job.
+        :param timeout: Optionally specify the maximum number of seconds to wait.
+        :param poll_interval: The number of seconds between checks.
+        :return: The dictionary returned by Task.execute on the worker.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.broker.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.state == SUCCEEDED:
+                return job.result
+            if job.state == FAILED:
+                raise JobFailedError(job.error)
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError('Job {0} did not finish within {1} seconds'.format(
+                    job_id, timeout))
+            time.sleep(poll_interval)
+
+
+def open_broker(broker=None):
+    """
+    Returns a broker object.
+
+    :param broker: A :class:`Broker` object, or the path of a SQLite spool
+                   file.  Defaults to the 'queue-spool' config option.
+    """
+    if isinstance(broker, Broker):
+        return broker
+    return SQLiteBroker(broker or config.get('queue-spool'))
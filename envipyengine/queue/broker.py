@@ -0,0 +1,137 @@
+"""
+Defines the broker interface used by the job queue and its workers.
+"""
+from __future__ import absolute_import
+
+from abc import ABCMeta, abstractmethod
+
+from ..utils import with_metaclass
+
+QUEUED = 'queued'
+LEASED = 'leased'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class QueuedJob(object):
+    """
+    A job stored by a broker.
+
+    :param job_id: The unique id of the job.
+    :param task: The task uri, e.g. 'ENVI:SpectralIndex'.
+    :param parameters: A dictionary of input parameters.
+    :param cwd: The working directory for the engine, or None.
+    """
+
+    def __init__(self, job_id, task, parameters, cwd=None, state=QUEUED,
+                 worker=None, attempts=0, result=None, error=None):
+        self.id = job_id
+        self.task = task
+        self.parameters = parameters
+        self.cwd = cwd
+        self.state = state
+        self.worker = worker
+        self.attempts = attempts
+        self.result = result
+        self.error = error
+
+    @property
+    def done(self):
+        """
+        True if the job succeeded or failed permanently.
+        """
+        return self.state in (SUCCEEDED, FAILED)
+
+    def __repr__(self):
+        return 'QueuedJob({0!r}, {1!r}, state={2!r})'.format(self.id, self.task, self.state)
+
+
+class Broker(with_metaclass(ABCMeta, object)):
+    """
+    Stores jobs and hands them out to workers under time-limited leases.
+
+    A worker leases a job, keeps the lease alive with heartbeats while the job
+    runs and finally completes or fails it.  A job whose lease expires, e.g.
+    because its worker died, is handed out again.
+    """
+
+    @abstractmethod
+    def put(self, task, parameters, cwd=None, max_attempts=3):
+        """
+        Adds a job to the queue.
+
+        :param task: The task uri, e.g. 'ENVI:SpectralIndex'.
+        :param parameters: A dictionary of input parameters.
+        :param cwd: Optionally specify the working directory for the engine.
+        :param max_attempts: The number of times the job is handed out
+                             before it is failed.
+        :return: The job id.
+        """
+        pass
+
+    @abstractmethod
+    def lease(self, worker, lease_seconds):
+        """
+        Leases the oldest available job.
+
+        :param worker: The id of the worker taking the lease.
+        :param lease_seconds: The number of seconds until the lease expires.
+        :return: A :class:`QueuedJob`, or None if no job is available.
+        """
+        pass
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker, lease_seconds):
+        """
+        Extends the lease of a job.
+
+        :param job_id: The id of the leased job.
+        :param worker: The id of the worker holding the lease.
+        :param lease_seconds: The number of seconds until the lease expires.
+        :return: False if the worker no longer holds the lease.
+        """
+        pass
+
+    @abstractmethod
+    def complete(self, job_id, worker, result):
+        """
+        Stores the result of a job and marks it as succeeded.
+
+        :param job_id: The id of the leased job.
+        :param worker: The id of the worker holding the lease.
+        :param result: The JSON serializable result of the job.
+        :return: False if the worker no longer held the lease.
+        """
+        pass
+
+    @abstractmethod
+    def fail(self, job_id, worker, error, retry=False):
+        """
+        Marks a job as failed, or queues it again.
+
+        :param job_id: The id of the leased job.
+        :param worker: The id of the worker holding the lease.
+        :param error: A string describing the error.
+        :param retry: Set to True to queue the job again if it has attempts left.
+        :return: False if the worker no longer held the lease.
+        """
+        pass
+
+    @abstractmethod
+    def get(self, job_id):
+        """
+        Returns a job.
+
+        :param job_id: The id of the job.
+        :return: A :class:`QueuedJob`, or None if the job does not exist.
+        """
+        pass
+
+    @abstractmethod
+    def counts(self):
+        """
+        Returns the number of jobs in each state.
+
+        :return: A dictionary of state names to counts.
+        """
+        pass
@@ -0,0 +1,197 @@
+"""
+A broker storing jobs in a SQLite database file.
+
+The database can be shared by any number of local processes.  It also works
+on a shared filesystem whose locking SQLite supports, but a dedicated broker
+should be preferred for large clusters.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from .broker import Broker, QueuedJob, QUEUED, LEASED, SUCCEEDED, FAILED
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    cwd TEXT,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created);
+'''
+
+_COLUMNS = 'id, task, parameters, cwd, state, worker, attempts, result, error'
+
+
+class SQLiteBroker(Broker):
+    """
+    A broker storing jobs in a SQLite database.
+
+    :param path: The path of the database file.  It is created if it does
+                 not exist.
+    :param timeout: Seconds to wait for a database lock held by another process.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+        finally:
+            connection.close()
+
+    def put(self, task, parameters, cwd=None, max_attempts=3):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT INTO jobs (id, task, parameters, cwd, state, max_attempts, '
+                    'created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, task, json.dumps(parameters), cwd, QUEUED,
+                     max_attempts, now, now))
+        finally:
+            connection.close()
+        return job_id
+
+    def lease(self, worker, lease_seconds):
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                # Jobs whose lease expired too often are failed instead of redelivered
+                connection.execute(
+                    'UPDATE jobs SET state = ?, error = ?, worker = NULL, updated = ? '
+                    'WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts',
+                    (FAILED, 'Lease expired after the maximum number of attempts',
+                     now, LEASED, now))
+                row = connection.execute(
+                    'SELECT ' + _COLUMNS + ' FROM jobs '
+                    'WHERE state = ? OR (state = ? AND lease_expires < ?) '
+                    'ORDER BY created LIMIT 1',
+                    (QUEUED, LEASED, now)).fetchone()
+                if row is not None:
+                    connection.execute(
+                        'UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, '
+                        'attempts = attempts + 1, updated = ? WHERE id = ?',
+                        (LEASED, worker, now + lease_seconds, now, row[0]))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        job = _job(row)
+        job.state = LEASED
+        job.worker = worker
+        job.attempts += 1
+        return job
+
+    def heartbeat(self, job_id, worker, lease_seconds):
+        now = time.time()
+        return self._update(
+            'UPDATE jobs SET lease_expires = ?, updated = ? '
+            'WHERE id = ? AND worker = ? AND state = ?',
+            (now + lease_seconds, now, job_id, worker, LEASED))
+
+    def complete(self, job_id, worker, result):
+        return self._update(
+            'UPDATE jobs SET state = ?, result = ?, error = NULL, updated = ? '
+            'WHERE id = ? AND worker = ? AND state = ?',
+            (SUCCEEDED, json.dumps(result), time.time(), job_id, worker, LEASED))
+
+    def fail(self, job_id, worker, error, retry=False):
+        return self._update(
+            'UPDATE jobs SET state = CASE WHEN ? AND attempts < max_attempts '
+            'THEN ? ELSE ? END, worker = NULL, error = ?, updated = ? '
+            'WHERE id = ? AND worker = ? AND state = ?',
+            (bool(retry), QUEUED, FAILED, str(error), time.time(),
+             job_id, worker, LEASED))
+
+    def get(self, job_id):
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT ' + _COLUMNS + ' FROM jobs WHERE id = ?',
+                                     (job_id,)).fetchone()
+        finally:
+            connection.close()
+        return None if row is None else _job(row)
+
+    def counts(self):
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        finally:
+            connection.close()
+        counts = dict((state, 0) for state in (QUEUED, LEASED, SUCCEEDED, FAILED))
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, older_than=None):
+        """
+        Deletes finished jobs.
+
+        :param older_than: Optionally only delete jobs finished more than this
+                           many seconds ago.
+        :return: The number of deleted jobs.
+        """
+        cutoff = time.time() - (older_than or 0)
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    'DELETE FROM jobs WHERE state IN (?, ?) AND updated <= ?',
+                    (SUCCEEDED, FAILED, cutoff))
+            return cursor.rowcount
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+        connection.execute('PRAGMA busy_timeout = {0:d}'.format(int(self.timeout * 1000)))
+        return connection
+
+    def _update(self, statement, arguments):
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(statement, arguments)
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+
+def _job(row):
+    """
+    Converts a database row to a QueuedJob.
+    """
+    job_id, task, parameters, cwd, state, worker, attempts, result, error = row
+    return QueuedJob(job_id, task, json.loads(parameters), cwd=cwd, state=state,
+                     worker=worker, attempts=attempts,
+                     result=None if result is None else json.loads(result),
+                     error=error)
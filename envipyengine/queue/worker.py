@@ -0,0 +1,200 @@
+"""
+The worker daemon executing jobs from a job queue.
+
+Each worker runs a number of engine slots.  Every slot leases a job from the
+broker, executes it with ``Task.execute`` and stores the result.  A heartbeat
+thread extends the leases of all running jobs so other workers do not pick
+them up again.
+
+Run ``envipyengine-worker --help`` for the command line options.
+"""
+from __future__ import absolute_import
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import uuid
+
+from ..error import TaskEngineExecutionError
+from ..taskengine import threads as thread_budget
+from ..taskengine.task import Task
+from . import open_broker
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Worker(object):
+    """
+    Executes queued jobs in a number of concurrent engine slots.
+
+    :param broker: A broker object or the path of a SQLite spool file.
+    :param slots: The number of jobs executed concurrently.
+    :param lease_seconds: The length of the job leases.  Heartbeats are sent
+                          every third of this interval.
+    :param poll_interval: Seconds a slot waits before polling an empty queue again.
+    :param worker_id: The id of the worker, defaults to the host name and pid.
+    """
+
+    def __init__(self, broker=None, slots=1, lease_seconds=60.0, poll_interval=1.0,
+                 worker_id=None):
+        self.broker = open_broker(broker)
+        self.slots = slots
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or '{0}-{1}-{2}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # Set while no job is running, so the heartbeat can exit once drained
+        self._drained = threading.Event()
+        self._drained.set()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts the slot and heartbeat threads.
+        """
+        self._stopped.clear()
+        self._threads = [threading.Thread(target=self._slot, name='envipyengine-slot-%d' % index)
+                         for index in range(self.slots)]
+        self._threads.append(threading.Thread(target=self._heartbeat,
+                                              name='envipyengine-heartbeat'))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stops leasing new jobs.  Running jobs are finished first.
+
+        :param wait: Set to False to return without waiting for running jobs.
+        """
+        self._stopped.set()
+        if wait:
+            self.join()
+
+    def join(self):
+        """
+        Waits for all threads to exit after the worker was stopped.
+        """
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(0.5)
+
+    def run(self):
+        """
+        Runs the worker until it is stopped.
+        """
+        self.start()
+        self.join()
+
+    def run_once(self):
+        """
+        Leases and executes a single job in the calling thread.
+
+        :return: True if a job was executed.
+        """
+        job = self.broker.lease(self.worker_id, self.lease_seconds)
+        if job is None:
+            return False
+        with self._lock:
+            self._active[job.id] = job
+            self._drained.clear()
+        try:
+            self._execute(job)
+        finally:
+            with self._lock:
+                self._active.pop(job.id, None)
+                if not self._active:
+                    self._drained.set()
+        return True
+
+    def _slot(self):
+        while not self._stopped.is_set():
+            try:
+                if not self.run_once():
+                    self._stopped.wait(self.poll_interval)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Worker slot failed')
+                self._stopped.wait(self.poll_interval)
+
+    def _execute(self, job):
+        _LOGGER.info('Executing job %s (%s), attempt %d', job.id, job.task, job.attempts)
+        try:
+            result = Task(uri=job.task).execute(job.parameters, cwd=job.cwd,
+                                                threads=thread_budget.budget(self.slots))
+        except TaskEngineExecutionError as error:
+            # The engine rejected the job, running it again will not help
+            _LOGGER.info('Job %s failed: %s', job.id, error)
+            self.broker.fail(job.id, self.worker_id, error, retry=False)
+        except Exception as error:  # pylint: disable=broad-except
+            _LOGGER.warning('Job %s failed and will be retried: %s', job.id, error)
+            self.broker.fail(job.id, self.worker_id,
+                             '{0}: {1}'.format(type(error).__name__, error), retry=True)
+        else:
+            if not self.broker.complete(job.id, self.worker_id, result):
+                _LOGGER.warning('Lease of job %s was lost before it completed', job.id)
+
+    def _heartbeat(self):
+        interval = self.lease_seconds / 3.0
+        while True:
+            # Once stopped, the stop event no longer waits, so the interval is
+            # spent waiting for the running jobs to finish instead
+            if self._stopped.is_set():
+                self._drained.wait(interval)
+            else:
+                self._stopped.wait(interval)
+            if self._stopped.is_set() and self._idle():
+                break
+            with self._lock:
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                try:
+                    if not self.broker.heartbeat(job_id, self.worker_id, self.lease_seconds):
+                        _LOGGER.warning('Lease of job %s was lost', job_id)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('Heartbeat for job %s failed', job_id)
+
+    def _idle(self):
+        with self._lock:
+            return not self._active
+
+
+def main(argv=None):
+    """
+    Entry point of the envipyengine-worker command.
+    """
+    parser = argparse.ArgumentParser(
+        description='Executes envipyengine jobs from a job queue.')
+    parser.add_argument('--spool',
+                        help="the SQLite spool file, defaults to the 'queue-spool' config option")
+    parser.add_argument('--slots', type=int, default=os.cpu_count() or 1,
+                        help='number of concurrent engine slots, defaults to the CPU count')
+    parser.add_argument('--lease', type=float, default=60.0,
+                        help='lease length in seconds')
+    parser.add_argument('--poll', type=float, default=1.0,
+                        help='seconds between polls of an empty queue')
+    parser.add_argument('--worker-id', help='the id of this worker')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log each job')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    worker = Worker(args.spool, slots=args.slots, lease_seconds=args.lease,
+                    poll_interval=args.poll, worker_id=args.worker_id)
+
+    def _shutdown(signum, frame):  # pylint: disable=unused-argument
+        _LOGGER.warning('Stopping after running jobs finish')
+        worker.stop(wait=False)
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+The remote package runs tasks on the engine of another host over HTTP.
+
+The ``envipyengine-serve`` command starts a job service on a host with an
+ENVI install.  It lists tasks, returns task definitions and executes jobs,
+running them in a bounded pool of worker threads.  A job submission is
+answered with the result if the job finishes within a few seconds, and
+otherwise with status 202 and the URL of the job, which clients poll until
+the job has finished.  See :mod:`envipyengine.remote.protocol` for the
+messages.
+
+:class:`RemoteEngine` and :class:`RemoteTask` have the same API as the Engine
+and Task classes, so applications without an ENVI install can use the
+service in their place.  Requests of all tasks of an engine share a pool of
+kept-alive connections.
+
+:Example:
+
+Serve jobs with eight workers::
+
+    envipyengine-serve --host 0.0.0.0 --port 8765 --workers 8
+
+Run a task from another host:
+
+>>> from envipyengine.remote import RemoteEngine
+>>> engine = RemoteEngine('http://envi-host:8765')
+>>> task = engine.task('SpectralIndex')
+>>> result = task.execute(parameters)
+
+The service executes jobs with the user and file system of its host and has
+no authentication, so it listens on localhost unless told otherwise.
+
+"""
+from __future__ import absolute_import
+
+from .engine import RemoteEngine
+from .task import RemoteTask
@@ -0,0 +1,156 @@
+"""
+The HTTP client of the job service, keeping a pool of connections alive.
+"""
+from __future__ import absolute_import
+
+import http.client
+import json
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, urlsplit
+
+from ..error import RemoteEngineError, RemoteServiceBusyError
+from . import protocol
+
+# Errors of a kept-alive connection the server already closed
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class Client(object):
+    """
+    Sends requests to a job service over a pool of kept-alive connections.
+    The client can be shared by any number of threads.
+
+    :param url: The base URL of the service, e.g. 'http://envi-host:8765'.
+    :param timeout: The number of seconds to wait for the service to answer.
+    :param pool_size: The maximum number of idle connections kept open.
+    """
+
+    def __init__(self, url, timeout=60.0, pool_size=8):
+        parsed = urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL: {0}'.format(url))
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._scheme = parsed.scheme
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._prefix = parsed.path.rstrip('/')
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, body=None):
+        """
+        Sends a request and returns the decoded response.  A request on a
+        kept-alive connection that the service has closed in the meantime is
+        sent again on a new connection.
+
+        :param method: The HTTP method.
+        :param path: The path below the base URL.
+        :param body: Optionally specify a JSON serializable request body.
+        :return: A tuple of the status, the response headers and the decoded body.
+        """
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        headers = {'Accept': 'application/json'}
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, self._prefix + path, body=data, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+            except _STALE_ERRORS as error:
+                connection.close()
+                if reused:
+                    continue
+                raise RemoteEngineError('Cannot reach {0}: {1}'.format(self.url, error))
+            except (IOError, OSError, http.client.HTTPException) as error:
+                connection.close()
+                raise RemoteEngineError('Cannot reach {0}: {1}'.format(self.url, error))
+            break
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        try:
+            record = json.loads(content.decode('utf-8'), object_pairs_hook=OrderedDict) \
+                if content else {}
+        except ValueError:
+            raise RemoteEngineError('Invalid response from {0}: {1} {2}'.format(
+                self.url, response.status, content[:200]))
+        return response.status, response.headers, record
+
+    def get(self, path):
+        """
+        Sends a GET request and returns the decoded body of a successful
+        response.  Errors answered by the service are raised.
+        """
+        return self._checked(*self.request('GET', path))
+
+    def post(self, path, body):
+        """
+        Sends a POST request and returns the decoded body of a successful
+        response.  Errors answered by the service are raised.
+        """
+        return self._checked(*self.request('POST', path, body))
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    @staticmethod
+    def path(*parts):
+        """
+        Returns a URL path of quoted parts.
+        """
+        return '/' + '/'.join(quote(str(part), safe='') for part in parts)
+
+    @staticmethod
+    def _checked(status, headers, record):
+        if status == 503:
+            try:
+                retry_after = float(headers.get('Retry-After') or 1)
+            except ValueError:
+                retry_after = 1.0
+            raise RemoteServiceBusyError(record.get('error', ''), retry_after)
+        if status >= 400:
+            raise protocol.decode_error(record)
+        return record
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        if self._scheme == 'https':
+            connection = http.client.HTTPSConnection(self._host, self._port,
+                                                     timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self._host, self._port,
+                                                    timeout=self.timeout)
+        return connection, False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def __getstate__(self):
+        # Connections are not shared with copies
+        state = self.__dict__.copy()
+        state['_idle'] = []
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,70 @@
+"""
+Implements the engine class of the remote job service backend.
+"""
+from __future__ import absolute_import
+
+from ..decorators import memoize
+from ..engine import Engine as BaseEngine
+from .client import Client
+from .task import RemoteTask
+
+
+class RemoteEngine(BaseEngine):
+    """
+    An engine on the host of a remote job service, with the same API as the
+    Task Engine engine class.
+    """
+
+    def __init__(self, url, engine_name='ENVI', cwd=None, timeout=60.0, pool_size=8):
+        """
+        Returns a remote engine object.
+
+        :param url: The base URL of the job service, e.g. 'http://envi-host:8765'.
+        :param engine_name: A String specifying the name of the requested engine.
+        :param cwd: A String representing the working directory of the jobs
+                    on the host of the service.
+        :param timeout: The number of seconds to wait for the service to answer
+                        a request.
+        :param pool_size: The maximum number of idle connections to the service
+                          kept open.
+        :return: None
+        """
+        super(RemoteEngine, self).__init__(engine_name)
+        self._engine_name = engine_name
+        self._cwd = cwd
+        self._client = Client(url, timeout=timeout, pool_size=pool_size)
+
+    @property
+    def client(self):
+        """
+        The :class:`envipyengine.remote.client.Client` shared by the engine's tasks.
+        """
+        return self._client
+
+    def task(self, task_name):
+        """
+        Returns a remote Task object.
+
+        :param task_name: The name of the task to retrieve.
+        :return: A :class:`envipyengine.remote.RemoteTask` object.
+        """
+        return RemoteTask(uri=':'.join((self._engine_name, task_name)), cwd=self._cwd,
+                          client=self._client)
+
+    @memoize
+    def tasks(self):
+        """
+        Returns a list of all tasks known to the remote engine.
+
+        :return: A list of task names.
+        """
+        return self._client.get(Client.path('engines', self._engine_name, 'tasks'))['tasks']
+
+    @property
+    def name(self):
+        """
+        Returns the name of the task engine associated with the Engine.
+
+        :return: The task engine name (i.e. ENVI, IDL, etc.)
+        """
+        return self._engine_name
@@ -0,0 +1,97 @@
+"""
+Defines the HTTP/JSON messages exchanged by the job service and its clients.
+
+==================================================== ======= ===================================
+Path                                                 Method  Response
+==================================================== ======= ===================================
+/engines/<engine>/tasks                              GET     {"tasks": [<name>, ...]}
+/engines/<engine>/tasks/<task>                       GET     {"definition": <taskinfo>}
+/engines/<engine>/tasks/<task>/jobs                  POST    A job record, with status 200 if
+                                                             the job finished within its wait
+                                                             time, otherwise 202 and the
+                                                             job URL in the Location header.
+/engines/<engine>/tasks/<task>/estimate              POST    {"estimate": <estimate or null>}
+/jobs/<id>?wait=<seconds>                            GET     The job record, once the job
+                                                             finished or the wait time passed.
+==================================================== ======= ===================================
+
+A job is submitted with a body of ``{"parameters": {...}, "options": {...},
+"wait": <seconds>}``, where the options are keywords of ``Task.execute``.
+A job record holds the job ``id``, its ``status`` and ``url``.  Once the job
+has finished, it holds the ``result`` and ``resources`` of a job that
+succeeded, or the ``error`` and ``error_type`` of a job that failed.
+
+Requests that fail, other than jobs, are answered with a 4xx or 5xx status and
+a body of ``{"error": <message>, "error_type": <exception class name>}``.
+"""
+from __future__ import absolute_import
+
+from .. import error as errors
+from ..taskengine.profiling import TaskProfile
+from ..taskengine.resources import ResourceUsage
+from ..taskengine.taskengine import TaskResult
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+OPTIONS = ('cwd', 'rss_interval', 'timeout', 'isolate', 'collect', 'coalesce', 'profiler',
+           'placement', 'limits', 'threads')
+"""The keywords of Task.execute a job may set."""
+
+# Exceptions re-raised by clients with their original type
+_ERRORS = dict((cls.__name__, cls) for cls in (
+    errors.TaskEngineNotFoundError, errors.TaskEngineExecutionError,
+    errors.TaskEngineTimeoutError, errors.TaskEngineLimitError, errors.NoConfigOptionError))
+
+
+def encode_error(error):
+    """
+    Returns the record of an exception.
+    """
+    record = {'error': str(error), 'error_type': type(error).__name__}
+    if isinstance(error, errors.TaskEngineLimitError):
+        record['limit'] = error.limit
+        record['value'] = error.value
+    return record
+
+
+def decode_error(record):
+    """
+    Returns the exception of a record created by :func:`encode_error`.
+    Unknown exception types become a RemoteEngineError.
+    """
+    cls = _ERRORS.get(record.get('error_type'))
+    message = record.get('error', '')
+    if cls is None:
+        return errors.RemoteEngineError('{0}: {1}'.format(record.get('error_type'), message))
+    if cls is errors.TaskEngineLimitError:
+        return cls(message, limit=record.get('limit'), value=record.get('value'))
+    return cls(message)
+
+
+def encode_result(result):
+    """
+    Returns the record of a TaskResult, with its resource usage and profile.
+    """
+    record = {'result': result}
+    resources = getattr(result, 'resources', None)
+    if resources is not None:
+        record['resources'] = resources.as_dict()
+    profile = getattr(result, 'profile', None)
+    if profile is not None:
+        record['profile'] = profile.as_dict()
+    return record
+
+
+def decode_result(record):
+    """
+    Returns the TaskResult of a record created by :func:`encode_result`.
+    """
+    result = TaskResult(record['result'])
+    if record.get('resources') is not None:
+        result.resources = ResourceUsage.from_dict(record['resources'])
+    if record.get('profile') is not None:
+        result.profile = TaskProfile.from_dict(record['profile'])
+    return result
@@ -0,0 +1,387 @@
+"""
+The HTTP job service started by the ``envipyengine-serve`` command.
+"""
+from __future__ import absolute_import
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from ..taskengine import threads as thread_budget
+from ..taskengine.engine import Engine
+from . import protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+# Longest time a request waits for a job, so clients do not time out
+_MAX_WAIT = 30.0
+
+
+class ServiceBusyError(Exception):
+    """Raised when the job service cannot queue any more jobs."""
+    pass
+
+
+class _Job(object):
+    """
+    A job run by the job service.
+    """
+
+    def __init__(self, job_id, engine, task):
+        self.id = job_id
+        self.engine = engine
+        self.task = task
+        self.status = protocol.QUEUED
+        self.record = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def as_dict(self):
+        """
+        Returns the job record sent to clients.
+        """
+        record = {'id': self.id, 'status': self.status, 'url': '/jobs/' + self.id}
+        if self.record is not None:
+            record.update(self.record)
+        return record
+
+
+class JobService(object):
+    """
+    Runs jobs on the local engine in a bounded pool of threads.
+
+    :param max_workers: The number of jobs run concurrently.  Defaults to the
+                        number of CPU cores.
+    :param max_queued: The number of jobs that may wait for a free worker.
+                       Further jobs are refused.  Defaults to four times
+                       max_workers.
+    :param wait: The default number of seconds a job submission waits for the
+                 job to finish before it is answered with 202.
+    :param retention: The number of seconds the records of finished jobs are kept.
+    :param cwd: Optionally specify the working directory of jobs that do not
+                set one.
+    """
+
+    def __init__(self, max_workers=None, max_queued=None, wait=5.0, retention=3600.0,
+                 cwd=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queued = 4 * self.max_workers if max_queued is None else max_queued
+        self.wait = wait
+        self.retention = retention
+        self.cwd = cwd
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._engines = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def engine(self, name):
+        """
+        Returns the Engine object of an engine name.
+        """
+        with self._lock:
+            if name not in self._engines:
+                self._engines[name] = Engine(name, cwd=self.cwd)
+            return self._engines[name]
+
+    def tasks(self, engine):
+        """
+        Returns the task names of an engine.
+        """
+        return self.engine(engine).tasks()
+
+    def taskinfo(self, engine, task):
+        """
+        Returns the normalized definition of a task.
+        """
+        return self.engine(engine).task(task).taskinfo()
+
+    def estimate(self, engine, task, parameters):
+        """
+        Returns the estimate of a job from the history store of the service.
+        """
+        return self.engine(engine).task(task).estimate(parameters)
+
+    def submit(self, engine, task, parameters, options=None):
+        """
+        Queues a job.
+
+        :param engine: The engine name.
+        :param task: The task name.
+        :param parameters: The input parameters.
+        :param options: Optionally specify a dictionary of Task.execute keywords.
+        :return: The job.
+        """
+        options = dict((name, value) for name, value in (options or {}).items()
+                       if name in protocol.OPTIONS)
+        options.setdefault('threads', thread_budget.budget(self.max_workers))
+        job = _Job(uuid.uuid4().hex, engine, task)
+        with self._lock:
+            self._expire()
+            pending = sum(1 for queued in self._jobs.values() if not queued.done.is_set())
+            if pending >= self.max_workers + self.max_queued:
+                raise ServiceBusyError('{0} jobs are pending'.format(pending))
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, parameters, options)
+        return job
+
+    def job(self, job_id):
+        """
+        Returns a job by its id, or None if it is not known.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        """
+        Stops running jobs.
+
+        :param wait: Set to False to return without waiting for running jobs.
+        """
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, parameters, options):
+        job.status = protocol.RUNNING
+        try:
+            result = self.engine(job.engine).task(job.task).execute(parameters, **options)
+        except Exception as error:  # pylint: disable=broad-except
+            job.record = protocol.encode_error(error)
+            job.status = protocol.FAILED
+        else:
+            job.record = protocol.encode_result(result)
+            job.status = protocol.SUCCEEDED
+        job.finished = time.time()
+        job.done.set()
+
+    def _expire(self):
+        """
+        Forgets finished jobs older than the retention time.  Called with the lock held.
+        """
+        expired = time.time() - self.retention
+        for job_id in [job.id for job in self._jobs.values()
+                       if job.finished is not None and job.finished < expired]:
+            del self._jobs[job_id]
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """
+    The HTTP server of a job service.  Each connection is handled on its own
+    thread and kept alive between requests.
+
+    :param address: A tuple of the host and port to listen on.  Port 0 picks
+                    a free port.
+    :param service: The :class:`JobService` running the jobs.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, _Handler)
+        self.service = service
+        self.connections = 0
+        self._connection_ids = itertools.count(1)
+
+    @property
+    def url(self):
+        """
+        The base URL of the service.
+        """
+        host, port = self.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def connected(self):
+        """
+        Counts a new client connection.
+        """
+        self.connections = next(self._connection_ids)
+
+
+_ROUTES = (
+    ('GET', re.compile(r'^/engines/([^/]+)/tasks$'), '_tasks'),
+    ('GET', re.compile(r'^/engines/([^/]+)/tasks/([^/]+)$'), '_taskinfo'),
+    ('POST', re.compile(r'^/engines/([^/]+)/tasks/([^/]+)/jobs$'), '_submit'),
+    ('POST', re.compile(r'^/engines/([^/]+)/tasks/([^/]+)/estimate$'), '_estimate'),
+    ('GET', re.compile(r'^/jobs/([^/]+)$'), '_job'),
+)
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, error, headers=None):
+        super(_HTTPError, self).__init__(str(error))
+        self.status = status
+        self.error = error
+        self.headers = headers or {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Answers the requests of the job service, see :mod:`envipyengine.remote.protocol`.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'envipyengine'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connected()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        _LOGGER.debug('%s %s', self.address_string(), format % args)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        try:
+            body = self._body()
+            for route_method, pattern, name in _ROUTES:
+                match = pattern.match(url.path)
+                if match:
+                    if route_method != method:
+                        raise _HTTPError(405, 'Method not allowed', {'Allow': route_method})
+                    arguments = [unquote(group) for group in match.groups()]
+                    status, record, headers = getattr(self, name)(body, *arguments)
+                    break
+            else:
+                raise _HTTPError(404, 'Not found: ' + url.path)
+        except _HTTPError as error:
+            status, headers = error.status, error.headers
+            record = {'error': str(error.error), 'error_type': 'HTTPError'}
+        except ServiceBusyError as error:
+            status, headers = 503, {'Retry-After': '1'}
+            record = {'error': str(error), 'error_type': 'ServiceBusyError'}
+        except Exception as error:  # pylint: disable=broad-except
+            status, headers = 500, {}
+            record = protocol.encode_error(error)
+        self._respond(status, record, headers)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as error:
+            raise _HTTPError(400, 'Invalid JSON body: {0}'.format(error))
+
+    def _respond(self, status, record, headers):
+        data = json.dumps(record).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _wait_time(self, value, default):
+        try:
+            wait = float(default if value is None else value)
+        except (TypeError, ValueError):
+            raise _HTTPError(400, 'Invalid wait time: {0}'.format(value))
+        return min(max(wait, 0.0), _MAX_WAIT)
+
+    def _tasks(self, body, engine):  # pylint: disable=unused-argument
+        return 200, {'tasks': self.server.service.tasks(engine)}, {}
+
+    def _taskinfo(self, body, engine, task):  # pylint: disable=unused-argument
+        return 200, {'definition': self.server.service.taskinfo(engine, task)}, {}
+
+    def _estimate(self, body, engine, task):
+        estimate = self.server.service.estimate(engine, task, body.get('parameters') or {})
+        return 200, {'estimate': None if estimate is None else estimate._asdict()}, {}
+
+    def _submit(self, body, engine, task):
+        if not isinstance(body.get('parameters', {}), dict):
+            raise _HTTPError(400, 'Parameters must be an object')
+        service = self.server.service
+        job = service.submit(engine, task, body.get('parameters') or {}, body.get('options'))
+        return self._job_response(job, self._wait_time(body.get('wait'), service.wait))
+
+    def _job(self, body, job_id):  # pylint: disable=unused-argument
+        job = self.server.service.job(job_id)
+        if job is None:
+            raise _HTTPError(404, 'Unknown job: ' + job_id)
+        wait = self._wait_time(self.query.get('wait', [0])[0], 0)
+        status, record, _ = self._job_response(job, wait)
+        return 200, record, {}
+
+    @staticmethod
+    def _job_response(job, wait):
+        if wait:
+            job.done.wait(wait)
+        record = job.as_dict()
+        if job.done.is_set():
+            return 200, record, {}
+        return 202, record, {'Location': record['url']}
+
+
+def serve(host='127.0.0.1', port=8765, **kwargs):
+    """
+    Creates a job service and its HTTP server.  Call ``serve_forever`` on the
+    returned server to answer requests.
+
+    :param host: The host name or address to listen on.
+    :param port: The port to listen on, or 0 for a free port.
+    :param kwargs: Keywords passed to :class:`JobService`.
+    :return: The :class:`Server`.
+    """
+    return Server((host, port), JobService(**kwargs))
+
+
+def main(argv=None):
+    """
+    Entry point of the envipyengine-serve command.
+    """
+    parser = argparse.ArgumentParser(
+        description='Serves envipyengine tasks and jobs over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='the address to listen on, defaults to 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='the port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of concurrent jobs, defaults to the CPU count')
+    parser.add_argument('--queue', type=int, default=None,
+                        help='number of jobs that may wait for a worker, '
+                             'defaults to four per worker')
+    parser.add_argument('--wait', type=float, default=5.0,
+                        help='seconds a job submission waits for the result before '
+                             'answering with a status URL')
+    parser.add_argument('--cwd', help='working directory of jobs that do not set one')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log each request')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    server = serve(args.host, args.port, max_workers=args.workers, max_queued=args.queue,
+                   wait=args.wait, cwd=args.cwd)
+
+    def _shutdown(signum, frame):  # pylint: disable=unused-argument
+        _LOGGER.warning('Stopping after running jobs finish')
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    _LOGGER.warning('Serving on %s', server.url)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Implements the task class of the remote job service backend.
+"""
+from __future__ import absolute_import
+
+import time
+
+from ..decorators import memoize
+from ..error import RemoteServiceBusyError, TaskEngineExecutionError
+from ..error import TaskEngineTimeoutError
+from ..history import Estimate
+from ..task import Task as BaseTask
+from ..taskengine import taskengine
+from . import protocol
+from .client import Client
+
+# Seconds each status request waits for a running job
+_POLL_WAIT = 20.0
+
+
+class RemoteTask(BaseTask):
+    """
+    A task run by a remote job service, with the same API as the Task Engine
+    task class.
+
+    :param uri: The task uri, e.g. 'ENVI:SpectralIndex'.
+    :param cwd: Optionally specify the working directory of the jobs on the
+                host of the service.
+    :param client: The :class:`envipyengine.remote.client.Client` of the service,
+                   or its URL.
+    """
+
+    def __init__(self, uri=None, cwd=None, client=None):
+        super(RemoteTask, self).__init__(uri=uri, cwd=cwd)
+        self._engine, self._name = self._uri.split(':')
+        self._client = client if isinstance(client, Client) else Client(client)
+
+    @property
+    def name(self):
+        return str(self.taskinfo()['name'])
+
+    @property
+    def display_name(self):
+        return str(self.taskinfo()['displayName'])
+
+    @property
+    def description(self):
+        return str(self.taskinfo()['description'])
+
+    @property
+    def uri(self):
+        return ':'.join((self._engine, self._name))
+
+    @property
+    def engine(self):
+        """ Return the engine name of this Task object """
+        return self._engine
+
+    @property
+    def parameters(self):
+        return self.taskinfo()['parameters']
+
+    @memoize
+    def taskinfo(self):
+        """ Retrieve the Task Information
+        """
+        record = self._client.get(Client.path('engines', self._engine, 'tasks', self._name))
+        return record['definition']
+
+    def execute(self, parameters, cwd=None, rss_interval=None, timeout=None,
+                isolate=None, collect=None, coalesce=None, profiler=False, placement=None,
+                limits=None, threads=None):
+        options = {'cwd': cwd or self._cwd, 'rss_interval': rss_interval, 'timeout': timeout,
+                   'isolate': isolate, 'collect': collect, 'coalesce': coalesce,
+                   'profiler': profiler, 'placement': placement, 'limits': limits,
+                   'threads': threads}
+        record = self._submit(parameters, options, _POLL_WAIT)
+        return self._result(self._wait(record))
+
+    def estimate(self, parameters):
+        record = self._client.post(
+            Client.path('engines', self._engine, 'tasks', self._name, 'estimate'),
+            {'parameters': parameters})
+        estimate = record['estimate']
+        return None if estimate is None else Estimate(**estimate)
+
+    def execute_batch(self, parameters_list, cwd=None, timeout=None):
+        # The jobs share the timeout of the batch, each one is submitted with
+        # the time left so the service stops it at the deadline
+        deadline = None if timeout is None else time.time() + timeout
+        records = []
+        for parameters in parameters_list:
+            while True:
+                options = {'cwd': cwd or self._cwd, 'timeout': taskengine.remaining(deadline)}
+                try:
+                    records.append(self._submit(parameters, options, 0))
+                    break
+                except RemoteServiceBusyError as error:
+                    # Wait for a job of the batch to free its slot, or as long
+                    # as the service asks if none of them is still pending
+                    pending = [index for index, record in enumerate(records)
+                               if record['status'] not in (protocol.SUCCEEDED, protocol.FAILED)]
+                    if pending:
+                        records[pending[0]] = self._wait(records[pending[0]], deadline)
+                    elif deadline is None:
+                        time.sleep(error.retry_after)
+                    else:
+                        time.sleep(min(error.retry_after, taskengine.remaining(deadline)))
+        results = []
+        for record in records:
+            try:
+                results.append(self._result(self._wait(record, deadline)))
+            except TaskEngineTimeoutError:
+                raise
+            except TaskEngineExecutionError as error:
+                results.append(error)
+        return results
+
+    def _submit(self, parameters, options, wait):
+        options = dict((name, value) for name, value in options.items()
+                       if value is not None and value is not False)
+        return self._client.post(
+            Client.path('engines', self._engine, 'tasks', self._name, 'jobs'),
+            {'parameters': parameters, 'options': options, 'wait': wait})
+
+    def _wait(self, record, deadline=None):
+        """
+        Polls the service until the job of a record has finished, raising a
+        TaskEngineTimeoutError if it is still running at the deadline.
+        """
+        while record['status'] not in (protocol.SUCCEEDED, protocol.FAILED):
+            wait = _POLL_WAIT
+            if deadline is not None:
+                wait = min(wait, taskengine.remaining(deadline))
+            record = self._client.get('{0}?wait={1}'.format(record['url'], wait))
+        return record
+
+    @staticmethod
+    def _result(record):
+        if record['status'] == protocol.FAILED:
+            raise protocol.decode_error(record)
+        return protocol.decode_result(record)
+
+    def __getstate__(self):
+        # Carry the definition so the copy does not request it again
+        state = self.__dict__.copy()
+        state['_taskinfo'] = RemoteTask.taskinfo.cache.get((self,))
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        info = state.pop('_taskinfo', None)
+        self.__dict__.update(state)
+        if info is not None:
+            RemoteTask.taskinfo.cache[(self,)] = info
@@ -0,0 +1,304 @@
+"""
+The scheduler module admits task engine jobs within node resource budgets.
+
+Running many engine processes at once can oversubscribe memory or exhaust the
+available ENVI license seats, and jobs then fail partway through.  A
+:class:`Scheduler` only starts a job when its cost in memory, CPU cores and
+license seats fits within the configured budgets.  Jobs that do not fit wait in
+first-in, first-out order until enough running jobs have finished.
+
+The cost of a job is taken, in order of precedence, from the cost passed when
+submitting it, from the scheduler's estimator, from the per-task-name cost
+table and finally from the default cost of one CPU core and one license seat.
+
+The budgets default to the ``scheduler-memory``, ``scheduler-cpus`` and
+``scheduler-license-seats`` config options.  Memory budgets and costs accept
+sizes such as '512M' or '16G'.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> from envipyengine.scheduler import Scheduler, Cost
+>>> scheduler = Scheduler(memory='64G', cpus=32, seats=4,
+                          costs={'SpectralIndex': Cost(memory='2G', cpus=1),
+                                 'ISODATAClassification': Cost(memory='12G', cpus=4)})
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> futures = [scheduler.submit(task, parameters) for parameters in jobs]
+>>> results = [future.result() for future in futures]
+>>> scheduler.in_use
+Cost(memory=0, cpus=0, seats=0)
+
+"""
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .error import SchedulerError
+from .utils import parse_size
+
+
+class Cost(object):
+    """
+    The resources a job needs while it runs.
+
+    :param memory: Bytes of memory, or a size string such as '4G'.
+    :param cpus: Number of CPU cores.
+    :param seats: Number of license seats.
+
+    When used as a budget, a value of None means unlimited.
+    """
+    __slots__ = ('memory', 'cpus', 'seats')
+
+    def __init__(self, memory=0, cpus=1, seats=1):
+        self.memory = parse_size(memory)
+        self.cpus = cpus
+        self.seats = seats
+
+    @classmethod
+    def create(cls, value):
+        """
+        Returns a Cost from a Cost object or a dictionary of keywords.
+        """
+        if value is None or isinstance(value, Cost):
+            return value
+        return cls(**value)
+
+    def __add__(self, other):
+        return Cost((self.memory or 0) + (other.memory or 0),
+                    (self.cpus or 0) + (other.cpus or 0),
+                    (self.seats or 0) + (other.seats or 0))
+
+    def __sub__(self, other):
+        return Cost((self.memory or 0) - (other.memory or 0),
+                    (self.cpus or 0) - (other.cpus or 0),
+                    (self.seats or 0) - (other.seats or 0))
+
+    def __eq__(self, other):
+        return isinstance(other, Cost) and \
+            (self.memory, self.cpus, self.seats) == (other.memory, other.cpus, other.seats)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'Cost(memory={0}, cpus={1}, seats={2})'.format(
+            self.memory, self.cpus, self.seats)
+
+
+class Scheduler(object):
+    """
+    Admits jobs only when their cost fits within the node budgets.
+
+    :param memory: The memory budget in bytes or as a size string.  Defaults
+                   to the 'scheduler-memory' config option, or no limit.
+    :param cpus: The CPU core budget.  Defaults to the 'scheduler-cpus' config
+                 option, or the number of CPU cores of the node.
+    :param seats: The license seat budget.  Defaults to the
+                  'scheduler-license-seats' config option, or no limit.
+    :param costs: A dictionary mapping task names to their :class:`Cost`.
+    :param default_cost: The cost of tasks not in the cost table.
+    :param estimator: Optionally specify a function called with the task and
+                      parameters that returns a :class:`Cost` or None.
+    :param max_workers: The maximum number of threads running submitted jobs.
+    """
+
+    def __init__(self, memory=None, cpus=None, seats=None, costs=None,
+                 default_cost=None, estimator=None, max_workers=None):
+        if memory is None:
+            memory = config.get('scheduler-memory', default=None)
+        if cpus is None:
+            cpus = config.get('scheduler-cpus', default=None) or os.cpu_count() or 1
+        if seats is None:
+            seats = config.get('scheduler-license-seats', default=None)
+
+        self.budget = Cost(memory=memory or None,
+                           cpus=int(cpus),
+                           seats=int(seats) if seats else None)
+        self.costs = dict((name, Cost.create(cost)) for name, cost in (costs or {}).items())
+        self.default_cost = Cost.create(default_cost) or Cost()
+        self.estimator = estimator
+        self.max_workers = max_workers or 64
+
+        self._in_use = Cost(0, 0, 0)
+        self._running = 0
+        self._waiting = collections.deque()
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = None
+
+    @property
+    def in_use(self):
+        """
+        The :class:`Cost` of the jobs currently running.
+        """
+        with self._condition:
+            return Cost(self._in_use.memory, self._in_use.cpus, self._in_use.seats)
+
+    @property
+    def available(self):
+        """
+        The :class:`Cost` still available.  Unlimited budgets are None.
+        """
+        with self._condition:
+            in_use = self._in_use
+            return Cost(
+                None if self.budget.memory is None else self.budget.memory - in_use.memory,
+                self.budget.cpus - in_use.cpus,
+                None if self.budget.seats is None else self.budget.seats - in_use.seats)
+
+    @property
+    def running(self):
+        """
+        The number of jobs currently running.
+        """
+        return self._running
+
+    @property
+    def queued(self):
+        """
+        The number of jobs waiting to be admitted.
+        """
+        return len(self._waiting)
+
+    def set_cost(self, task_name, cost):
+        """
+        Sets the default cost of a task.
+
+        :param task_name: The name of the task.
+        :param cost: A :class:`Cost` or a dictionary of Cost keywords.
+        """
+        self.costs[task_name] = Cost.create(cost)
+
+    def cost(self, task, parameters=None, cost=None):
+        """
+        Returns the cost of running a task.
+
+        :param task: An ENVI Py Engine Task object.
+        :param parameters: The job parameters passed to the estimator.
+        :param cost: An explicit cost which takes precedence.
+        :return: A :class:`Cost` object.
+        """
+        if cost is not None:
+            return Cost.create(cost)
+        if self.estimator is not None:
+            estimate = self.estimator(task, parameters)
+            if estimate is not None:
+                return Cost.create(estimate)
+        return self.costs.get(_task_name(task), self.default_cost)
+
+    @contextlib.contextmanager
+    def reserve(self, cost):
+        """
+        Context manager that blocks until the cost fits within the budgets and
+        holds the resources until the block exits.
+
+        :param cost: The :class:`Cost` to reserve.
+        """
+        cost = Cost.create(cost)
+        self._check(cost)
+        ticket = next(self._tickets)
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                while self._waiting[0] != ticket or not self._fits(cost):
+                    self._condition.wait()
+            finally:
+                self._waiting.remove(ticket)
+            self._in_use = self._in_use + cost
+            self._running += 1
+            # The next job in line may fit as well
+            self._condition.notify_all()
+        try:
+            yield cost
+        finally:
+            with self._condition:
+                self._in_use = self._in_use - cost
+                self._running -= 1
+                self._condition.notify_all()
+
+    def execute(self, task, parameters, cost=None, **kwargs):
+        """
+        Executes a task once its cost fits within the budgets.  Blocks until
+        the job has finished.
+
+        :param task: An ENVI Py Engine Task object.
+        :param parameters: The job input parameters.
+        :param cost: Optionally specify the :class:`Cost` of the job.
+        :param kwargs: Additional keywords passed to Task.execute.  Unless the
+                       'threads' keyword is given, the engine may use as many
+                       threads as the job's cost has CPU cores.
+        :return: The result of Task.execute.
+        """
+        with self.reserve(self.cost(task, parameters, cost)) as reserved:
+            if reserved.cpus:
+                kwargs.setdefault('threads', reserved.cpus)
+            return task.execute(parameters, **kwargs)
+
+    def submit(self, task, parameters, cost=None, **kwargs):
+        """
+        Queues a task for execution and returns immediately.
+
+        :param task: An ENVI Py Engine Task object.
+        :param parameters: The job input parameters.
+        :param cost: Optionally specify the :class:`Cost` of the job.
+        :param kwargs: Additional keywords passed to Task.execute.
+        :return: A concurrent.futures.Future for the result of Task.execute.
+        """
+        job_cost = self.cost(task, parameters, cost)
+        self._check(job_cost)
+        with self._condition:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+        return executor.submit(self.execute, task, parameters, job_cost, **kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting jobs and releases the worker threads.
+
+        :param wait: Set to False to return without waiting for queued jobs.
+        """
+        with self._condition:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        return False
+
+    def _fits(self, cost, in_use=None):
+        """
+        Returns True if the cost fits in what is left of the budgets.
+        """
+        total = (self._in_use if in_use is None else in_use) + cost
+        return (self.budget.memory is None or total.memory <= self.budget.memory) and \
+            total.cpus <= self.budget.cpus and \
+            (self.budget.seats is None or total.seats <= self.budget.seats)
+
+    def _check(self, cost):
+        """
+        Raises a SchedulerError if the cost exceeds the budgets even on an idle node.
+        """
+        if not self._fits(cost, Cost(0, 0, 0)):
+            raise SchedulerError(
+                'Job cost {0!r} exceeds the scheduler budget {1!r}'.format(cost, self.budget))
+
+
+def _task_name(task):
+    """
+    Returns the task name from a Task object without querying the engine.
+    """
+    uri = getattr(task, 'uri', None)
+    if uri:
+        return uri.split(':', 1)[-1]
+    return task.name
@@ -0,0 +1,279 @@
+"""
+The scratch module manages temporary task outputs on a fast local filesystem.
+
+Task parameters flagged as ``is_temporary`` in the task information are
+intermediate files such as ``OUTPUT_RASTER_URI``.  When they are not specified,
+the engine writes them to its own temporary directory, which is often on slow
+shared storage and never cleaned up.  A :class:`ScratchSpace` assigns these
+parameters to unique paths within a configurable scratch directory, tracks them
+per owner (a job or a pipeline node) and deletes them once the last consumer
+has released them.
+
+The scratch directory, quota and keep behavior default to the ``scratch-dir``,
+``scratch-quota`` and ``scratch-keep`` configuration properties.
+
+The quota is a soft limit.  It is checked against the bytes on disk when
+paths are allocated, before the engine writes to them, so jobs allocating at
+the same time can together exceed it by the size of their outputs.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> from envipyengine.scratch import ScratchSpace
+>>> scratch = ScratchSpace('/dev/shm/envipyengine', quota=8 * 1024 ** 3)
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> with scratch.job() as job:
+...     parameters = scratch.assign(task, dict(INPUT_RASTER=input_raster), owner=job)
+...     result = task.execute(parameters)
+...     # use the intermediate output before the block exits
+
+Scratch space can also be given to a :class:`envipyengine.pipeline.Pipeline`,
+which assigns the temporary outputs of every intermediate node and releases
+them once all downstream nodes have completed.
+
+"""
+from __future__ import absolute_import
+
+import contextlib
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from . import config
+from . import utils
+from .error import ScratchQuotaExceededError
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ScratchSpace(object):
+    """
+    Assigns and tracks temporary task outputs within a scratch directory.
+
+    :param root: The scratch directory.  Defaults to the ``scratch-dir`` config
+                 option or a directory within the system temporary directory.
+    :param quota: The maximum number of bytes the scratch space may hold, as
+                  a number or a size such as '8G'.  Defaults to the
+                  ``scratch-quota`` config option or no quota.
+    :param keep: Set to True to keep released files for debugging.  Defaults
+                 to the ``scratch-keep`` config option.
+    """
+
+    def __init__(self, root=None, quota=None, keep=None):
+        if root is None:
+            root = config.get('scratch-dir', default=None) or \
+                os.path.join(tempfile.gettempdir(), 'envipyengine-scratch')
+        if quota is None:
+            quota = config.get('scratch-quota', default=None)
+        if keep is None:
+            keep = config.get_boolean('scratch-keep')
+
+        self.root = os.path.abspath(root)
+        self.quota = utils.parse_size(quota) if quota else None
+        self.keep = keep
+        self._session = os.path.join(self.root, uuid.uuid4().hex)
+        self._allocations = {}
+        self._references = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def allocate(self, owner, name, extension=None, directory=False):
+        """
+        Returns a new unique path within the scratch space for an owner.
+
+        :param owner: A hashable value identifying the job or pipeline node
+                      that owns the allocation.
+        :param name: A name used to build the file name, usually the parameter name.
+        :param extension: Optionally specify the file extension, e.g. '.dat'.
+        :param directory: Set to True to create the path as a directory.
+        :return: The absolute path of the allocation.
+        """
+        self._check_quota()
+        return self._allocate(owner, name, extension, directory)
+
+    def _allocate(self, owner, name, extension, directory):
+        with self._lock:
+            owner_dir = os.path.join(self._session, _safe_name(owner))
+            filename = '{0}_{1}{2}'.format(_safe_name(name).lower(),
+                                           next(self._counter),
+                                           extension or '')
+            path = os.path.join(owner_dir, filename)
+            self._allocations.setdefault(owner, []).append(path)
+
+        if not os.path.isdir(owner_dir):
+            os.makedirs(owner_dir)
+        if directory:
+            os.makedirs(path)
+        return path
+
+    def assign(self, task, parameters, owner=None):
+        """
+        Returns a copy of the parameters with every unspecified temporary input
+        parameter of the task assigned to a path in the scratch space.
+
+        Any previous allocations of the owner are discarded first, so assigning
+        again for a retried job does not leave stale files behind.
+
+        :param task: The ENVI Py Engine Task object the parameters are for.
+        :param parameters: A dictionary of input parameters.
+        :param owner: The owner of the allocations.  Defaults to a new unique owner.
+        :return: A new dictionary of input parameters.
+        """
+        owner = owner if owner is not None else uuid.uuid4().hex
+        self.discard(owner)
+
+        assigned = dict(parameters or {})
+        specified = set(name.upper() for name in assigned)
+        temporary = [parameter for parameter in task.parameters
+                     if parameter.get('is_temporary') and
+                     parameter.get('direction', 'input') == 'input' and
+                     parameter['name'].upper() not in specified]
+        if temporary:
+            # One usage scan covers all parameters of the job
+            self._check_quota()
+        for parameter in temporary:
+            assigned[parameter['name']] = self._allocate(
+                owner, parameter['name'], parameter.get('auto_extension'),
+                bool(parameter.get('is_directory')))
+        return assigned
+
+    def allocations(self, owner):
+        """
+        Returns the paths allocated to an owner.
+
+        :param owner: The owner of the allocations.
+        :return: A list of paths.
+        """
+        with self._lock:
+            return list(self._allocations.get(owner, []))
+
+    def retain(self, owner, count=1):
+        """
+        Registers consumers of an owner's allocations.  The allocations are
+        deleted once every consumer has called :meth:`release`.
+
+        :param owner: The owner of the allocations.
+        :param count: The number of consumers to add.
+        """
+        with self._lock:
+            self._references[owner] = self._references.get(owner, 0) + count
+
+    def release(self, owner):
+        """
+        Releases one consumer of an owner's allocations.  When no consumers
+        remain, the allocations are discarded.
+
+        :param owner: The owner of the allocations.
+        """
+        with self._lock:
+            remaining = self._references.get(owner, 0) - 1
+            if remaining > 0:
+                self._references[owner] = remaining
+                return
+            self._references.pop(owner, None)
+        self.discard(owner)
+
+    def discard(self, owner):
+        """
+        Deletes all allocations of an owner regardless of remaining consumers.
+        If the scratch space keeps files, the allocations are only untracked.
+
+        :param owner: The owner of the allocations.
+        """
+        with self._lock:
+            paths = self._allocations.pop(owner, [])
+            self._references.pop(owner, None)
+        for path in paths:
+            if self.keep:
+                _LOGGER.debug('Keeping scratch file %s', path)
+            else:
+                _remove(path)
+
+    def cleanup(self):
+        """
+        Discards the allocations of every owner and removes the session directory.
+        """
+        with self._lock:
+            owners = list(self._allocations)
+        for owner in owners:
+            self.discard(owner)
+        if not self.keep and os.path.isdir(self._session):
+            shutil.rmtree(self._session, ignore_errors=True)
+
+    def usage(self):
+        """
+        Returns the number of bytes currently held by the scratch space,
+        including released files kept for debugging.  The session directory
+        is scanned once, so the cost grows with the number of files rather
+        than with the number of allocations times their directory sizes.
+
+        :return: An integer number of bytes.
+        """
+        return _disk_usage(self._session)
+
+    def _check_quota(self):
+        if self.quota is None:
+            return
+        usage = self.usage()
+        if usage >= self.quota:
+            raise ScratchQuotaExceededError(
+                'Scratch space quota of {0} bytes exceeded ({1} bytes in use)'.format(
+                    self.quota, usage))
+
+    @contextlib.contextmanager
+    def job(self, owner=None):
+        """
+        Context manager that discards an owner's allocations on exit.
+
+        :param owner: The owner of the allocations.  Defaults to a new unique owner.
+        :return: The owner.
+        """
+        owner = owner if owner is not None else uuid.uuid4().hex
+        try:
+            yield owner
+        finally:
+            self.discard(owner)
+
+
+def _safe_name(value):
+    """
+    Returns a string usable as a single path component.
+    """
+    if isinstance(value, tuple):
+        value = '-'.join(str(item) for item in value)
+    return ''.join(char if char.isalnum() or char in '-_.' else '_'
+                   for char in str(value))
+
+
+def _disk_usage(directory):
+    """
+    Returns the size in bytes of the files below a directory.  Files removed
+    while it is scanned are skipped.
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    """
+    Removes an allocation and its auxiliary files, along with the owner
+    directory once it is empty.
+    """
+    for candidate in utils.related_paths(path):
+        if os.path.isdir(candidate):
+            shutil.rmtree(candidate, ignore_errors=True)
+        else:
+            os.remove(candidate)
+    directory = os.path.dirname(path)
+    if os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
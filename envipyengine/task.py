@@ -144,12 +144,45 @@ parameters: ${parameters}
         pass
 
     @abstractmethod
-    def execute(self, parameters, cwd=None):
+    def execute(self, parameters, cwd=None, rss_interval=None, timeout=None,
+                isolate=None, collect=None, coalesce=None, profiler=False, placement=None,
+                limits=None, threads=None):
         """
         Executes a synchronous task using the Task Engine
 
         :param parameters: A dictionary of key-value pairs of parameter names and values. The dictionary serves as input to the job.
         :param cwd: Set to the current working directory the engine will run in.  Defaults to the python current working directory if none specified.
-        :return: A dictionary containing the Task Engine output.
+        :param rss_interval: Optionally sample the memory use of the engine process every rss_interval seconds while the job runs.
+        :param timeout: Optionally specify the number of seconds after which the engine is killed and a TaskEngineTimeoutError is raised.
+        :param isolate: Set to True to run the engine in a new working directory of its own.  Output files are moved to cwd afterwards.  Defaults to the 'workdir-isolation' config option.
+        :param collect: Optionally specify a list of glob patterns of additional files to move from the isolated working directory to cwd.
+        :param coalesce: Set to True to share the engine run of an identical job already in flight instead of spawning another.  Defaults to the 'coalesce' config option.
+        :param profiler: Set to True to run the task under the IDL profiler.  The ``profile`` attribute of the result then holds the calls and time of each IDL routine and the engine-side timestamps.
+        :param placement: Optionally specify the CPU cores and priorities of the engine process as a dictionary with 'cpus', 'nice' and 'ionice' keys.  It overrides the 'cpu-affinity', 'nice' and 'ionice' config options and profile properties.  See :mod:`envipyengine.taskengine.placement`.
+        :param limits: Optionally specify the resource limits of the engine process as a dictionary with 'memory', 'cpu_seconds' and 'open_files' keys.  They override the 'limit-memory', 'limit-cpu-seconds' and 'limit-open-files' config options and profile properties.  A job exceeding a limit raises a TaskEngineLimitError.  See :mod:`envipyengine.taskengine.limits`.
+        :param threads: Optionally specify the number of threads the engine may use, set as IDL_CPU_TPOOL_NTHREADS in its environment unless the 'engine-environment' config sets it.  See :mod:`envipyengine.taskengine.threads`.
+        :return: A dictionary containing the Task Engine output.  The ``resources`` attribute of the dictionary holds the resource usage of the engine process.
+        """
+        pass
+
+    @abstractmethod
+    def estimate(self, parameters):
+        """
+        Predicts the duration and peak memory of a job from the runs of the task recorded in the history store.  See :mod:`envipyengine.history`.
+
+        :param parameters: A dictionary of key-value pairs of parameter names and values.
+        :return: An Estimate with the duration in seconds, the memory in bytes and the number of past runs used, or None if the task has no recorded runs or the history is disabled.
+        """
+        pass
+
+    @abstractmethod
+    def execute_batch(self, parameters_list, cwd=None, timeout=None):
+        """
+        Executes the task once for each of a list of jobs in a single Task Engine run, amortizing the engine startup across the batch.  The jobs run one after the other and a failing job does not stop the others.  If the engine does not know the BatchExecute task, the jobs run in an engine run each, sharing the timeout.  Other errors of the batch as a whole, such as a resource limit or an engine crash, are raised.
+
+        :param parameters_list: A list of dictionaries of parameter names and values, one per job.
+        :param cwd: Set to the current working directory the engine will run in.  Defaults to the python current working directory if none specified.
+        :param timeout: Optionally specify the number of seconds after which the engine is killed and a TaskEngineTimeoutError is raised.
+        :return: A list with, for each job in order, either a dictionary containing the job output or the TaskEngineExecutionError the job failed with.
         """
         pass
@@ -1,28 +1,48 @@
 """
 The ENVI Py Engine object selects a task engine to use with ENVI Py
 """
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from . import taskengine
+from .. import catalog
 from ..decorators import memoize
-from .task import Task
+from ..error import TaskEngineExecutionError
+from .task import Task, normalize_definition
 from ..engine import Engine as BaseEngine
 
+_LOGGER = logging.getLogger(__name__)
+
 
 class Engine(BaseEngine):
     """
     The ENVI Py Engine Class.
     """
 
-    def __init__(self, engine_name, cwd=None):
+    def __init__(self, engine_name, cwd=None, isolate=None, profile=None, version=None):
         """
         Returns an ENVI Py Engine object based on the engine_name.
 
         :param engine_name: A String specifying the name of the requested engine.
+        :param cwd: A String representing the current working directory
+                    for the engine execution.
+        :param isolate: Set to True to execute each job of the engine's tasks in
+                        its own working directory.  Defaults to the
+                        'workdir-isolation' config option.
+        :param profile: Optionally specify the name of the engine profile to
+                        run all jobs on.
+        :param version: Optionally specify the version of the engine profiles
+                        to run all jobs on.
         :return: None
         """
         super(Engine, self).__init__(engine_name)
         self._engine_name = engine_name
         self._cwd = cwd
+        self._isolate = isolate
+        self._profile = profile
+        self._version = version
+        self._definitions = {}
+        self._query_tasks = None
 
     def task(self, task_name):
         """
@@ -31,7 +51,57 @@ class Engine(BaseEngine):
         :param task_name: The name of the task to retrieve.
         :return: An ENVI Py Engine Task object.
         """
-        return Task(uri=':'.join((self._engine_name, task_name)), cwd=self._cwd)
+        task = Task(uri=':'.join((self._engine_name, task_name)), cwd=self._cwd,
+                    isolate=self._isolate, profile=self._profile, version=self._version)
+        if task_name in self._definitions:
+            Task.taskinfo.cache[(task,)] = self._definitions[task_name]
+        return task
+
+    def definitions(self, task_names=None, max_workers=4):
+        """
+        Returns the definitions of tasks, as returned by ``Task.taskinfo()``.
+        The definitions are queried in a single engine run with the bundled
+        QueryTasks task.  If the engine cannot run it, each task is queried
+        with QueryTask instead.  Tasks returned by the ``task`` method
+        afterwards do not query their definition again.
+
+        :param task_names: Optionally specify a list of task names.  Defaults
+                           to all tasks known to the engine.
+        :param max_workers: The number of tasks queried concurrently when
+                            falling back to QueryTask.
+        :return: A dictionary of task names to normalized task definitions.
+        """
+        names = self.tasks() if task_names is None else list(task_names)
+        missing = [name for name in names if name not in self._definitions]
+        if missing:
+            self._definitions.update(self._query(missing, max_workers))
+        return dict((name, self._definitions[name]) for name in names)
+
+    def _query(self, missing, max_workers):
+        if self._query_tasks is not False:
+            # The names are passed explicitly, as the QueryTasks job runs with
+            # its own IDL_PATH and may not see every task of the catalog
+            task_input = {'taskName': 'QueryTasks',
+                          'inputParameters': {'TASK_NAMES': missing}}
+            try:
+                output = taskengine.execute(task_input, self._engine_name, cwd=self._cwd,
+                                            profile=self._profile, version=self._version)
+            except TaskEngineExecutionError as error:
+                # Only an engine without QueryTasks falls back, other errors
+                # such as an unknown task name are the caller's
+                if not taskengine.task_not_found(error, 'QueryTasks'):
+                    raise
+                _LOGGER.debug('QueryTasks is not available, using QueryTask: %s', error)
+                self._query_tasks = False
+            else:
+                self._query_tasks = True
+                definitions = output['outputParameters']['DEFINITIONS']
+                return dict((name, normalize_definition(definition))
+                            for name, definition in definitions.items())
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            infos = list(executor.map(lambda name: self.task(name).taskinfo(), missing))
+        return dict(zip(missing, infos))
 
     @memoize
     def tasks(self):
@@ -41,9 +111,42 @@ class Engine(BaseEngine):
         :return: A list of task names.
         """
         task_input = {'taskName': 'QueryTaskCatalog'}
-        output = taskengine.execute(task_input, self._engine_name, cwd=self._cwd)
+        output = taskengine.execute(task_input, self._engine_name, cwd=self._cwd,
+                                    profile=self._profile, version=self._version)
         return output['outputParameters']['TASKS']
 
+    @property
+    def catalog(self):
+        """
+        Returns the searchable catalog of all tasks known to the engine.  It is
+        loaded from the 'catalog-dir' directory, or built and saved there the
+        first time it is used.
+
+        :return: An :class:`envipyengine.catalog.Catalog` object.
+        """
+        return self._catalog()
+
+    @memoize
+    def _catalog(self):
+        return catalog.load_or_build(self, profile=self._profile, version=self._version)
+
+    def __getstate__(self):
+        # Carry the task list and catalog so the copy does not query them again
+        state = self.__dict__.copy()
+        state['_tasks'] = Engine.tasks.cache.get((self,))
+        state['_loaded_catalog'] = Engine._catalog.cache.get((self,))
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        tasks = state.pop('_tasks', None)
+        loaded_catalog = state.pop('_loaded_catalog', None)
+        self.__dict__.update(state)
+        if tasks is not None:
+            Engine.tasks.cache[(self,)] = tasks
+        if loaded_catalog is not None:
+            Engine._catalog.cache[(self,)] = loaded_catalog
+
     @property
     def name(self):
         """
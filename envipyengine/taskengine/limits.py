@@ -0,0 +1,362 @@
+"""
+Enforces per-job memory, CPU time and open file limits on engine processes.
+
+Limits are set by the 'limit-memory', 'limit-cpu-seconds' and
+'limit-open-files' config options, by the same properties of an engine
+profile, which take precedence, and per job with
+``Task.execute(parameters, limits={...})``, which takes precedence over both.
+
+============ =================== ==============================================
+Limit        Option              Description
+============ =================== ==============================================
+memory       limit-memory        Memory of the engine process, e.g. '8G'.
+cpu_seconds  limit-cpu-seconds   CPU seconds the engine process may use.
+open_files   limit-open-files    Number of files the engine may have open.
+============ =================== ==============================================
+
+``taskengine.execute`` applies the limits by running the engine through
+``prlimit``.  The memory limit then bounds the address space of the engine.
+When ``prlimit`` is not installed, the limits are set with
+``resource.setrlimit`` in the forked engine process before the engine
+executable is started instead.  This needs a ``preexec_fn``, which stops
+``subprocess`` from spawning the engine with ``vfork`` or ``posix_spawn``, so
+every spawn copies the page tables of the Python process.
+
+With the 'limit-backend' config option set to 'cgroup', the memory limit is
+enforced by a cgroup v2 memory controller instead, which bounds the memory
+actually used rather than the address space.  Each job gets its own cgroup
+below the 'cgroup-root' directory, which the engine joins through a shell
+started ahead of it.  'cgroup-root' must be a cgroup delegated to the
+user running envipyengine with the memory controller enabled in its
+cgroup.subtree_control.  Set 'limit-backend' to 'auto' to use cgroups when
+'cgroup-root' is usable and setrlimit otherwise.
+
+A job that fails because it exceeded a limit raises a
+:class:`envipyengine.error.TaskEngineLimitError` naming the limit, rather than
+a plain :class:`envipyengine.error.TaskEngineExecutionError`.
+
+Limits require a POSIX platform and are ignored elsewhere.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> task.execute(parameters, limits={'memory': '8G', 'cpu_seconds': 3600})
+# traceback information
+envipyengine.error.TaskEngineLimitError: Task Engine exceeded its memory limit of 8589934592
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import logging
+import os
+import re
+import signal
+import sys
+
+from .. import config
+from ..utils import parse_size, which
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_LOGGER = logging.getLogger(__name__)
+
+MEMORY = 'memory'
+CPU_SECONDS = 'cpu_seconds'
+OPEN_FILES = 'open_files'
+
+RLIMIT = 'rlimit'
+CGROUP = 'cgroup'
+AUTO = 'auto'
+
+_OPTIONS = ((MEMORY, 'limit-memory'), (CPU_SECONDS, 'limit-cpu-seconds'),
+            (OPEN_FILES, 'limit-open-files'))
+
+# Messages of engines failing to allocate memory or open files
+_MEMORY_ERRORS = re.compile(r'unable to allocate|out of memory|cannot allocate memory|'
+                            r'memoryerror', re.IGNORECASE)
+_OPEN_FILE_ERRORS = re.compile(r'too many open files', re.IGNORECASE)
+
+_CGROUP_IDS = itertools.count()
+
+
+class Limits(object):
+    """
+    The resource limits of an engine process.
+
+    :param memory: Optionally specify the memory limit in bytes, or as a
+                   string such as '8G'.
+    :param cpu_seconds: Optionally specify the CPU time limit in seconds.
+    :param open_files: Optionally specify the maximum number of open files.
+    """
+
+    def __init__(self, memory=None, cpu_seconds=None, open_files=None):
+        self.memory = parse_size(memory) if memory not in (None, '') else None
+        self.cpu_seconds = int(cpu_seconds) if cpu_seconds not in (None, '') else None
+        self.open_files = int(open_files) if open_files not in (None, '') else None
+
+    @classmethod
+    def from_config(cls, properties):
+        """
+        Creates limits from config options or profile properties.
+
+        :param properties: A dictionary with optional 'limit-memory',
+                           'limit-cpu-seconds' and 'limit-open-files' keys.
+        """
+        return cls(**dict((name, properties.get(option) or None)
+                          for name, option in _OPTIONS))
+
+    def update(self, other):
+        """
+        Overrides the limits set in another.
+
+        :param other: A :class:`Limits`, or a dictionary with optional
+                      'memory', 'cpu_seconds' and 'open_files' keys.
+        :return: These limits.
+        """
+        if isinstance(other, dict):
+            other = Limits(**other)
+        for name, _ in _OPTIONS:
+            if getattr(other, name) is not None:
+                setattr(self, name, getattr(other, name))
+        return self
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None for name, _ in _OPTIONS)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return 'Limits(memory={0!r}, cpu_seconds={1!r}, open_files={2!r})'.format(
+            self.memory, self.cpu_seconds, self.open_files)
+
+
+class Cgroup(object):
+    """
+    A cgroup v2 limiting the memory of one engine process.  It is created
+    below a delegated parent cgroup and removed once the job is done.
+
+    :param root: The directory of the parent cgroup.
+    :param memory: The memory limit in bytes.
+    """
+
+    def __init__(self, root, memory):
+        self.path = os.path.join(root, 'envipyengine-{0}-{1}'.format(
+            os.getpid(), next(_CGROUP_IDS)))
+        os.mkdir(self.path)
+        try:
+            self._write('memory.max', str(memory))
+            if os.path.exists(os.path.join(self.path, 'memory.swap.max')):
+                self._write('memory.swap.max', '0')
+        except (IOError, OSError):
+            self.remove()
+            raise
+        self.procs = os.path.join(self.path, 'cgroup.procs')
+
+    @staticmethod
+    def usable(root):
+        """
+        Returns whether cgroups with a memory controller can be created below
+        a directory.
+
+        :param root: The directory of the parent cgroup, or None.
+        """
+        if not root:
+            return False
+        try:
+            with open(os.path.join(root, 'cgroup.subtree_control')) as controllers:
+                enabled = controllers.read().split()
+        except (IOError, OSError):
+            return False
+        return 'memory' in enabled and os.access(root, os.W_OK)
+
+    def join(self):
+        """
+        Moves the calling process into the cgroup.  Called in the forked
+        engine process before exec.
+        """
+        with open(self.procs, 'w') as procs:
+            procs.write('0')
+
+    def oom_killed(self):
+        """
+        Returns whether a process of the cgroup was killed for exceeding the
+        memory limit.
+        """
+        try:
+            with open(os.path.join(self.path, 'memory.events')) as events:
+                for line in events:
+                    key, _, value = line.partition(' ')
+                    if key == 'oom_kill':
+                        return int(value) > 0
+        except (IOError, OSError, ValueError):
+            pass
+        return False
+
+    def remove(self):
+        """
+        Removes the cgroup.  Errors are logged, as a process the engine
+        started may still be running in it.
+        """
+        try:
+            os.rmdir(self.path)
+        except OSError as error:
+            _LOGGER.warning('Cannot remove cgroup %s: %s', self.path, error)
+
+    def _write(self, name, value):
+        with open(os.path.join(self.path, name), 'w') as control:
+            control.write(value)
+
+
+class Enforcement(object):
+    """
+    Applies limits to one engine process and recognizes when it exceeded them.
+
+    :param limits: The :class:`Limits` of the job.
+    :param backend: Optionally specify the backend enforcing the memory limit:
+                    'rlimit', 'cgroup' or 'auto'.  Defaults to the
+                    'limit-backend' config option.
+    """
+
+    def __init__(self, limits, backend=None):
+        self.limits = limits
+        self.cgroup = None
+        if limits.memory is None or resource is None:
+            return
+        backend = backend or config.get('limit-backend', default=RLIMIT)
+        if backend not in (RLIMIT, CGROUP, AUTO):
+            raise ValueError('Unknown limit backend: {0}'.format(backend))
+        root = config.get('cgroup-root', default=None)
+        if backend == CGROUP or (backend == AUTO and Cgroup.usable(root)):
+            if not root:
+                raise ValueError("The cgroup limit backend requires the 'cgroup-root' option")
+            self.cgroup = Cgroup(root, limits.memory)
+
+    def command(self):
+        """
+        Returns the commands applying the limits, to be run ahead of the
+        engine executable: a shell joining the cgroup of the job, and
+        ``prlimit`` setting the resource limits.  Each command execs the next
+        one, so the engine keeps the process ID.
+
+        :return: A list of arguments, empty if there is nothing to apply, or
+                 None if one of the commands is not installed, in which case
+                 :meth:`preexec` applies the limits instead.
+        """
+        if not self.limits:
+            return []
+        if resource is None:
+            return None
+        command = []
+        if self.cgroup is not None:
+            # The engine may run in another working directory
+            command += [which('sh'), '-c', 'echo $$ > "$0" && exec "$@"',
+                        os.path.abspath(self.cgroup.procs)]
+        rlimits = self._rlimits()
+        if rlimits:
+            command.append(which('prlimit'))
+            command += ['--{0}={1}:{2}'.format(option, soft, hard)
+                        for option, _, (soft, hard) in rlimits]
+            command.append('--')
+        if None in command:
+            return None
+        return command
+
+    def preexec(self):
+        """
+        Returns the function applying the limits in the forked engine
+        process, to be passed to Popen as preexec_fn, or None if there is
+        nothing to apply.
+        """
+        if not self.limits:
+            return None
+        if resource is None:
+            _LOGGER.warning('Resource limits are not supported on this platform, ignoring %r',
+                            self.limits)
+            return None
+        rlimits = self._rlimits()
+        cgroup = self.cgroup
+
+        def _apply():
+            if cgroup is not None:
+                cgroup.join()
+            for _, limit, values in rlimits:
+                resource.setrlimit(limit, values)
+        return _apply
+
+    def breach(self, returncode, stderr, rusage=None):
+        """
+        Returns the limit a failed engine process exceeded, if any.
+
+        :param returncode: The return code of the engine process.
+        :param stderr: The decoded standard error of the engine process.
+        :param rusage: Optionally specify the resource.struct_rusage of the process.
+        :return: A tuple of the limit name and value, or None.
+        """
+        limits = self.limits
+        if returncode == 0 or not limits:
+            return None
+        if limits.memory is not None:
+            if (self.cgroup is not None and self.cgroup.oom_killed()) or \
+                    _MEMORY_ERRORS.search(stderr):
+                return (MEMORY, limits.memory)
+        if limits.cpu_seconds is not None:
+            killed = returncode == -getattr(signal, 'SIGXCPU', 0) or (
+                returncode == -getattr(signal, 'SIGKILL', 0) and rusage is not None and
+                rusage.ru_utime + rusage.ru_stime >= limits.cpu_seconds)
+            if killed:
+                return (CPU_SECONDS, limits.cpu_seconds)
+        if limits.open_files is not None and _OPEN_FILE_ERRORS.search(stderr):
+            return (OPEN_FILES, limits.open_files)
+        return None
+
+    def _rlimits(self):
+        """
+        Returns the prlimit option, resource and soft and hard values of each
+        resource limit to set.
+        """
+        rlimits = []
+        if self.limits.memory is not None and self.cgroup is None:
+            rlimits.append(('as', resource.RLIMIT_AS, (self.limits.memory, self.limits.memory)))
+        if self.limits.cpu_seconds is not None:
+            # The engine gets SIGXCPU at the soft limit and SIGKILL one second later
+            rlimits.append(('cpu', resource.RLIMIT_CPU,
+                            (self.limits.cpu_seconds, self.limits.cpu_seconds + 1)))
+        if self.limits.open_files is not None:
+            rlimits.append(('nofile', resource.RLIMIT_NOFILE,
+                            (self.limits.open_files, self.limits.open_files)))
+        return rlimits
+
+    def close(self):
+        """
+        Removes the cgroup of the job, if any.
+        """
+        if self.cgroup is not None:
+            self.cgroup.remove()
+            self.cgroup = None
+
+
+def resolve(profile=None, limits=None):
+    """
+    Returns the limits of a job from the config options, the properties of
+    its engine profile and the limits given for the job.
+
+    :param profile: Optionally specify the :class:`routing.Profile` of the job.
+    :param limits: Optionally specify the :class:`Limits`, or dictionary,
+                   given for the job.
+    :return: A :class:`Limits` object.
+    """
+    resolved = Limits.from_config(dict((option, config.get(option, default=None))
+                                       for _, option in _OPTIONS))
+    if profile is not None and profile.limits is not None:
+        resolved.update(profile.limits)
+    if limits is not None:
+        resolved.update(limits)
+    if resolved and sys.platform.startswith('win'):
+        _LOGGER.warning('Resource limits are not supported on Windows, ignoring %r', resolved)
+        return Limits()
+    return resolved
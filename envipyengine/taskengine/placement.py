@@ -0,0 +1,401 @@
+"""
+Pins engine processes to CPU cores and sets their scheduling priority.
+
+A placement is a set of CPU cores, a nice value and an I/O priority, applied
+to the engine process by ``taskengine.execute``, which runs the engine
+through the ``taskset``, ``nice`` and ``ionice`` commands.  Placements are
+set by the 'cpu-affinity', 'nice' and 'ionice' config options, by the same
+properties of an engine profile, which take precedence, and per job with
+``Task.execute(parameters, placement={...})``, which takes precedence over both.
+
+============ =================================================================
+Option       Description
+============ =================================================================
+cpu-affinity The cores the engine may run on, e.g. '0-15,32-47', or 'auto' to
+             give each job one partition of the cores in turn.
+nice         The nice value of the engine process, e.g. 10.
+ionice       The I/O scheduling class and level of the engine process:
+             'idle', 'best-effort:<0-7>' or 'realtime:<0-7>'.  Linux only.
+============ =================================================================
+
+With 'auto', the cores available to the Python process are split into
+partitions: blocks of 'cpu-partition-size' cores if that option is set,
+otherwise the NUMA nodes of the host.  Each job runs on the partition with
+the fewest running jobs, taking turns between equally loaded partitions, so
+concurrent engines stay on separate sockets instead of migrating between them.
+A host with a single NUMA node and no partition size has one partition.
+
+When one of these commands is not installed, the placement is applied in the
+forked engine process before the engine executable is started instead.  This
+needs a ``preexec_fn``, which stops ``subprocess`` from spawning the engine
+with ``vfork`` or ``posix_spawn``, so every spawn copies the page tables of
+the Python process and takes longer the more memory it uses.
+
+Placements require a POSIX platform.  Options a platform does not support
+are logged and ignored.
+
+:Example:
+
+>>> from envipyengine import config, Engine
+>>> config.set('cpu-affinity', 'auto')
+>>> config.set('nice', '5')
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> task.execute(parameters, placement={'cpus': '0-7', 'ionice': 'idle'})
+
+"""
+from __future__ import absolute_import
+
+import ctypes
+import glob
+import itertools
+import logging
+import os
+import platform
+import sys
+import threading
+
+from .. import config
+from ..utils import register_at_fork, which
+
+_LOGGER = logging.getLogger(__name__)
+
+AUTO = 'auto'
+
+_IOPRIO_CLASSES = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+
+# Number of the ioprio_set system call, which Python does not expose
+_IOPRIO_SET = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289,
+               'aarch64': 30, 'arm64': 30, 'armv7l': 314, 'ppc64le': 273,
+               'ppc64': 273, 's390x': 282, 'riscv64': 30}
+
+
+class Placement(object):
+    """
+    The CPU cores and priorities of an engine process.
+
+    :param cpus: Optionally specify the cores to run on, as a set of integers,
+                 a string such as '0-3,8' or 'auto'.
+    :param nice: Optionally specify the nice value.
+    :param ionice: Optionally specify the I/O priority as a string such as
+                   'best-effort:4', or a tuple of the class and level.
+    """
+
+    def __init__(self, cpus=None, nice=None, ionice=None):
+        self.cpus = parse_cpus(cpus)
+        self.nice = None if nice is None or nice == '' else int(nice)
+        self.ionice = parse_ionice(ionice)
+
+    @classmethod
+    def from_config(cls, properties):
+        """
+        Creates a placement from config options or profile properties.
+
+        :param properties: A dictionary with optional 'cpu-affinity', 'nice'
+                           and 'ionice' keys.
+        """
+        return cls(properties.get('cpu-affinity') or None,
+                   properties.get('nice') or None,
+                   properties.get('ionice') or None)
+
+    def update(self, other):
+        """
+        Overrides the settings of this placement with those set in another.
+
+        :param other: A :class:`Placement`, or a dictionary with optional
+                      'cpus', 'nice' and 'ionice' keys.
+        :return: This placement.
+        """
+        if isinstance(other, dict):
+            other = Placement(**other)
+        for name in ('cpus', 'nice', 'ionice'):
+            if getattr(other, name) is not None:
+                setattr(self, name, getattr(other, name))
+        return self
+
+    def command(self):
+        """
+        Returns the commands applying the placement, to be run ahead of the
+        engine executable, e.g. ['taskset', '-c', '0-3', 'nice', '-n', '5'].
+        Each command execs the next one, so the engine keeps the process ID.
+
+        :return: A list of arguments, empty if there is nothing to apply, or
+                 None if one of the commands is not installed, in which case
+                 :meth:`preexec` applies the placement instead.
+        """
+        if sys.platform.startswith('win'):
+            return None
+        command = []
+        cpus = self._cpus()
+        if cpus is not None:
+            command += [which('taskset'), '-c', format_cpus(cpus)]
+        if self.nice is not None:
+            # nice adds to the niceness the engine inherits from this process
+            command += [which('nice'), '-n',
+                        str(self.nice - os.getpriority(os.PRIO_PROCESS, 0))]
+        if self.ionice is not None:
+            name, level = self.ionice
+            command += [which('ionice'), '-c', str(_IOPRIO_CLASSES[name])]
+            if name != 'idle':
+                command += ['-n', str(level)]
+        if None in command:
+            return None
+        return command
+
+    def preexec(self):
+        """
+        Returns the function applying the placement in the forked engine
+        process, to be passed to Popen as preexec_fn, or None if there is
+        nothing to apply.
+        """
+        if sys.platform.startswith('win'):
+            if self:
+                _LOGGER.warning('Engine placement is not supported on Windows, ignoring %r',
+                                self)
+            return None
+        cpus = self._cpus()
+        nice = self.nice
+        set_ioprio = _ioprio_setter(self.ionice) if self.ionice is not None else None
+        if cpus is None and nice is None and set_ioprio is None:
+            return None
+
+        def _apply():
+            if cpus is not None:
+                os.sched_setaffinity(0, cpus)
+            if nice is not None:
+                os.setpriority(os.PRIO_PROCESS, 0, nice)
+            if set_ioprio is not None:
+                set_ioprio()
+        return _apply
+
+    def _cpus(self):
+        """
+        Returns the cores of the placement that are available to the Python
+        process, or None if the placement does not set the cores.
+        """
+        cpus = self.cpus
+        if cpus is not None and not hasattr(os, 'sched_setaffinity'):
+            _LOGGER.warning('CPU affinity is not supported on this platform, ignoring it')
+            cpus = None
+        if cpus is not None:
+            cpus = set(cpus) & available_cpus()
+            if not cpus:
+                raise ValueError('None of CPU cores {0} are available'.format(
+                    format_cpus(self.cpus)))
+        return cpus
+
+    def __bool__(self):
+        return self.cpus is not None or self.nice is not None or self.ionice is not None
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        cpus = self.cpus if self.cpus in (None, AUTO) else format_cpus(self.cpus)
+        return 'Placement(cpus={0!r}, nice={1!r}, ionice={2!r})'.format(
+            cpus, self.nice, self.ionice)
+
+
+class CorePartitioner(object):
+    """
+    Hands out partitions of the CPU cores to concurrent jobs, each job
+    receiving the partition with the fewest running jobs.
+
+    :param partition_size: Optionally specify the number of cores per
+                           partition.  Defaults to the 'cpu-partition-size'
+                           config option, or the NUMA nodes of the host.
+    """
+
+    def __init__(self, partition_size=None):
+        self.partition_size = partition_size
+        self._active = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def partitions(self):
+        """
+        Returns the partitions of the cores available to the Python process.
+
+        :return: A list of frozensets of core numbers.
+        """
+        cpus = available_cpus()
+        size = self.partition_size
+        if size is None:
+            size = config.get('cpu-partition-size', default=None)
+        if size:
+            ordered = sorted(cpus)
+            size = int(size)
+            return [frozenset(ordered[index:index + size])
+                    for index in range(0, len(ordered), size)]
+        nodes = [node & cpus for node in numa_nodes()]
+        nodes = [frozenset(node) for node in nodes if node]
+        return nodes or [frozenset(cpus)]
+
+    def acquire(self):
+        """
+        Selects the partition for a job and counts the job against it.  Each
+        partition must be passed to :meth:`release` once the job is done.
+
+        :return: A frozenset of core numbers.
+        """
+        partitions = self.partitions()
+        with self._lock:
+            offset = next(self._counter)
+            ordered = [partitions[(offset + index) % len(partitions)]
+                       for index in range(len(partitions))]
+            selected = min(ordered, key=lambda partition: self._active.get(partition, 0))
+            self._active[selected] = self._active.get(selected, 0) + 1
+        return selected
+
+    def release(self, partition):
+        """
+        Releases a partition returned by :meth:`acquire`.
+
+        :param partition: The frozenset of core numbers.
+        """
+        with self._lock:
+            count = self._active.get(partition, 0) - 1
+            if count > 0:
+                self._active[partition] = count
+            else:
+                self._active.pop(partition, None)
+
+    def after_fork(self):
+        """
+        Replaces the lock and forgets the running jobs in a forked child
+        process.  Jobs counted as running belong to threads of the parent.
+        """
+        self._lock = threading.Lock()
+        self._active = {}
+
+
+PARTITIONER = CorePartitioner()
+"""The partitioner assigning cores to jobs with the 'auto' CPU affinity."""
+register_at_fork(PARTITIONER.after_fork)
+
+
+def resolve(profile=None, placement=None):
+    """
+    Returns the placement of a job from the config options, the properties
+    of its engine profile and the placement given for the job.
+
+    :param profile: Optionally specify the :class:`routing.Profile` of the job.
+    :param placement: Optionally specify the :class:`Placement`, or
+                      dictionary, given for the job.
+    :return: A :class:`Placement`.
+    """
+    resolved = Placement.from_config(
+        dict((name, config.get(name, default=None))
+             for name in ('cpu-affinity', 'nice', 'ionice')))
+    if profile is not None and profile.placement is not None:
+        resolved.update(profile.placement)
+    if placement is not None:
+        resolved.update(placement)
+    return resolved
+
+
+def available_cpus():
+    """
+    Returns the set of CPU cores the Python process may run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return set(os.sched_getaffinity(0))
+    return set(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """
+    Returns the CPU cores of each NUMA node of the host, or an empty list if
+    they are not known.
+
+    :return: A list of sets of core numbers.
+    """
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        try:
+            with open(path) as cpulist:
+                cpus = parse_cpus(cpulist.read().strip())
+        except (IOError, OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes
+
+
+def parse_cpus(value):
+    """
+    Converts a list of cores such as '0-3,8' into a set of core numbers.
+
+    :param value: A string, an iterable of integers, 'auto' or None.
+    :return: A set of integers, 'auto' or None.
+    """
+    if value is None or value == AUTO:
+        return value
+    if not isinstance(value, str):
+        return set(int(cpu) for cpu in value)
+    if value.strip().lower() == AUTO:
+        return AUTO
+    cpus = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpus(cpus):
+    """
+    Converts a set of core numbers into a string such as '0-3,8'.
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else '{0}-{1}'.format(first, last)
+                    for first, last in ranges)
+
+
+def parse_ionice(value):
+    """
+    Converts an I/O priority such as 'best-effort:4' into a tuple of the
+    class name and level.
+
+    :param value: A string, a tuple or None.
+    :return: A tuple of the class name and level, or None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        name, _, level = value.strip().lower().partition(':')
+        value = (name, int(level) if level else (0 if name != 'idle' else 7))
+    name, level = value
+    if name not in _IOPRIO_CLASSES:
+        raise ValueError('Unknown I/O scheduling class: {0}'.format(name))
+    if not 0 <= int(level) <= 7:
+        raise ValueError('I/O priority level must be between 0 and 7: {0}'.format(level))
+    return (name, int(level))
+
+
+def _ioprio_setter(ionice):
+    """
+    Returns a function setting the I/O priority of the calling process, or
+    None if the platform does not support it.  The C library is loaded here,
+    in the parent, as loading it in a forked child is not safe.
+    """
+    number = _IOPRIO_SET.get(platform.machine().lower())
+    if not sys.platform.startswith('linux') or number is None:
+        _LOGGER.warning('I/O priority is not supported on this platform, ignoring it')
+        return None
+    syscall = ctypes.CDLL(None, use_errno=True).syscall
+    name, level = ionice
+    value = (_IOPRIO_CLASSES[name] << _IOPRIO_CLASS_SHIFT) | level
+
+    def _set():
+        if syscall(number, _IOPRIO_WHO_PROCESS, 0, value) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, 'ioprio_set: {0}'.format(os.strerror(error)))
+    return _set
@@ -0,0 +1,160 @@
+"""
+The profiling module runs jobs under the IDL profiler.
+
+``Task.execute(parameters, profiler=True)`` runs the job through the bundled
+ProfileTask custom task, which enables the IDL profiler around the real task.
+The result holds the normal task output, and its ``profile`` attribute holds a
+:class:`TaskProfile` with the calls and time of every IDL routine along with
+engine-side timestamps, so the time spent starting the engine can be told
+apart from the time spent in the task.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> task = Engine('ENVI').task('SpectralIndex')
+>>> result = task.execute(parameters, profiler=True)
+>>> result.profile.startup_time, result.profile.task_time
+(4.82, 12.31)
+>>> for routine in result.profile.top(3):
+...     print(routine.name, routine.calls, routine.self_time)
+ENVIRASTER::GETDATA 96 7.93
+...
+
+"""
+from __future__ import absolute_import
+
+import time
+from collections import namedtuple
+
+PROFILE_TASK = 'ProfileTask'
+
+Routine = namedtuple('Routine', ('name', 'calls', 'self_time', 'total_time', 'system'))
+"""The calls and time in seconds of one IDL routine, with and without the routines it called."""
+
+
+class TaskProfile(object):
+    """
+    The IDL profile of a job.
+
+    ================ =================================================================
+    Attribute        Description
+    ================ =================================================================
+    started          Time the job was submitted, in seconds since the epoch.
+    init             Time the engine had started up and began running the job.
+    task_start       Time the task started executing.
+    task_end         Time the task finished executing.
+    finished         Time the result was received.
+    routines         A list of :class:`Routine` tuples for the routines called.
+    ================ =================================================================
+    """
+
+    def __init__(self, started, init, task_start, task_end, finished, routines):
+        self.started = started
+        self.init = init
+        self.task_start = task_start
+        self.task_end = task_end
+        self.finished = finished
+        self.routines = routines
+
+    @classmethod
+    def from_output(cls, output_parameters, started, finished):
+        """
+        Creates the profile from the output of ProfileTask.
+
+        :param output_parameters: The outputParameters of the ProfileTask job.
+        :param started: The time the job was submitted.
+        :param finished: The time the result was received.
+        :return: A :class:`TaskProfile`.
+        """
+        timestamps = output_parameters['TIMESTAMPS']
+        routines = [Routine(entry['NAME'], entry['COUNT'], entry['ONLY_TIME'],
+                            entry['TIME'], bool(entry.get('SYSTEM')))
+                    for entry in output_parameters['PROFILE']]
+        return cls(started, timestamps['INIT'], timestamps['TASK_START'],
+                   timestamps['TASK_END'], finished, routines)
+
+    @property
+    def startup_time(self):
+        """
+        Seconds from submitting the job until the engine began running it,
+        including spawning and initializing the engine.
+        """
+        return self.init - self.started
+
+    @property
+    def setup_time(self):
+        """
+        Seconds spent creating the task and reading its input parameters.
+        """
+        return self.task_start - self.init
+
+    @property
+    def task_time(self):
+        """
+        Seconds spent executing the task.
+        """
+        return self.task_end - self.task_start
+
+    @property
+    def shutdown_time(self):
+        """
+        Seconds from the end of the task until the result was received,
+        including writing the output and shutting down the engine.
+        """
+        return self.finished - self.task_end
+
+    def top(self, count=10):
+        """
+        Returns the routines with the most time spent in their own code.
+
+        :param count: The number of routines to return.
+        :return: A list of :class:`Routine` tuples.
+        """
+        return sorted(self.routines, key=lambda routine: routine.self_time,
+                      reverse=True)[:count]
+
+    def as_dict(self):
+        """
+        Returns the profile as a dictionary.
+        """
+        return {'started': self.started,
+                'init': self.init,
+                'task_start': self.task_start,
+                'task_end': self.task_end,
+                'finished': self.finished,
+                'routines': [routine._asdict() for routine in self.routines]}
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Creates the profile from a dictionary returned by :meth:`as_dict`.
+        """
+        return cls(values['started'], values['init'], values['task_start'],
+                   values['task_end'], values['finished'],
+                   [Routine(**routine) for routine in values['routines']])
+
+
+def wrap(task_input):
+    """
+    Returns the job input running a job through ProfileTask.
+
+    :param task_input: The job input of the task to profile.
+    """
+    return {'taskName': PROFILE_TASK,
+            'inputParameters': {'TASK_NAME': task_input['taskName'],
+                                'INPUT_PARAMETERS': task_input.get('inputParameters') or {}}}
+
+
+def unwrap(result, started):
+    """
+    Replaces the output of ProfileTask in a result with the output of the
+    profiled task and sets the ``profile`` attribute of the result.
+
+    :param result: The TaskResult of the ProfileTask job.
+    :param started: The time the job was submitted, from time.time().
+    :return: The result.
+    """
+    output = result['outputParameters']
+    result.profile = TaskProfile.from_output(output, started, time.time())
+    result['outputParameters'] = output['OUTPUT_PARAMETERS']
+    return result
@@ -0,0 +1,275 @@
+"""
+The resources module accounts for the resources used by task engine processes.
+
+When the engine process exits, its CPU times, peak resident set size and block
+I/O counts are collected with ``os.wait4``.  On Linux, the resident set size
+and I/O byte counts can additionally be sampled from ``/proc/<pid>`` while a
+long job runs, by passing ``rss_interval`` to ``Task.execute`` or setting the
+``rss-sample-interval`` config option.
+
+The usage of a job is available as the ``resources`` attribute of the
+:class:`envipyengine.taskengine.taskengine.TaskResult` returned by
+``Task.execute``, on the ``resources`` attribute of the tracing
+:class:`envipyengine.taskengine.tracing.Job`, and per task name once
+recording is enabled:
+
+>>> from envipyengine.taskengine import resources
+>>> resources.enable()
+>>> result = task.execute(parameters)
+>>> result.resources.user_time
+>>> resources.usage('SpectralIndex')
+
+"""
+from __future__ import absolute_import
+
+import collections
+import os
+import sys
+import threading
+
+from . import tracing
+from ..utils import register_at_fork
+
+_RSS_UNITS = 1 if sys.platform.startswith('darwin') else 1024
+
+
+class ResourceUsage(object):
+    """
+    The resources used by a single task engine process.
+
+    ================ =================================================================
+    Attribute        Description
+    ================ =================================================================
+    wall_time        Seconds from spawning the process until it exited.
+    user_time        CPU seconds spent in user mode.
+    system_time      CPU seconds spent in system mode.
+    max_rss          Peak resident set size in bytes, as reported by the kernel.
+    read_blocks      Number of block input operations.
+    write_blocks     Number of block output operations.
+    sampled_rss      Peak resident set size in bytes seen while sampling /proc,
+                     or None if the process was not sampled.
+    read_bytes       Bytes read from storage, if sampled from /proc.
+    write_bytes      Bytes written to storage, if sampled from /proc.
+    ================ =================================================================
+    """
+    __slots__ = ('wall_time', 'user_time', 'system_time', 'max_rss',
+                 'read_blocks', 'write_blocks', 'sampled_rss',
+                 'read_bytes', 'write_bytes')
+
+    def __init__(self, wall_time=None, rusage=None, sampler=None):
+        self.wall_time = wall_time
+        self.user_time = rusage.ru_utime if rusage else None
+        self.system_time = rusage.ru_stime if rusage else None
+        self.max_rss = rusage.ru_maxrss * _RSS_UNITS if rusage else None
+        self.read_blocks = rusage.ru_inblock if rusage else None
+        self.write_blocks = rusage.ru_oublock if rusage else None
+        self.sampled_rss = sampler.peak_rss if sampler else None
+        self.read_bytes = sampler.read_bytes if sampler else None
+        self.write_bytes = sampler.write_bytes if sampler else None
+
+    @property
+    def cpu_time(self):
+        """
+        The total CPU seconds, or None if not available.
+        """
+        if self.user_time is None:
+            return None
+        return self.user_time + self.system_time
+
+    @property
+    def peak_rss(self):
+        """
+        The largest known resident set size in bytes, or None if not available.
+        """
+        values = [value for value in (self.max_rss, self.sampled_rss) if value is not None]
+        return max(values) if values else None
+
+    def as_dict(self):
+        """
+        Returns the usage as a dictionary.
+        """
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Creates the usage from a dictionary returned by :meth:`as_dict`.
+        """
+        usage = cls()
+        for name in cls.__slots__:
+            setattr(usage, name, values.get(name))
+        return usage
+
+    def __repr__(self):
+        return 'ResourceUsage({0})'.format(', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class RSSSampler(threading.Thread):
+    """
+    Daemon thread sampling the memory and I/O of a process from /proc.
+
+    :param pid: The process id to sample.
+    :param interval: The number of seconds between samples.
+    """
+
+    def __init__(self, pid, interval):
+        super(RSSSampler, self).__init__(name='envipyengine-rss-{0}'.format(pid))
+        self.daemon = True
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = None
+        self.read_bytes = None
+        self.write_bytes = None
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def available():
+        """
+        Returns True if processes can be sampled on this platform.
+        """
+        return os.path.isdir('/proc/self')
+
+    def run(self):
+        while True:
+            self.sample()
+            if self._stopped.wait(self.interval):
+                break
+
+    def sample(self):
+        """
+        Reads the current values from /proc.  The process may exit at any time,
+        in which case the previous values are kept.
+        """
+        try:
+            with open('/proc/{0}/status'.format(self.pid)) as status:
+                for line in status:
+                    if line.startswith(('VmRSS:', 'VmHWM:')):
+                        rss = int(line.split()[1]) * 1024
+                        self.peak_rss = max(self.peak_rss or 0, rss)
+            with open('/proc/{0}/io'.format(self.pid)) as io_stats:
+                for line in io_stats:
+                    name, _, value = line.partition(':')
+                    if name == 'read_bytes':
+                        self.read_bytes = int(value)
+                    elif name == 'write_bytes':
+                        self.write_bytes = int(value)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def stop(self):
+        """
+        Stops sampling and waits for the thread to finish.
+        """
+        self._stopped.set()
+        self.join()
+
+
+def wait(process):
+    """
+    Waits for a process to exit and returns its resource usage.  The return
+    code of the Popen object is set as if Popen.wait had been called.
+
+    :param process: A subprocess.Popen object.
+    :return: A resource.struct_rusage, or None if not supported on this platform.
+    """
+    if not hasattr(os, 'wait4') or process.returncode is not None:
+        process.wait()
+        return None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped elsewhere, fall back to Popen's bookkeeping.
+        process.wait()
+        return None
+    process.returncode = _exit_code(status)
+    return rusage
+
+
+def _exit_code(status):
+    """
+    Converts a wait status to a return code in the same form as Popen.
+    """
+    if hasattr(os, 'waitstatus_to_exitcode'):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ResourceRecorder(tracing.Observer):
+    """
+    Tracing observer keeping the resource usage of recent jobs per task name.
+
+    :param maxlen: The number of records kept per task name.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def job_finished(self, job):
+        if job.resources is None:
+            return
+        with self._lock:
+            records = self._records.get(job.task)
+            if records is None:
+                records = self._records[job.task] = collections.deque(maxlen=self.maxlen)
+            records.append(job.resources)
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    def usage(self, task_name):
+        """
+        Returns the recorded resource usage for a task name, oldest first.
+
+        :param task_name: The name of the task.
+        :return: A list of :class:`ResourceUsage` objects.
+        """
+        with self._lock:
+            return list(self._records.get(task_name, ()))
+
+    def tasks(self):
+        """
+        Returns the task names with recorded resource usage.
+        """
+        with self._lock:
+            return sorted(self._records)
+
+    def clear(self):
+        """
+        Discards all records.
+        """
+        with self._lock:
+            self._records.clear()
+
+
+RECORDER = ResourceRecorder()
+register_at_fork(RECORDER.after_fork)
+
+
+def enable():
+    """
+    Starts recording the resource usage of all jobs per task name.
+    """
+    if RECORDER not in tracing.observers():
+        tracing.add_observer(RECORDER)
+
+
+def disable():
+    """
+    Stops recording resource usage.
+    """
+    tracing.remove_observer(RECORDER)
+
+
+def usage(task_name):
+    """
+    Returns the recorded resource usage for a task name, oldest first.
+
+    :param task_name: The name of the task.
+    :return: A list of :class:`ResourceUsage` objects.
+    """
+    return RECORDER.usage(task_name)
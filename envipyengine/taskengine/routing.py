@@ -0,0 +1,337 @@
+"""
+Routes jobs across multiple engine installations.
+
+Each installation is an engine profile defined in the config files with
+:func:`envipyengine.config.set_profile`.  When profiles are defined,
+``taskengine.execute`` asks the :data:`ROUTER` for a profile for every job and
+spawns the engine executable, arguments and environment of that profile.
+Without profiles the main 'engine' setting is used as before.
+
+The 'routing' config option selects the policy:
+
+============ =================================================================
+Policy       Description
+============ =================================================================
+round-robin  Profiles take turns (default).
+least-loaded The profile with the fewest running jobs is used.
+pinned       Tasks listed in the 'tasks' property of a profile only run on
+             that profile, other tasks take turns across all profiles.
+============ =================================================================
+
+A job can also be pinned to a profile, or to the profiles of an ENVI version,
+with ``Engine('ENVI', profile='local')`` or ``Engine('ENVI', version='5.6')``.
+
+Profiles whose engine fails to spawn 'profile-failures' times in a row are
+taken out of rotation for 'profile-cooldown' seconds, after which a single
+job is routed to them again.  Jobs whose spawn failed are retried on another
+profile.
+
+:Example:
+
+>>> from envipyengine.taskengine import routing
+>>> routing.ROUTER.health()
+{'local': {'healthy': True, 'active': 2, 'failures': 0, 'last_error': None},
+ 'nfs': {'healthy': False, 'active': 0, 'failures': 3,
+         'last_error': "[Errno 2] No such file or directory: '/mnt/envi/...'"}}
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import logging
+import threading
+import time
+
+from .. import config
+from ..error import TaskEngineNotFoundError
+from ..utils import register_at_fork
+from .limits import Limits
+from .placement import Placement
+
+_LOGGER = logging.getLogger(__name__)
+
+ROUND_ROBIN = 'round-robin'
+LEAST_LOADED = 'least-loaded'
+PINNED = 'pinned'
+
+
+class Profile(object):
+    """
+    An engine installation.
+
+    :param name: The name of the profile.
+    :param engine: The full path to the engine executable.
+    :param engine_args: Optionally specify additional engine arguments as a string.
+    :param environment: Optionally specify a dictionary of environment settings
+                        applied on top of the 'engine-environment' settings.
+    :param version: Optionally specify the ENVI version of the installation.
+    :param tasks: Optionally specify a list of task names pinned to the profile.
+    :param placement: Optionally specify the :class:`placement.Placement` of
+                      the engine processes, applied on top of the config options.
+    :param limits: Optionally specify the :class:`limits.Limits` of the engine
+                   processes, applied on top of the config options.
+    """
+
+    def __init__(self, name, engine, engine_args=None, environment=None, version=None,
+                 tasks=None, placement=None, limits=None):
+        self.name = name
+        self.engine = engine
+        self.engine_args = engine_args
+        self.environment = environment or {}
+        self.version = version
+        self.tasks = tasks or []
+        self.placement = placement
+        self.limits = limits
+
+    @classmethod
+    def from_config(cls, name, properties):
+        """
+        Creates a profile from the properties returned by
+        :func:`envipyengine.config.get_profiles`.  The engine and engine
+        arguments default to the main settings.
+
+        :param name: The name of the profile.
+        :param properties: A dictionary of profile properties.
+        """
+        tasks = [task.strip() for task in properties.get('tasks', '').split(',')
+                 if task.strip()]
+        return cls(name,
+                   properties.get('engine') or config.get('engine', default=None),
+                   engine_args=properties.get('engine-args',
+                                              config.get('engine-args', default=None)),
+                   environment=properties.get('environment'),
+                   version=properties.get('version'),
+                   tasks=tasks,
+                   placement=Placement.from_config(properties),
+                   limits=Limits.from_config(properties))
+
+    def __repr__(self):
+        return 'Profile({0!r}, {1!r})'.format(self.name, self.engine)
+
+
+class _State(object):
+    """
+    The load and health of a profile.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.failures = 0
+        self.retry_after = 0
+        self.probing = False
+        self.last_error = None
+
+
+class Router(object):
+    """
+    Selects the engine profile for each job and tracks the load and health
+    of the profiles.
+
+    :param policy: The routing policy.  Defaults to the 'routing' config option.
+    :param failure_threshold: The number of consecutive spawn failures after
+                              which a profile is taken out of rotation.
+                              Defaults to the 'profile-failures' config option.
+    :param cooldown: The number of seconds an unhealthy profile is out of
+                     rotation.  Defaults to the 'profile-cooldown' config option.
+    """
+
+    def __init__(self, policy=None, failure_threshold=None, cooldown=None):
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._states = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def profiles(self):
+        """
+        Returns the configured profiles.
+
+        :return: A list of :class:`Profile` objects.
+        """
+        return [Profile.from_config(name, properties)
+                for name, properties in config.get_profiles().items()]
+
+    def select(self, task_name=None, profile=None, version=None, exclude=()):
+        """
+        Selects the profile for a job and counts the job against its load.
+        Each selected profile must be passed to :meth:`release` once the job
+        is done.
+
+        :param task_name: The name of the task the job runs.
+        :param profile: Optionally specify the name of the profile to use.
+        :param version: Optionally specify the ENVI version to use.
+        :param exclude: Optionally specify names of profiles not to use,
+                        e.g. profiles that already failed to spawn the job.
+        :return: A :class:`Profile`, or None if no profiles are configured.
+        """
+        profiles = self.profiles()
+        if not profiles:
+            if profile is not None or version is not None:
+                raise TaskEngineNotFoundError('No engine profiles are configured')
+            return None
+
+        policy = self._policy()
+        threshold = self._threshold()
+        candidates = self._candidates(profiles, task_name, profile, version, policy)
+        candidates = [candidate for candidate in candidates if candidate.name not in exclude]
+        if not candidates:
+            raise TaskEngineNotFoundError(
+                'No engine profile available for task {0}'.format(task_name))
+
+        now = time.time()
+        with self._lock:
+            healthy = [candidate for candidate in candidates
+                       if self._available(self._state(candidate.name), now, threshold)]
+            # Try the unhealthy profiles rather than failing outright
+            candidates = healthy or candidates
+            offset = next(self._counter)
+            ordered = [candidates[(offset + index) % len(candidates)]
+                       for index in range(len(candidates))]
+            if policy == LEAST_LOADED:
+                selected = min(ordered, key=lambda candidate: self._state(candidate.name).active)
+            else:
+                selected = ordered[0]
+            state = self._state(selected.name)
+            state.active += 1
+            if state.failures >= threshold:
+                state.probing = True
+        return selected
+
+    def release(self, profile):
+        """
+        Releases a profile returned by :meth:`select` once its job is done.
+
+        :param profile: The :class:`Profile`, or None.
+        """
+        if profile is None:
+            return
+        with self._lock:
+            self._state(profile.name).active -= 1
+
+    def success(self, profile):
+        """
+        Records that a profile spawned its engine, which makes it healthy.
+
+        :param profile: The :class:`Profile`, or None.
+        """
+        if profile is None:
+            return
+        with self._lock:
+            state = self._state(profile.name)
+            state.failures = 0
+            state.probing = False
+
+    def failure(self, profile, error):
+        """
+        Records that a profile failed to spawn its engine.
+
+        :param profile: The :class:`Profile`, or None.
+        :param error: The exception raised by the spawn.
+        """
+        if profile is None:
+            return
+        threshold = self._threshold()
+        cooldown = self._cooldown()
+        with self._lock:
+            state = self._state(profile.name)
+            state.failures += 1
+            state.probing = False
+            state.last_error = str(error)
+            if state.failures >= threshold:
+                state.retry_after = time.time() + cooldown
+                _LOGGER.warning('Engine profile %s failed %d times, not routing jobs to it '
+                                'for %s seconds: %s', profile.name, state.failures,
+                                cooldown, error)
+
+    def health(self):
+        """
+        Returns the load and health of the configured profiles.
+
+        :return: A dictionary of profile names to dictionaries with the keys
+                 'healthy', 'active', 'failures' and 'last_error'.
+        """
+        profiles = self.profiles()
+        threshold = self._threshold()
+        now = time.time()
+        health = {}
+        with self._lock:
+            for profile in profiles:
+                state = self._state(profile.name)
+                health[profile.name] = {'healthy': state.failures < threshold or
+                                                   now >= state.retry_after,
+                                        'active': state.active,
+                                        'failures': state.failures,
+                                        'last_error': state.last_error}
+        return health
+
+    def reset(self):
+        """
+        Forgets the load and health of all profiles.
+        """
+        with self._lock:
+            self._states.clear()
+
+    def after_fork(self):
+        """
+        Replaces the lock and forgets the running jobs in a forked child
+        process.  Jobs counted as active belong to threads of the parent.
+        """
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def _candidates(self, profiles, task_name, profile, version, policy):
+        if profile is not None:
+            profiles = [candidate for candidate in profiles if candidate.name == profile]
+            if not profiles:
+                raise TaskEngineNotFoundError('Unknown engine profile: {0}'.format(profile))
+            return profiles
+        if version is not None:
+            profiles = [candidate for candidate in profiles
+                        if str(candidate.version) == str(version)]
+            if not profiles:
+                raise TaskEngineNotFoundError(
+                    'No engine profile for version {0}'.format(version))
+        if policy == PINNED and task_name:
+            pinned = [candidate for candidate in profiles
+                      if task_name.lower() in (task.lower() for task in candidate.tasks)]
+            if pinned:
+                return pinned
+        return profiles
+
+    @staticmethod
+    def _available(state, now, threshold):
+        """
+        Returns whether a profile may receive jobs.  An unhealthy profile
+        receives a single probing job once its cooldown has passed.
+        """
+        if state.failures < threshold:
+            return True
+        return now >= state.retry_after and not state.probing
+
+    def _state(self, name):
+        state = self._states.get(name)
+        if state is None:
+            state = self._states[name] = _State()
+        return state
+
+    def _policy(self):
+        policy = self.policy or config.get('routing', default=ROUND_ROBIN)
+        if policy not in (ROUND_ROBIN, LEAST_LOADED, PINNED):
+            raise ValueError('Unknown routing policy: {0}'.format(policy))
+        return policy
+
+    def _threshold(self):
+        if self.failure_threshold is not None:
+            return self.failure_threshold
+        return int(config.get('profile-failures', default=3))
+
+    def _cooldown(self):
+        if self.cooldown is not None:
+            return self.cooldown
+        return float(config.get('profile-cooldown', default=60))
+
+
+ROUTER = Router()
+"""The router used by taskengine.execute."""
+register_at_fork(ROUTER.after_fork)
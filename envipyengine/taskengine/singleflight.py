@@ -0,0 +1,146 @@
+"""
+Coalesces identical concurrent task engine jobs.
+
+When coalescing is enabled, a call to ``taskengine.execute`` made while an
+identical job is already running does not spawn another engine.  It waits for
+the running job and receives a copy of its result, or the exception it raised.
+Jobs are identical when they have the same canonical job hash: the same
+engine, profile, working directory, task and parameters.  This applies to
+``Task.execute``, ``Task.taskinfo`` and ``Engine.tasks`` alike.
+
+Coalescing is enabled for all jobs with the ``coalesce`` configuration
+property, or per call with ``Task.execute(parameters, coalesce=True)``.
+
+Only jobs running at the same time are coalesced; nothing is cached once a
+job has finished.
+"""
+from __future__ import absolute_import
+
+import copy
+import hashlib
+import json
+import threading
+
+from ..utils import register_at_fork
+
+
+class _Call(object):
+    """
+    A job in flight, shared by its callers.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time.  Concurrent calls with the same
+    key wait for the running call and share its outcome.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        Calls func, unless a call with the same key is in flight.
+
+        :param key: A hashable key identifying the call.
+        :param func: The function to call without arguments.
+        :return: The result of func.  Callers that joined a call in flight
+                 receive a deep copy, so they may modify it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            if waiters and call.error is None:
+                # Snapshot the result before the caller can modify it
+                call.result = copy.deepcopy(result)
+            call.done.set()
+        return result
+
+    def after_fork(self):
+        """
+        Replaces the lock and forgets the calls in flight in a forked child
+        process.  Their leaders are threads of the parent, so waiting for
+        them would never return.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self):
+        """
+        Returns the number of calls in flight.
+        """
+        with self._lock:
+            return len(self._calls)
+
+
+def job_key(input_params, engine, cwd=None, profile=None, version=None, timeout=None,
+            placement=None, limits=None, threads=None):
+    """
+    Returns the canonical hash of a job.  Jobs only share an engine run if
+    they also agree on the options that change how the engine runs, so a
+    job never receives the timeout error or the result of a run with other
+    limits than it asked for.
+
+    :param input_params: The job dictionary passed to taskengine.execute.
+    :param engine: The engine name.
+    :param cwd: The working directory of the engine.
+    :param profile: The engine profile name.
+    :param version: The engine profile version.
+    :param timeout: The timeout of the job.
+    :param placement: The placement of the job, as an object or a dictionary.
+    :param limits: The resource limits of the job, as an object or a dictionary.
+    :param threads: The thread budget of the job.
+    :return: A hex digest string.
+    """
+    options = [timeout, _canonical(placement), _canonical(limits), threads]
+    canonical = json.dumps([engine, profile, version, cwd, input_params, options],
+                           sort_keys=True, separators=(',', ':'), default=str,
+                           ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _canonical(options):
+    """
+    Returns the attributes of an options object such as a Placement as a
+    dictionary, leaving dictionaries and None as they are.
+    """
+    if options is None or isinstance(options, dict):
+        return options
+    return dict((name, value) for name, value in vars(options).items()
+                if not name.startswith('_'))
+
+
+FLIGHTS = SingleFlight()
+"""The single-flight group used by taskengine.execute."""
+register_at_fork(FLIGHTS.after_fork)
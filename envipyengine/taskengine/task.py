@@ -2,18 +2,36 @@
 Implements the Task Engine task class.
 """
 
+import io
+import json
+import logging
+import time
+from collections import OrderedDict
+
 from ..task import Task as BaseTask
 # from gsfcommon.error import TaskNotFoundError
 from ..decorators import memoize
+from ..error import TaskEngineExecutionError, TaskEngineTimeoutError
+from .. import history
+from .. import workdir
+from . import profiling
 from . import taskengine
 
+_LOGGER = logging.getLogger(__name__)
+
 class Task(BaseTask):
     """
     Creates a Task Engine task that can submit jobs and list task parameters.
     """
     def __init__(self, *args, **kwargs):
+        isolate = kwargs.pop('isolate', None)
+        profile = kwargs.pop('profile', None)
+        version = kwargs.pop('version', None)
         super(Task, self).__init__(*args, **kwargs)
         self._engine, self._name = self._uri.split(':')
+        self._isolate = isolate
+        self._profile = profile
+        self._version = version
 
     @property
     def name(self):
@@ -44,14 +62,83 @@ class Task(BaseTask):
         info = self.taskinfo()
         return info['parameters']
 
-    def execute(self, parameters, cwd=None):
+    def execute(self, parameters, cwd=None, rss_interval=None, timeout=None,
+                isolate=None, collect=None, coalesce=None, profiler=False, placement=None,
+                limits=None, threads=None):
         task_input = {'taskName': self._name,
                       'inputParameters': parameters}
+        if profiler:
+            task_input = profiling.wrap(task_input)
+        started = time.time()
+
+        def _run(job_cwd):
+            result = taskengine.execute(task_input, self._engine, cwd=job_cwd,
+                                        rss_interval=rss_interval, timeout=timeout,
+                                        profile=self._profile, version=self._version,
+                                        coalesce=coalesce, placement=placement,
+                                        limits=limits, threads=threads)
+            if profiler:
+                profiling.unwrap(result, started)
+            return result
 
         # cwd passed in takes precedence over task cwd
         if not cwd:
             cwd = self._cwd
-        return taskengine.execute(task_input, self._engine, cwd=cwd)
+        if isolate is None:
+            isolate = self._isolate
+        if not workdir.isolation_enabled(isolate):
+            result = _run(cwd)
+        else:
+            with workdir.WorkDir(destination=cwd, collect=collect) as job_dir:
+                result = _run(job_dir.path)
+                job_dir.collect(result)
+        # Profiled runs include the profiler overhead, and a coalesced run
+        # is recorded by the caller that started it
+        if not profiler and not getattr(result, 'coalesced', False):
+            history.record(self._name, parameters, time.time() - started, result)
+        return result
+
+    def estimate(self, parameters):
+        return history.estimate(self._name, parameters)
+
+    def execute_batch(self, parameters_list, cwd=None, timeout=None):
+        parameters_list = list(parameters_list)
+        if not cwd:
+            cwd = self._cwd
+        task_input = {'taskName': 'BatchExecute',
+                      'inputParameters': {'TASK_NAME': self._name,
+                                          'JOBS': parameters_list}}
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            output = taskengine.execute(task_input, self._engine, cwd=cwd, timeout=timeout,
+                                        profile=self._profile, version=self._version)
+        except TaskEngineExecutionError as error:
+            # Only an engine without BatchExecute runs the jobs one by one, a
+            # batch that failed as a whole is not run again
+            if not taskengine.task_not_found(error, 'BatchExecute'):
+                raise
+            _LOGGER.debug('BatchExecute is not available, running %d jobs one by one',
+                          len(parameters_list))
+            return [self._execute_one(parameters, cwd, deadline)
+                    for parameters in parameters_list]
+
+        results = []
+        for result in output['outputParameters']['RESULTS']:
+            if 'error' in result:
+                results.append(TaskEngineExecutionError(result['error']))
+            else:
+                results.append(taskengine.TaskResult(result))
+        return results
+
+    def _execute_one(self, parameters, cwd, deadline):
+        # The jobs share the timeout of the batch
+        timeout = taskengine.remaining(deadline)
+        try:
+            return self.execute(parameters, cwd=cwd, timeout=timeout)
+        except TaskEngineTimeoutError:
+            raise
+        except TaskEngineExecutionError as error:
+            return error
 
     @memoize
     def taskinfo(self):
@@ -61,73 +148,146 @@ class Task(BaseTask):
         task_input = {'taskName': 'QueryTask',
                       'inputParameters': {"Task_Name": self._name}}
 
-        info = taskengine.execute(task_input, self._engine, cwd=self._cwd)
+        info = taskengine.execute(task_input, self._engine, cwd=self._cwd,
+                                  profile=self._profile, version=self._version)
 
         task_def = info['outputParameters']['DEFINITION']
+        return normalize_definition(task_def)
 
-        task_def['name'] = str(task_def.pop('NAME'))
-        task_def['description'] = str(task_def.pop('DESCRIPTION'))
-        task_def['displayName'] = str(task_def.pop('DISPLAY_NAME'))
-
-        if 'COMMUTE_ON_SUBSET' in task_def:
-            task_def['commute_on_subset'] = task_def.pop('COMMUTE_ON_SUBSET')
-        if 'COMMUTE_ON_DOWNSAMPLE' in task_def:
-            task_def['commute_on_downsample'] = task_def.pop('COMMUTE_ON_DOWNSAMPLE')
-
-        # Convert PARAMETERS into a list instead of a dictionary
-        # which matches the gsf side things
-        task_def['parameters'] = \
-            [v for v in task_def['PARAMETERS'].values()]
-        task_def.pop('PARAMETERS')
-
-        parameters = task_def['parameters']
-        for parameter in parameters:
-            parameter['name'] = str(parameter.pop('NAME'))
-            parameter['description'] = str(parameter.pop('DESCRIPTION'))
-            parameter['display_name'] = str(parameter.pop('DISPLAY_NAME'))
-            parameter['required'] = bool(parameter.pop('REQUIRED'))
-
-            if 'MIN' in parameter:
-                parameter['min'] = parameter.pop('MIN')
-
-            if 'MAX' in parameter:
-                parameter['max'] = parameter.pop('MAX')
-
-            if parameter['TYPE'].count('['):
-                parameter['type'], parameter['dimensions'] = parameter.pop('TYPE').split('[')
-                parameter['dimensions'] = '[' + parameter['dimensions']
-                parameter['type'] = str(parameter['type'])
-            else:
-                parameter['type'] = str(parameter.pop('TYPE').split('ARRAY')[0])
+    def __getstate__(self):
+        # Carry the normalized definition so the copy does not query it again
+        state = self.__dict__.copy()
+        state['_taskinfo'] = Task.taskinfo.cache.get((self,))
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        info = state.pop('_taskinfo', None)
+        self.__dict__.update(state)
+        if info is not None:
+            Task.taskinfo.cache[(self,)] = info
+
+
+# Optional keys of task file parameters, copied as they are
+_TASK_FILE_KEYS = ('min', 'max', 'dimensions', 'fold_case', 'auto_extension',
+                   'is_temporary', 'is_directory')
+
+
+def read_definition(filename):
+    """
+    Reads a .task file into a task definition in the format returned by the
+    QueryTask task, for :func:`normalize_definition`.  Values missing from
+    the file get the defaults the engine reports for them.
 
-            if 'DIMENSIONS' in parameter:
-                parameter['dimensions'] = parameter.pop('DIMENSIONS')
+    :param filename: The path of the .task file.
+    :return: The task definition, or None if the file does not define a task.
+    """
+    with io.open(filename, encoding='utf-8-sig') as task_file:
+        document = json.load(task_file, object_pairs_hook=OrderedDict)
+    if not isinstance(document, dict) or 'name' not in document:
+        return None
+
+    parameters = OrderedDict()
+    for parameter in document.get('parameters', []):
+        name = str(parameter['name']).upper()
+        # Older schemas name the type data_type and mark required parameters
+        # with parameter_type
+        type_name = str(parameter.get('type', parameter.get('data_type', ''))).upper()
+        required = parameter.get('required',
+                                 str(parameter.get('parameter_type', '')).lower() == 'required')
+        definition = OrderedDict((('NAME', name),
+                                  ('DISPLAY_NAME', parameter.get('display_name', name)),
+                                  ('DESCRIPTION', parameter.get('description', '')),
+                                  ('TYPE', type_name),
+                                  ('DIRECTION', str(parameter.get('direction', 'input')).upper()),
+                                  ('REQUIRED', bool(required)),
+                                  ('DEFAULT', parameter.get('default')),
+                                  ('CHOICE_LIST', parameter.get('choice_list'))))
+        for key in _TASK_FILE_KEYS:
+            if parameter.get(key) is not None:
+                definition[key.upper()] = parameter[key]
+        parameters[name] = definition
+
+    return OrderedDict((('NAME', document['name']),
+                        ('DISPLAY_NAME', document.get('display_name', document['name'])),
+                        ('DESCRIPTION', document.get('description', '')),
+                        ('COMMUTE_ON_SUBSET', bool(document.get('commute_on_subset', False))),
+                        ('COMMUTE_ON_DOWNSAMPLE',
+                         bool(document.get('commute_on_downsample', False))),
+                        ('PARAMETERS', parameters)))
+
+
+def normalize_definition(task_def):
+    """
+    Converts a task definition as returned by the QueryTask task into the
+    format returned by Task.taskinfo().  The definition is modified in place.
+
+    :param task_def: A dictionary with the DEFINITION output of QueryTask.
+    :return: The normalized task definition.
+    """
+    task_def['name'] = str(task_def.pop('NAME'))
+    task_def['description'] = str(task_def.pop('DESCRIPTION'))
+    task_def['displayName'] = str(task_def.pop('DISPLAY_NAME'))
+
+    if 'COMMUTE_ON_SUBSET' in task_def:
+        task_def['commute_on_subset'] = task_def.pop('COMMUTE_ON_SUBSET')
+    if 'COMMUTE_ON_DOWNSAMPLE' in task_def:
+        task_def['commute_on_downsample'] = task_def.pop('COMMUTE_ON_DOWNSAMPLE')
 
-            if 'DIRECTION' in parameter:
-                parameter['direction'] = parameter.pop('DIRECTION').lower()
+    # Convert PARAMETERS into a list instead of a dictionary
+    # which matches the gsf side things
+    task_def['parameters'] = \
+        [v for v in task_def['PARAMETERS'].values()]
+    task_def.pop('PARAMETERS')
 
-            if 'DEFAULT' in parameter:
-                if parameter['DEFAULT'] is not None:
-                    parameter['default_value'] = parameter.pop('DEFAULT')
-                else:
-                    parameter.pop('DEFAULT')
+    parameters = task_def['parameters']
+    for parameter in parameters:
+        parameter['name'] = str(parameter.pop('NAME'))
+        parameter['description'] = str(parameter.pop('DESCRIPTION'))
+        parameter['display_name'] = str(parameter.pop('DISPLAY_NAME'))
+        parameter['required'] = bool(parameter.pop('REQUIRED'))
 
-            if 'CHOICE_LIST' in parameter:
-                if parameter['CHOICE_LIST'] is not None:
-                    parameter['choice_list'] = parameter.pop('CHOICE_LIST')
-                else:
-                    parameter.pop('CHOICE_LIST')
+        if 'MIN' in parameter:
+            parameter['min'] = parameter.pop('MIN')
+
+        if 'MAX' in parameter:
+            parameter['max'] = parameter.pop('MAX')
+
+        if parameter['TYPE'].count('['):
+            parameter['type'], parameter['dimensions'] = parameter.pop('TYPE').split('[')
+            parameter['dimensions'] = '[' + parameter['dimensions']
+            parameter['type'] = str(parameter['type'])
+        else:
+            parameter['type'] = str(parameter.pop('TYPE').split('ARRAY')[0])
+
+        if 'DIMENSIONS' in parameter:
+            parameter['dimensions'] = parameter.pop('DIMENSIONS')
+
+        if 'DIRECTION' in parameter:
+            parameter['direction'] = parameter.pop('DIRECTION').lower()
+
+        if 'DEFAULT' in parameter:
+            if parameter['DEFAULT'] is not None:
+                parameter['default_value'] = parameter.pop('DEFAULT')
+            else:
+                parameter.pop('DEFAULT')
+
+        if 'CHOICE_LIST' in parameter:
+            if parameter['CHOICE_LIST'] is not None:
+                parameter['choice_list'] = parameter.pop('CHOICE_LIST')
+            else:
+                parameter.pop('CHOICE_LIST')
 
-            if 'FOLD_CASE' in parameter:
-                parameter['fold_case'] = parameter.pop('FOLD_CASE')
+        if 'FOLD_CASE' in parameter:
+            parameter['fold_case'] = parameter.pop('FOLD_CASE')
 
-            if 'AUTO_EXTENSION' in parameter:
-                parameter['auto_extension'] = parameter.pop('AUTO_EXTENSION')
+        if 'AUTO_EXTENSION' in parameter:
+            parameter['auto_extension'] = parameter.pop('AUTO_EXTENSION')
 
-            if 'IS_TEMPORARY' in parameter:
-                parameter['is_temporary'] = parameter.pop('IS_TEMPORARY')
+        if 'IS_TEMPORARY' in parameter:
+            parameter['is_temporary'] = parameter.pop('IS_TEMPORARY')
 
-            if 'IS_DIRECTORY' in parameter:
-                parameter['is_directory'] = parameter.pop('IS_DIRECTORY')
+        if 'IS_DIRECTORY' in parameter:
+            parameter['is_directory'] = parameter.pop('IS_DIRECTORY')
 
-        return task_def
+    return task_def
@@ -2,20 +2,55 @@
 The Taskengine module provides functions for querying and running tasks.
 """
 
+import errno
 import sys
 import os
+import re
 import shlex
+import shutil
 
 from subprocess import Popen, PIPE
 import subprocess
 import json
+import threading
+import time
 from collections import OrderedDict
 from .. import config
+from . import limits as job_limits
+from . import placement as placements
+from . import resources
+from . import routing
+from . import singleflight
+from . import threads as thread_budget
+from . import tracing
 from ..error import TaskEngineNotFoundError
 from ..error import TaskEngineExecutionError
+from ..error import TaskEngineLimitError
+from ..error import TaskEngineTimeoutError
 from ..error import NoConfigOptionError
 
-def execute(input_params, engine, cwd=None):
+
+class TaskResult(OrderedDict):
+    """
+    The dictionary returned by execute.  In addition to the Task Engine
+    output, the ``resources`` attribute holds the
+    :class:`envipyengine.taskengine.resources.ResourceUsage` of the engine process
+    and the ``profile`` attribute holds the
+    :class:`envipyengine.taskengine.profiling.TaskProfile` of profiled jobs.
+    The ``coalesced`` attribute is True for a copy of the result of an
+    identical job that was already in flight.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TaskResult, self).__init__(*args, **kwargs)
+        self.resources = None
+        self.profile = None
+        self.coalesced = False
+
+
+def execute(input_params, engine, cwd=None, rss_interval=None, timeout=None,
+            profile=None, version=None, coalesce=None, placement=None, limits=None,
+            threads=None):
     """
     Execute a task with the provided input parameters
 
@@ -25,16 +60,347 @@ def execute(input_params, engine, cwd=None):
     :param engine: String specifying Task Engine type to run (ENVI, IDL, etc.)
     :param cwd: Optionally specify the current working directory to be used
                 when spawning the task engine.
+    :param rss_interval: Optionally sample the memory use of the engine process
+                         every rss_interval seconds.  Defaults to the
+                         'rss-sample-interval' config option, if set.
+    :param timeout: Optionally specify the number of seconds after which the
+                    engine process is killed and a TaskEngineTimeoutError raised.
+    :param profile: Optionally specify the name of the engine profile to run on.
+    :param version: Optionally specify the version of the engine profiles to run on.
+    :param coalesce: Set to True to share the engine run of an identical job
+                     that is already in flight, instead of spawning another.
+                     Defaults to the 'coalesce' config option.
+    :param placement: Optionally specify the CPU cores and priorities of the
+                      engine process as a :class:`placement.Placement` or a
+                      dictionary with 'cpus', 'nice' and 'ionice' keys.  It
+                      overrides the placement of the config and the profile.
+    :param limits: Optionally specify the resource limits of the engine
+                   process as a :class:`limits.Limits` or a dictionary with
+                   'memory', 'cpu_seconds' and 'open_files' keys.  They
+                   override the limits of the config and the profile.
+    :param threads: Optionally specify the number of threads the engine may
+                    use, set as IDL_CPU_TPOOL_NTHREADS in its environment.
+                    Defaults to the number of cores of its CPU affinity, if set.
     :return: A python dictionary representing the results JSON string generated
              by the Task Engine.
     """
+    if coalesce is None:
+        coalesce = config.get_boolean('coalesce')
+    if coalesce:
+        key = singleflight.job_key(input_params, engine, cwd or os.getcwd(),
+                                   profile, version, timeout, placement, limits, threads)
+        ran = []
+
+        def _run():
+            ran.append(True)
+            return _traced(input_params, engine, cwd, rss_interval, timeout, profile,
+                           version, placement, limits, threads)
+        result = singleflight.FLIGHTS.do(key, _run)
+        if not ran and isinstance(result, TaskResult):
+            result.coalesced = True
+        return result
+    return _traced(input_params, engine, cwd, rss_interval, timeout, profile, version,
+                   placement, limits, threads)
 
+
+def _traced(input_params, engine, cwd, rss_interval, timeout, profile, version, placement,
+            limits, threads):
+    """
+    Runs the task engine for a job and reports it to the tracing observers.
+    """
+    job = tracing.Job(input_params.get('taskName'), engine, _target(input_params))
     try:
-        taskengine_exe = config.get('engine')
-    except NoConfigOptionError:
-        raise TaskEngineNotFoundError(
-            "Task Engine config option not set." +
-            "\nPlease verify the 'engine' configuration setting.")
+        result = _execute(job, input_params, engine, cwd, rss_interval, timeout,
+                          profile, version, placement, limits, threads)
+    except BaseException as error:
+        job.finish(error)
+        raise
+    job.finish()
+    return result
+
+
+def _execute(job, input_params, engine, cwd, rss_interval, timeout, profile, version,
+             placement, limits, threads):
+    """
+    Runs the task engine for a job, reporting each phase to the tracing observers.
+    """
+    tried = []
+    partition = None
+    enforcement = None
+    with job.phase('config'):
+        selected, args, environment = _route(engine, job.task, profile, version, tried)
+        job.profile = selected.name if selected is not None else None
+        if rss_interval is None:
+            rss_interval = float(config.get('rss-sample-interval', default=0))
+
+    # The selected profile counts this job until the engine exits
+    try:
+        # Hide the Console Window on Windows OS
+        startupinfo = None
+        if sys.platform.startswith('win'):
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        with job.phase('encode'):
+            input_json = json.dumps(input_params, ensure_ascii=False)
+            # taskengine input and output is in UTF8.
+            input_bytes = input_json.encode('utf-8')
+        job.bytes_in = len(input_bytes)
+
+        while True:
+            spawned = time.perf_counter()
+            error = None
+            with job.phase('spawn'):
+                # Errors setting up the placement or the limits are
+                # configuration errors, not failures of the installation
+                placed = placements.resolve(selected, placement)
+                if placed.cpus == placements.AUTO:
+                    if partition is None:
+                        partition = placements.PARTITIONER.acquire()
+                    placed.cpus = partition
+                if enforcement is not None:
+                    enforcement.close()
+                    enforcement = None
+                enforcement = job_limits.Enforcement(job_limits.resolve(selected, limits))
+                wrapper, preexec = _wrap(enforcement, placed)
+                job_threads = threads
+                if job_threads is None and isinstance(placed.cpus, (set, frozenset)):
+                    job_threads = len(placed.cpus)
+                try:
+                    if wrapper and shutil.which(args[0]) is None:
+                        # Behind a wrapper a missing engine would only fail on exec
+                        raise OSError(errno.ENOENT, 'No such file or directory', args[0])
+                    process = Popen(wrapper + args,
+                                    stdout=PIPE,
+                                    stdin=PIPE,
+                                    stderr=PIPE,
+                                    cwd=cwd,
+                                    env=thread_budget.environment(environment, job_threads,
+                                                                  selected),
+                                    preexec_fn=preexec,
+                                    startupinfo=startupinfo)
+                except OSError as spawn_error:
+                    if selected is None:
+                        raise
+                    error = spawn_error
+            if error is not None:
+                # Retry on another installation
+                routing.ROUTER.release(selected)
+                routing.ROUTER.failure(selected, error)
+                tried.append(selected.name)
+                selected = None
+                with job.phase('config'):
+                    selected, args, environment = _route(engine, job.task, profile,
+                                                         version, tried, error)
+                    job.profile = selected.name
+                continue
+            routing.ROUTER.success(selected)
+            break
+        job.pid = process.pid
+
+        sampler = None
+        try:
+            if rss_interval and resources.RSSSampler.available():
+                sampler = resources.RSSSampler(process.pid, rss_interval)
+                sampler.start()
+            stdout, stderr, rusage = _communicate(process, input_bytes, job, timeout)
+        finally:
+            if sampler is not None:
+                sampler.stop()
+        breach = enforcement.breach(process.returncode, stderr.decode('utf-8', 'replace'),
+                                    rusage)
+    finally:
+        routing.ROUTER.release(selected)
+        if partition is not None:
+            placements.PARTITIONER.release(partition)
+        if enforcement is not None:
+            enforcement.close()
+    job.resources = resources.ResourceUsage(time.perf_counter() - spawned,
+                                            rusage, sampler)
+    job.bytes_out = len(stdout)
+    if breach is not None:
+        message = 'Task Engine exceeded its {0} limit of {1}'.format(
+            breach[0].replace('_', ' '), breach[1])
+        if stderr != b'':
+            message += ': ' + stderr.decode('utf-8', 'replace')
+        raise TaskEngineLimitError(message, limit=breach[0], value=breach[1])
+    if process.returncode != 0:
+        if stderr != b'':
+            raise TaskEngineExecutionError(stderr.decode('utf-8'))
+        else:
+            raise TaskEngineExecutionError(
+                'Task Engine exited with code: ' + str(process.returncode))
+
+    with job.phase('decode'):
+        result = TaskResult(json.loads(stdout.decode('utf-8'),
+                                       object_pairs_hook=OrderedDict))
+    result.resources = job.resources
+    return result
+
+
+def task_not_found(error, task_name):
+    """
+    Returns whether a job failed because the engine does not know its task,
+    e.g. 'ENVITASK: No task matches: batchexecute'.
+
+    :param error: The TaskEngineExecutionError raised for the job.
+    :param task_name: The name of the task the job ran.
+    """
+    message = str(error).lower()
+    return bool(_NOT_FOUND.search(message)) and task_name.lower() in message
+
+
+def remaining(deadline):
+    """
+    Returns the seconds left until a deadline, raising a
+    TaskEngineTimeoutError once it has passed.
+
+    :param deadline: A time.time() value, or None for no deadline.
+    :return: The number of seconds, or None without a deadline.
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.time()
+    if left <= 0:
+        raise TaskEngineTimeoutError('Task Engine did not finish within its timeout')
+    return left
+
+
+def _target(input_params):
+    """
+    Returns the name of the task a job runs on behalf of: the TASK_NAME input
+    of the bundled BatchExecute and ProfileTask tasks, the tasks of the steps
+    of a ChainRunner job joined by '>', otherwise the task of the job.
+    """
+    task_name = input_params.get('taskName')
+    if task_name not in BUNDLED_TASKS:
+        return task_name
+    parameters = input_params.get('inputParameters') or {}
+    if parameters.get('STEPS'):
+        return '>'.join(str(step.get('TASK_NAME')) for step in parameters['STEPS'])
+    return parameters.get('TASK_NAME') or task_name
+
+
+def _wrap(*settings):
+    """
+    Returns the commands to run ahead of the engine executable and the
+    preexec function applying a placement or limits.  Settings whose commands
+    are not installed are applied by the preexec function instead.
+    """
+    wrapper = []
+    functions = []
+    for setting in settings:
+        command = setting.command()
+        if command is None:
+            functions.append(setting.preexec())
+        else:
+            wrapper += command
+    return wrapper, _preexec(*functions)
+
+
+def _preexec(*functions):
+    """
+    Returns a function calling each of the given preexec functions that are
+    not None, or None if all of them are None.
+    """
+    functions = [function for function in functions if function is not None]
+    if not functions:
+        return None
+
+    def _call():
+        for function in functions:
+            function()
+    return _call
+
+
+def _route(engine, task_name, profile, version, tried, error=None):
+    """
+    Selects the engine profile for a job, skipping profiles whose engine
+    cannot be found, and resolves its args vector and environment.
+
+    :return: A tuple of the selected profile, or None without profiles,
+             the args vector and the environment.
+    """
+    while True:
+        try:
+            selected = routing.ROUTER.select(task_name, profile=profile, version=version,
+                                             exclude=tried)
+        except TaskEngineNotFoundError:
+            # Report why the last profile failed, rather than that none is left
+            if error is None:
+                raise
+            raise error
+        try:
+            args, environment = _resolve_engine(engine, selected, task_name)
+        except TaskEngineNotFoundError as not_found:
+            if selected is None:
+                raise
+            routing.ROUTER.release(selected)
+            routing.ROUTER.failure(selected, not_found)
+            tried.append(selected.name)
+            error = not_found
+            continue
+        return selected, args, environment
+
+
+def bundled_task_dir():
+    """
+    Returns the directory of the custom tasks shipped with envipyengine, such
+    as QueryTasks.  It is added to the IDL_PATH of the engine for jobs of
+    these tasks unless the 'bundled-tasks' config option is false.
+    """
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'tasks')
+
+
+_NOT_FOUND = re.compile(r'no task matches')
+
+BUNDLED_TASKS = frozenset(('QueryTasks', 'BatchExecute', 'ChainRunner', 'ProfileTask'))
+"""The names of the custom tasks shipped with envipyengine."""
+
+
+def resolve_engine(engine, profile=None, version=None):
+    """
+    Returns the engine profile a job would run on, with the args vector and
+    environment used to spawn its task engine.  The profile is selected like
+    the profile of a job but is not counted against its load.
+
+    :param engine: The engine name passed to the task engine, e.g. 'ENVI'.
+    :param profile: Optionally specify the name of the engine profile.
+    :param version: Optionally specify the version of the engine profiles.
+    :return: A tuple of the selected :class:`routing.Profile`, or None
+             without profiles, the args vector and the environment, which is
+             None if the engine inherits the environment of this process.
+    """
+    selected, args, environment = _route(engine, None, profile, version, [])
+    if selected is not None:
+        routing.ROUTER.release(selected)
+    return selected, args, environment
+
+
+def _resolve_engine(engine, profile=None, task_name=None):
+    """
+    Returns the args vector and environment used to spawn the task engine.
+
+    :param engine: The engine name passed to the task engine, e.g. 'ENVI'.
+    :param profile: Optionally specify the :class:`routing.Profile` to spawn.
+    :param task_name: Optionally specify the name of the task the engine runs.
+                      The bundled custom tasks are put on the IDL_PATH only for
+                      jobs of those tasks.
+    """
+    if profile is not None:
+        taskengine_exe = profile.engine
+        if not taskengine_exe:
+            raise TaskEngineNotFoundError(
+                "Task Engine not set for profile {0}.".format(profile.name) +
+                "\nPlease verify the 'engine' configuration setting.")
+    else:
+        try:
+            taskengine_exe = config.get('engine')
+        except NoConfigOptionError:
+            raise TaskEngineNotFoundError(
+                "Task Engine config option not set." +
+                "\nPlease verify the 'engine' configuration setting.")
 
     if not os.path.exists(taskengine_exe):
         raise TaskEngineNotFoundError(
@@ -43,45 +409,109 @@ def execute(input_params, engine, cwd=None):
 
     # Get any arguments for the taskengine
     engine_args = None
-    try:
-        engine_arg_string = config.get('engine-args')
-        engine_args = shlex.split(engine_arg_string)
-    except NoConfigOptionError:
-        pass
+    if profile is not None:
+        if profile.engine_args:
+            engine_args = shlex.split(profile.engine_args)
+    else:
+        try:
+            engine_arg_string = config.get('engine-args')
+            engine_args = shlex.split(engine_arg_string)
+        except NoConfigOptionError:
+            pass
 
     # Get environment overrides if they exist
     environment = None
     config_environment = config.get_environment()
+    if profile is not None:
+        config_environment.update(profile.environment)
     if config_environment:
         environment = os.environ.copy()
         environment.update(config_environment)
 
+    # Put the bundled custom tasks on the IDL path, after any user code.
+    # Setting IDL_PATH overrides the path of the IDL preferences, so it is
+    # only done for the jobs that need them.
+    if task_name in BUNDLED_TASKS and config.get_boolean('bundled-tasks', default=True):
+        environment = environment or os.environ.copy()
+        idl_path = environment.get('IDL_PATH') or '<IDL_DEFAULT>'
+        environment['IDL_PATH'] = os.pathsep.join((idl_path, bundled_task_dir()))
+
     # Build up the args vector for popen
     args = [taskengine_exe, engine]
     if engine_args:
         args.extend(engine_args)
+    return args, environment
 
-    # Hide the Console Window on Windows OS
-    startupinfo = None
-    if sys.platform.startswith('win'):
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    input_json = json.dumps(input_params, ensure_ascii=False)
-    process = Popen(args,
-                    stdout=PIPE,
-                    stdin=PIPE,
-                    stderr=PIPE,
-                    cwd=cwd,
-                    env=environment,
-                    startupinfo=startupinfo)
-    # taskengine output is in UTF8.  Encode/Decode to UTF8                
-    stdout, stderr = process.communicate(input=input_json.encode('utf-8'))
-    if process.returncode != 0:
-        if stderr != '':
-            raise TaskEngineExecutionError(stderr.decode('utf-8'))
-        else:
-            raise TaskEngineExecutionError(
-                'Task Engine exited with code: ' + str(process.returncode))
-    else:
-        return json.loads(stdout.decode('utf-8'), object_pairs_hook=OrderedDict)
 
+def _communicate(process, input_bytes, job, timeout=None):
+    """
+    Writes the job input to the engine and reads its output, like
+    Popen.communicate, while timing the individual phases.  The engine reads
+    all of its input before producing output, so stdin is written up front;
+    stderr is drained on a separate thread so it cannot block the engine.
+    If a timeout is given, the engine is killed once it expires.
+
+    :return: A tuple of the stdout bytes, stderr bytes and the resource usage
+             of the process as returned by resources.wait.
+    """
+    stderr_chunks = []
+    stderr_reader = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()))
+    stderr_reader.daemon = True
+    stderr_reader.start()
+
+    expired = threading.Event()
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill, (process, expired))
+        timer.daemon = True
+        timer.start()
+
+    try:
+        with job.phase('write_stdin'):
+            try:
+                process.stdin.write(input_bytes)
+            except (IOError, OSError):
+                # The engine exited without reading its input,
+                # the error is reported through the return code.
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except (IOError, OSError):
+                    pass
+
+        with job.phase('engine'):
+            first = process.stdout.read(1)
+
+        with job.phase('read_stdout'):
+            rest = process.stdout.read()
+            process.stdout.close()
+            stderr_reader.join()
+            process.stderr.close()
+            rusage = resources.wait(process)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if expired.is_set() and process.returncode != 0:
+        raise TaskEngineTimeoutError(
+            'Task Engine did not finish within {0} seconds'.format(timeout))
+
+    return first + rest, b''.join(stderr_chunks), rusage
+
+
+def _kill(process, expired):
+    """
+    Kills a process whose job timed out.  The process may exit on its own at
+    the same time, so errors are ignored.
+    """
+    expired.set()
+    try:
+        process.kill()
+    except OSError:
+        pass
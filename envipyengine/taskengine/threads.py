@@ -0,0 +1,76 @@
+"""
+Budgets the threads of concurrent engine processes.
+
+By default IDL sizes its thread pool to every CPU core of the host, so
+running many engines at once starts far more threads than there are cores and
+they slow each other down.  ``taskengine.execute`` accepts a thread budget per
+job and sets ``IDL_CPU_TPOOL_NTHREADS``, along with the thread count variables
+of the OpenMP and BLAS libraries, in the environment of the engine process.
+
+The layers running jobs concurrently compute the budget from their
+concurrency: a :class:`envipyengine.scheduler.Scheduler` gives each job the
+CPU cores of its cost, a :class:`envipyengine.pipeline.Pipeline` and the
+``envipyengine-run`` and ``envipyengine-worker`` commands split the cores
+between their concurrent jobs, and a job pinned to cores by its placement gets
+one thread per core.  A budget can also be set
+with ``Task.execute(parameters, threads=4)``.
+
+Values of these variables set in the 'engine-environment' config section or
+in the environment of an engine profile take precedence over the budget.
+
+:Example:
+
+>>> from envipyengine.taskengine import threads
+>>> threads.budget(16, cpus=32)
+2
+
+"""
+from __future__ import absolute_import
+
+import os
+
+from .. import config
+from .placement import available_cpus
+
+THREAD_VARIABLES = ('IDL_CPU_TPOOL_NTHREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'OPENBLAS_NUM_THREADS')
+"""The environment variables set to the thread budget of a job."""
+
+
+def budget(concurrency, cpus=None):
+    """
+    Returns the number of threads each of a number of concurrent jobs may use.
+
+    :param concurrency: The number of jobs running at once.
+    :param cpus: Optionally specify the number of CPU cores shared by the
+                 jobs.  Defaults to the cores available to the Python process.
+    :return: The number of threads, at least 1.
+    """
+    if cpus is None:
+        cpus = len(available_cpus())
+    return max(1, int(cpus) // max(1, int(concurrency)))
+
+
+def environment(base, threads, profile=None):
+    """
+    Returns the environment of an engine process with its thread budget.
+
+    :param base: The environment dictionary of the engine process, or None
+                 for the environment of the Python process.
+    :param threads: The thread budget of the job, or None for no budget.
+    :param profile: Optionally specify the :class:`routing.Profile` of the job,
+                    whose environment settings take precedence.
+    :return: A new environment dictionary, or base if there is no budget.
+    """
+    if not threads:
+        return base
+    explicit = set(config.get_environment())
+    if profile is not None:
+        explicit.update(profile.environment)
+    variables = [name for name in THREAD_VARIABLES if name not in explicit]
+    if not variables:
+        return base
+    result = dict(os.environ if base is None else base)
+    for name in variables:
+        result[name] = str(int(threads))
+    return result
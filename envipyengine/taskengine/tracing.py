@@ -0,0 +1,345 @@
+"""
+The tracing module reports timed phases of taskengine jobs to observers.
+
+Every call to :func:`envipyengine.taskengine.taskengine.execute` creates a
+:class:`Job` and reports the following phases to all registered observers:
+
+============ ===================================================================
+Phase        Description
+============ ===================================================================
+config       Resolving the engine executable, arguments and environment.
+encode       Encoding the job input as JSON.
+spawn        Starting the engine process.
+write_stdin  Writing the job input to the engine.
+engine       Waiting for the engine to produce its first byte of output.
+read_stdout  Reading the remaining output until the engine exits.
+decode       Decoding the JSON output.
+============ ===================================================================
+
+Spans are tagged with the task name, engine name, process id and the number of
+bytes written to and read from the engine.  Once the engine has exited, the
+``resources`` attribute of the job holds its
+:class:`envipyengine.taskengine.resources.ResourceUsage`.  By default no observers are
+registered and tracing has no effect.
+
+:Example:
+
+Log every phase of every job:
+
+>>> import logging
+>>> from envipyengine.taskengine import tracing
+>>> logging.basicConfig(level=logging.DEBUG)
+>>> tracing.add_observer(tracing.LoggingObserver())
+
+Record a batch and view it in chrome://tracing or https://ui.perfetto.dev:
+
+>>> trace = tracing.ChromeTraceObserver()
+>>> tracing.add_observer(trace)
+>>> # run jobs
+>>> trace.save('jobs.trace.json')
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from ..utils import register_at_fork
+
+_LOGGER = logging.getLogger(__name__)
+
+_OBSERVERS = []
+_OBSERVERS_LOCK = threading.Lock()
+_JOB_IDS = itertools.count(1)
+
+
+class Observer(object):
+    """
+    Base class for tracing observers.  All methods do nothing, so observers
+    only need to implement the notifications they are interested in.
+    """
+
+    def job_started(self, job):
+        """
+        Called when a job starts.
+
+        :param job: The :class:`Job` being executed.
+        """
+        pass
+
+    def after_fork(self):
+        """
+        Called in the child process after ``os.fork()``.  Observers guarding
+        their state with locks replace them here, since a lock held by another
+        thread of the parent would never be released in the child.
+        """
+        pass
+
+    def span(self, job, phase, start, end):
+        """
+        Called when a phase of a job completes.
+
+        :param job: The :class:`Job` being executed.
+        :param phase: The name of the phase.
+        :param start: The start time of the phase in seconds (time.perf_counter).
+        :param end: The end time of the phase in seconds (time.perf_counter).
+        """
+        pass
+
+    def job_finished(self, job):
+        """
+        Called when a job completes, successfully or not.  The ``error``
+        attribute of the job is set if the job failed.
+
+        :param job: The :class:`Job` that was executed.
+        """
+        pass
+
+
+class Job(object):
+    """
+    Describes a single taskengine invocation for tracing observers.
+
+    :param task: The name of the task being executed.
+    :param engine: The name of the engine (ENVI, IDL, etc.).  The engine
+                   profile the job was routed to, if any, is set on the
+                   ``profile`` attribute.
+    :param target: Optionally specify the name of the task the job runs on
+                   behalf of, e.g. the task of a BatchExecute or ProfileTask
+                   job.  Defaults to task.
+    """
+
+    def __init__(self, task, engine, target=None):
+        self.id = next(_JOB_IDS)
+        self.task = task
+        self.target = target or task
+        self.engine = engine
+        self.profile = None
+        self.pid = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = None
+        self.resources = None
+        self.thread = threading.current_thread().ident
+        self.start = time.perf_counter()
+        self.end = None
+        self.phases = {}
+        self._observers = observers()
+        for observer in self._observers:
+            _notify(observer.job_started, self)
+
+    @property
+    def duration(self):
+        """
+        The wall time of the job in seconds, or None if it has not finished.
+        """
+        return None if self.end is None else self.end - self.start
+
+    @property
+    def tags(self):
+        """
+        A dictionary of the tags describing the job.
+        """
+        return {'task': self.task,
+                'target': self.target,
+                'engine': self.engine,
+                'profile': self.profile,
+                'pid': self.pid,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out}
+
+    def phase(self, name):
+        """
+        Returns a context manager that reports a phase of the job.
+
+        :param name: The name of the phase.
+        """
+        return _Phase(self, name)
+
+    def record(self, name, start, end):
+        """
+        Reports a phase of the job that has already been timed.
+
+        :param name: The name of the phase.
+        :param start: The start time of the phase in seconds (time.perf_counter).
+        :param end: The end time of the phase in seconds (time.perf_counter).
+        """
+        self.phases[name] = end - start
+        for observer in self._observers:
+            _notify(observer.span, self, name, start, end)
+
+    def finish(self, error=None):
+        """
+        Marks the job as finished and notifies the observers.
+
+        :param error: The exception that caused the job to fail, if any.
+        """
+        self.end = time.perf_counter()
+        self.error = error
+        for observer in self._observers:
+            _notify(observer.job_finished, self)
+
+
+class _Phase(object):
+    """
+    Context manager timing a phase of a job.
+    """
+    __slots__ = ('_job', '_name', '_start')
+
+    def __init__(self, job, name):
+        self._job = job
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._job.record(self._name, self._start, time.perf_counter())
+        return False
+
+
+class LoggingObserver(Observer):
+    """
+    Observer that logs each phase and a summary of each job.
+
+    :param logger: Optionally specify the logger, defaults to this module's logger.
+    :param level: The logging level used for the messages.
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or _LOGGER
+        self.level = level
+
+    def span(self, job, phase, start, end):
+        self.logger.log(self.level, 'job %d %s:%s pid=%s %s %.6fs',
+                        job.id, job.engine, job.task, job.pid, phase, end - start)
+
+    def job_finished(self, job):
+        resources = job.resources
+        self.logger.log(self.level,
+                        'job %d %s:%s pid=%s finished in %.6fs '
+                        'bytes_in=%d bytes_out=%d cpu=%s peak_rss=%s error=%r',
+                        job.id, job.engine, job.task, job.pid, job.duration,
+                        job.bytes_in, job.bytes_out,
+                        resources.cpu_time if resources else None,
+                        resources.peak_rss if resources else None,
+                        job.error)
+
+
+class ChromeTraceObserver(Observer):
+    """
+    Observer that collects spans in the Chrome trace event format.  Each job
+    is shown as a complete event with its phases nested below it, on the row
+    of the thread that ran it.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+
+    def span(self, job, phase, start, end):
+        self._add(phase, 'phase', job, start, end)
+
+    def job_finished(self, job):
+        self._add(job.task, 'job', job, job.start, job.end,
+                  error=None if job.error is None else repr(job.error),
+                  resources=job.resources.as_dict() if job.resources else None)
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    @property
+    def events(self):
+        """
+        A list of the collected trace events.
+        """
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        """
+        Discards all collected trace events.
+        """
+        with self._lock:
+            del self._events[:]
+
+    def save(self, filename):
+        """
+        Writes the collected events to a JSON trace file.
+
+        :param filename: The path of the trace file.
+        """
+        with open(filename, 'w') as output:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, output)
+
+    def _add(self, name, category, job, start, end, **args):
+        args.update(job.tags)
+        args['job'] = job.id
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': start * 1e6,
+                 'dur': (end - start) * 1e6,
+                 'pid': os.getpid(),
+                 'tid': job.thread,
+                 'args': args}
+        with self._lock:
+            self._events.append(event)
+
+
+def add_observer(observer):
+    """
+    Registers an observer for all subsequent jobs.
+
+    :param observer: An :class:`Observer` object.
+    """
+    global _OBSERVERS  # pylint: disable=global-statement
+    with _OBSERVERS_LOCK:
+        _OBSERVERS = _OBSERVERS + [observer]
+
+
+def remove_observer(observer):
+    """
+    Unregisters an observer.
+
+    :param observer: An :class:`Observer` object previously registered.
+    """
+    global _OBSERVERS  # pylint: disable=global-statement
+    with _OBSERVERS_LOCK:
+        _OBSERVERS = [item for item in _OBSERVERS if item is not observer]
+
+
+def observers():
+    """
+    Returns the list of registered observers.
+    """
+    return _OBSERVERS
+
+
+@register_at_fork
+def _after_fork():
+    """
+    Replaces the observer lock in a forked child process and lets the
+    registered observers replace theirs.
+    """
+    global _OBSERVERS_LOCK  # pylint: disable=global-statement
+    _OBSERVERS_LOCK = threading.Lock()
+    for observer in _OBSERVERS:
+        _notify(observer.after_fork)
+
+
+def _notify(method, *args):
+    """
+    Calls an observer method, logging instead of raising any errors so a
+    faulty observer cannot fail a job.
+    """
+    try:
+        method(*args)
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception('Tracing observer %r failed', method)
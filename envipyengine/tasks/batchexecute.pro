@@ -0,0 +1,55 @@
+;+
+; Runs a task for a list of jobs in one engine invocation.
+;
+; The jobs run one after the other.  The error of a failing job is recorded
+; in its result and the remaining jobs still run.
+;
+; :Keywords:
+;   TASK_NAME: in, required, type=string
+;     The name of the task to run.
+;   JOBS: in, required, type=list
+;     A hash with the input parameters of each job.
+;   RESULTS: out, type=list
+;     For each job, a hash with either the outputParameters of the job or
+;     the error message in error.
+;-
+function batchexecute_job, taskName, parameters
+  compile_opt idl2, hidden
+
+  task = ENVITask(taskName)
+  foreach value, parameters, name do begin
+    if (isa(value, 'HASH') && value.HasKey('factory')) then value = ENVIHydrate(value)
+    task.Parameter(name).value = value
+  endforeach
+  task.Execute
+
+  outputs = orderedhash()
+  foreach name, task.ParameterNames() do begin
+    parameter = task.Parameter(name)
+    if (strupcase(parameter.direction) ne 'OUTPUT') then continue
+    value = parameter.value
+    if (isa(value, 'ENVIRASTER') || isa(value, 'ENVIVECTOR') || isa(value, 'ENVIROI')) then begin
+      value = value.Dehydrate()
+    endif
+    outputs[strupcase(name)] = value
+  endforeach
+
+  return, orderedhash('outputParameters', outputs)
+end
+
+
+pro batchexecute, TASK_NAME=taskName, JOBS=jobs, RESULTS=results
+  compile_opt idl2
+
+  results = list()
+  foreach parameters, jobs do begin
+    catch, error
+    if (error ne 0) then begin
+      catch, /CANCEL
+      results.Add, orderedhash('error', !error_state.msg)
+      continue
+    endif
+    results.Add, batchexecute_job(taskName, parameters)
+    catch, /CANCEL
+  endforeach
+end
@@ -0,0 +1,77 @@
+;+
+; Runs a linear chain of tasks in one engine invocation.
+;
+; The outputs of each step stay in memory and are passed to the steps that
+; reference them.  The unspecified output URIs of all steps but the last are
+; set to '!', so their outputs are virtual and never written to disk.
+;
+; :Keywords:
+;   STEPS: in, required, type=list
+;     A hash for each step with its NAME, TASK_NAME and INPUT_PARAMETERS.
+;   OUTPUT_PARAMETERS: out, type=orderedhash
+;     The output parameters of the last step.
+;   FAILED_STEP: out, type=string
+;     The name of the step that failed, if any.
+;   ERROR: out, type=string
+;     The error message of the failed step.
+;-
+function chainrunner_resolve, value, outputs
+  compile_opt idl2, hidden
+
+  if (isa(value, 'HASH') && value.HasKey('REFERENCE')) then begin
+    reference = value['REFERENCE']
+    return, (outputs[reference['STEP']])[reference['PARAMETER']]
+  endif
+  if (isa(value, 'HASH') && value.HasKey('factory')) then return, ENVIHydrate(value)
+  return, value
+end
+
+
+pro chainrunner, STEPS=steps, OUTPUT_PARAMETERS=outputParameters, $
+                 FAILED_STEP=failedStep, ERROR=message
+  compile_opt idl2
+
+  outputs = hash()
+  foreach step, steps, index do begin
+    catch, error
+    if (error ne 0) then begin
+      catch, /CANCEL
+      failedStep = step['NAME']
+      message = !error_state.msg
+      return
+    endif
+
+    task = ENVITask(step['TASK_NAME'])
+    parameters = step['INPUT_PARAMETERS']
+    foreach value, parameters, name do begin
+      task.Parameter(name).value = chainrunner_resolve(value, outputs)
+    endforeach
+
+    last = index eq n_elements(steps) - 1
+    names = task.ParameterNames()
+    if (~last) then begin
+      foreach name, names do begin
+        uri = name + '_URI'
+        if (total(names eq uri) && ~parameters.HasKey(uri)) then task.Parameter(uri).value = '!'
+      endforeach
+    endif
+
+    task.Execute
+    catch, /CANCEL
+
+    stepOutputs = orderedhash()
+    foreach name, names do begin
+      parameter = task.Parameter(name)
+      if (strupcase(parameter.direction) eq 'OUTPUT') then stepOutputs[name] = parameter.value
+    endforeach
+    outputs[step['NAME']] = stepOutputs
+  endforeach
+
+  outputParameters = orderedhash()
+  foreach value, stepOutputs, name do begin
+    if (isa(value, 'ENVIRASTER') || isa(value, 'ENVIVECTOR') || isa(value, 'ENVIROI')) then begin
+      value = value.Dehydrate()
+    endif
+    outputParameters[name] = value
+  endforeach
+end
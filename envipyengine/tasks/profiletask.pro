@@ -0,0 +1,62 @@
+;+
+; Runs a task with the IDL profiler enabled.
+;
+; INIT is the time the engine finished starting up and began running this
+; procedure, TASK_START and TASK_END enclose the execution of the task.
+;
+; :Keywords:
+;   TASK_NAME: in, required, type=string
+;     The name of the task to run.
+;   INPUT_PARAMETERS: in, optional, type=hash
+;     The input parameters of the task.
+;   OUTPUT_PARAMETERS: out, type=orderedhash
+;     The output parameters of the task.
+;   PROFILE: out, type=list
+;     A hash for each routine called with its NAME, COUNT, ONLY_TIME, TIME
+;     and SYSTEM flag.
+;   TIMESTAMPS: out, type=orderedhash
+;     The INIT, TASK_START and TASK_END times in seconds since the epoch.
+;-
+pro profiletask, TASK_NAME=taskName, INPUT_PARAMETERS=parameters, $
+                 OUTPUT_PARAMETERS=outputParameters, PROFILE=profile, TIMESTAMPS=timestamps
+  compile_opt idl2
+
+  timestamps = orderedhash('INIT', systime(1))
+
+  task = ENVITask(taskName)
+  if (isa(parameters, 'HASH')) then begin
+    foreach value, parameters, name do begin
+      if (isa(value, 'HASH') && value.HasKey('factory')) then value = ENVIHydrate(value)
+      task.Parameter(name).value = value
+    endforeach
+  endif
+
+  profiler, /RESET
+  profiler, /SYSTEM
+  profiler
+  timestamps['TASK_START'] = systime(1)
+  task.Execute
+  timestamps['TASK_END'] = systime(1)
+  profiler, /REPORT, DATA=data
+  profiler, /CLEAR, /SYSTEM
+  profiler, /CLEAR
+
+  profile = list()
+  foreach entry, data do begin
+    if (entry.count eq 0) then continue
+    profile.Add, orderedhash('NAME', entry.name, 'COUNT', entry.count, $
+                             'ONLY_TIME', entry.only_time, 'TIME', entry.time, $
+                             'SYSTEM', entry.system)
+  endforeach
+
+  outputParameters = orderedhash()
+  foreach name, task.ParameterNames() do begin
+    parameter = task.Parameter(name)
+    if (strupcase(parameter.direction) ne 'OUTPUT') then continue
+    value = parameter.value
+    if (isa(value, 'ENVIRASTER') || isa(value, 'ENVIVECTOR') || isa(value, 'ENVIROI')) then begin
+      value = value.Dehydrate()
+    endif
+    outputParameters[strupcase(name)] = value
+  endforeach
+end
@@ -0,0 +1,74 @@
+;+
+; Returns the definitions of a list of tasks in one engine invocation.
+;
+; Each definition has the same keys as the DEFINITION output of the
+; QueryTask task, so it can be normalized by envipyengine in the same way.
+;
+; :Keywords:
+;   TASK_NAMES: in, optional, type=strarr
+;     The names of the tasks to query. All tasks are queried if not set.
+;   DEFINITIONS: out, type=orderedhash
+;     The task definitions keyed by task name.
+;-
+function querytasks_parameter, task, name
+  compile_opt idl2, hidden
+
+  parameter = task.Parameter(name)
+  definition = orderedhash()
+  definition['NAME'] = parameter.name
+  definition['DISPLAY_NAME'] = parameter.display_name
+  definition['DESCRIPTION'] = parameter.description
+  definition['TYPE'] = strupcase(parameter.type)
+  definition['DIRECTION'] = strupcase(parameter.direction)
+  definition['REQUIRED'] = parameter.required
+  definition['DEFAULT'] = parameter.default
+  definition['CHOICE_LIST'] = parameter.choice_list
+
+  foreach key, ['MIN', 'MAX', 'DIMENSIONS', 'FOLD_CASE', 'AUTO_EXTENSION', $
+                'IS_TEMPORARY', 'IS_DIRECTORY'] do begin
+    catch, error
+    if (error ne 0) then begin
+      catch, /CANCEL
+      continue
+    endif
+    case key of
+      'MIN': value = parameter.min
+      'MAX': value = parameter.max
+      'DIMENSIONS': value = parameter.dimensions
+      'FOLD_CASE': value = parameter.fold_case
+      'AUTO_EXTENSION': value = parameter.auto_extension
+      'IS_TEMPORARY': value = parameter.is_temporary
+      'IS_DIRECTORY': value = parameter.is_directory
+    endcase
+    catch, /CANCEL
+    if (value ne !NULL) then definition[key] = value
+  endforeach
+
+  return, definition
+end
+
+
+pro querytasks, TASK_NAMES=taskNames, DEFINITIONS=definitions
+  compile_opt idl2
+
+  e = envi(/CURRENT)
+  if (n_elements(taskNames) eq 0) then taskNames = e.task_names
+
+  definitions = orderedhash()
+  foreach name, taskNames do begin
+    task = ENVITask(name)
+    parameters = orderedhash()
+    foreach parameterName, task.ParameterNames() do begin
+      parameters[parameterName] = querytasks_parameter(task, parameterName)
+    endforeach
+
+    definition = orderedhash()
+    definition['NAME'] = task.name
+    definition['DISPLAY_NAME'] = task.display_name
+    definition['DESCRIPTION'] = task.description
+    definition['COMMUTE_ON_SUBSET'] = task.commute_on_subset
+    definition['COMMUTE_ON_DOWNSAMPLE'] = task.commute_on_downsample
+    definition['PARAMETERS'] = parameters
+    definitions[name] = definition
+  endforeach
+end
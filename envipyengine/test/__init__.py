@@ -1,7 +1,15 @@
 """
 Contains the test suite for the envipyengine.  Helper methods are avaible here.
 """
+import contextlib
 import os
+import shutil
+import tempfile
+import unittest
+
+from .. import config
+from ..taskengine import tracing
+
 
 def task_dir():
     """Returns the directory containing IDL/ENVI tasks for testing"""
@@ -20,3 +28,73 @@ def workspace_dir():
     if not os.path.isdir(temp_dir):
         os.mkdir(temp_dir)
     return temp_dir
+
+def stub_engine():
+    """Returns the path to the stub taskengine executable"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubengine.py')
+
+@contextlib.contextmanager
+def stub_config(environment=None, **properties):
+    """
+    Context manager that points the config at temporary config files with the
+    'engine' option set to the stub taskengine.  The real config files are not
+    touched.  Additional config properties are given as keywords, with
+    underscores in the names replaced by dashes.
+
+    :param environment: Optionally specify a dictionary of engine environment settings.
+    :return: The temporary directory holding the config files.
+    """
+    temp_dir = tempfile.mkdtemp()
+    saved = (config._USER_CONFIG_FILE, config._SYSTEM_CONFIG_FILE)
+    config._USER_CONFIG_FILE = os.path.join(temp_dir, 'user', 'settings.cfg')
+    config._SYSTEM_CONFIG_FILE = os.path.join(temp_dir, 'system', 'settings.cfg')
+    try:
+        config.set('engine', stub_engine())
+        for name, value in properties.items():
+            config.set(name.replace('_', '-'), str(value))
+        if environment:
+            config.set_environment(environment)
+        yield temp_dir
+    finally:
+        config._USER_CONFIG_FILE, config._SYSTEM_CONFIG_FILE = saved
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class JobObserver(tracing.Observer):
+    """Tracing observer recording every job started by the engine"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def job_started(self, job):
+        self.jobs.append(job)
+
+    @property
+    def tasks(self):
+        """The task names of the jobs in the order they started"""
+        return [job.task for job in self.jobs]
+
+    @property
+    def profiles(self):
+        """The names of the engine profiles the jobs were routed to"""
+        return [job.profile for job in self.jobs]
+
+
+class StubEngineTestCase(unittest.TestCase):
+    """
+    Base class of the tests against the stub engine.  Each test runs with the
+    config of :func:`stub_config`, whose directory is ``self.temp_dir``, and
+    the jobs it starts are recorded by the :class:`JobObserver` ``self.observer``.
+    Subclasses set ``stub_properties`` to pass config properties to
+    :func:`stub_config`.
+    """
+
+    stub_properties = {}
+
+    def setUp(self):
+        config_dir = stub_config(**self.stub_properties)
+        self.temp_dir = config_dir.__enter__()
+        self.addCleanup(config_dir.__exit__, None, None, None)
+        self.observer = JobObserver()
+        tracing.add_observer(self.observer)
+        self.addCleanup(tracing.remove_observer, self.observer)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+A stand-in for the taskengine executable used by the tests and benchmarks.
+
+The stub speaks the same protocol as taskengine: the engine name is the first
+command line argument, the job is read as JSON from stdin and the result is
+written as JSON to stdout.  Errors are written to stderr with a nonzero exit
+code.
+
+The following environment variables or job input parameters control the stub:
+
+======================== ============== ==========================================
+Environment Variable     Parameter      Description
+======================== ============== ==========================================
+STUB_TASKENGINE_DELAY    STUB_DELAY     Seconds to sleep before responding.
+STUB_TASKENGINE_PAYLOAD  STUB_PAYLOAD   Number of bytes of padding to add to the
+                                        output in the PAYLOAD output parameter.
+STUB_TASKENGINE_ALLOCATE STUB_ALLOCATE  Number of bytes of memory to allocate.
+STUB_TASKENGINE_SPIN     STUB_SPIN      CPU seconds to spend in a busy loop.
+STUB_TASKENGINE_OPEN     STUB_OPEN      Number of files to open at once.
+======================== ============== ==========================================
+
+Like taskengine, the stub finds custom tasks in the .task files of the
+directories on IDL_PATH.  Of the custom tasks shipped with envipyengine, it
+implements QueryTasks, BatchExecute, ChainRunner and ProfileTask.  Output URIs of '!'
+create virtual outputs that are not written to disk.
+"""
+import json
+import os
+import sys
+import time
+
+ENGINES = ('ENVI', 'IDL')
+
+
+def _parameter(name, type_name, direction, required=False, **extra):
+    definition = {'NAME': name,
+                  'DISPLAY_NAME': name.replace('_', ' ').title(),
+                  'DESCRIPTION': 'The ' + name.lower().replace('_', ' ') + '.',
+                  'TYPE': type_name,
+                  'DIRECTION': direction,
+                  'REQUIRED': required,
+                  'DEFAULT': None,
+                  'CHOICE_LIST': None}
+    definition.update(extra)
+    return definition
+
+
+def _task(name, description, parameters):
+    return {'NAME': name,
+            'DISPLAY_NAME': name,
+            'DESCRIPTION': description,
+            'COMMUTE_ON_SUBSET': False,
+            'COMMUTE_ON_DOWNSAMPLE': False,
+            'PARAMETERS': dict((parameter['NAME'], parameter)
+                               for parameter in parameters)}
+
+
+TASKS = {
+    'SpectralIndex': _task(
+        'SpectralIndex',
+        'This task creates a spectral index raster for classification.',
+        [_parameter('INPUT_RASTER', 'ENVIRASTER', 'INPUT', required=True),
+         _parameter('INDEX', 'STRING', 'INPUT', required=True,
+                    CHOICE_LIST=['Normalized Difference Vegetation Index']),
+         _parameter('OUTPUT_RASTER_URI', 'STRING', 'INPUT',
+                    AUTO_EXTENSION='.dat', IS_TEMPORARY=True),
+         _parameter('OUTPUT_RASTER', 'ENVIRASTER', 'OUTPUT', required=True)]),
+    'ClassificationToShapefile': _task(
+        'ClassificationToShapefile',
+        'This task exports classes from a classification raster to a shapefile.',
+        [_parameter('INPUT_RASTER', 'ENVIRASTER', 'INPUT', required=True),
+         _parameter('EXPORT_CLASSES', 'STRING[*]', 'INPUT'),
+         _parameter('OUTPUT_VECTOR_URI', 'STRING', 'INPUT',
+                    AUTO_EXTENSION='.shp', IS_TEMPORARY=True),
+         _parameter('OUTPUT_VECTOR', 'ENVIVECTOR', 'OUTPUT', required=True)]),
+    'ROIToClassification': _task(
+        'ROIToClassification',
+        'This task creates a classification raster from regions of interest.',
+        [_parameter('INPUT_RASTER', 'ENVIRASTER', 'INPUT', required=True),
+         _parameter('INPUT_ROI', 'ENVIROIARRAY', 'INPUT', required=True),
+         _parameter('OUTPUT_RASTER_URI', 'STRING', 'INPUT',
+                    AUTO_EXTENSION='.dat', IS_TEMPORARY=True),
+         _parameter('OUTPUT_RASTER', 'ENVIRASTER', 'OUTPUT', required=True)]),
+    'getcwd': _task(
+        'getcwd',
+        'Returns the current working directory of the engine.',
+        [_parameter('CWD', 'STRING', 'OUTPUT', required=True)]),
+    'Sleep': _task(
+        'Sleep',
+        'Sleeps for a number of seconds.',
+        [_parameter('SECONDS', 'DOUBLE', 'INPUT', MIN=0),
+         _parameter('SLEPT', 'DOUBLE', 'OUTPUT', required=True)]),
+    'Fail': _task(
+        'Fail',
+        'Always fails with the given message.',
+        [_parameter('MESSAGE', 'STRING', 'INPUT'),
+         _parameter('EXIT_CODE', 'INT', 'INPUT')]),
+}
+
+
+class StubError(Exception):
+    """Error reported on stderr with the exit code."""
+    def __init__(self, message, exit_code=1):
+        super(StubError, self).__init__(message)
+        self.exit_code = exit_code
+
+
+def _definition(name):
+    for task_name, definition in TASKS.items():
+        if task_name.lower() == str(name).lower():
+            return definition
+    raise StubError('ENVITASK: No task matches: ' + str(name).lower())
+
+
+def _custom_tasks():
+    """Returns the names of the custom tasks found on IDL_PATH."""
+    names = set()
+    for directory in os.environ.get('IDL_PATH', '').split(os.pathsep):
+        directory = directory.lstrip('+')
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if filename.endswith('.task'):
+                names.add(os.path.splitext(filename)[0])
+    return names
+
+
+def _write_raster(uri):
+    header = os.path.splitext(uri)[0] + '.hdr'
+    with open(uri, 'wb') as output:
+        output.write(b'\0' * 64)
+    with open(header, 'w') as output:
+        output.write('ENVI\nsamples = 8\nlines = 8\nbands = 1\ndata type = 1\n')
+    return {'url': uri, 'factory': 'URLRaster', 'auxiliary_url': [header]}
+
+
+def run_task(name, parameters):
+    """Runs one of the stub tasks and returns its output parameters."""
+    definition = _definition(name)
+    name = definition['NAME']
+    upper = dict((key.upper(), value) for key, value in parameters.items())
+
+    if name == 'Fail':
+        raise StubError(upper.get('MESSAGE', 'Task failed'),
+                        int(upper.get('EXIT_CODE', 1)))
+    if name == 'getcwd':
+        return {'CWD': os.getcwd()}
+    if name == 'Sleep':
+        seconds = float(upper.get('SECONDS', 0))
+        time.sleep(seconds)
+        return {'SLEPT': seconds}
+
+    for parameter in definition['PARAMETERS'].values():
+        if parameter['REQUIRED'] and parameter['DIRECTION'] == 'INPUT' and \
+                parameter['NAME'] not in upper:
+            raise StubError('{0}: Parameter {1} is required'.format(
+                name.upper(), parameter['NAME']))
+
+    outputs = {}
+    for key, parameter in definition['PARAMETERS'].items():
+        if parameter['DIRECTION'] != 'OUTPUT':
+            continue
+        uri = upper.get(key + '_URI') or \
+            os.path.join(os.getcwd(), 'stub_{0}_{1}.dat'.format(
+                name.lower(), os.getpid()))
+        if uri == '!':
+            outputs[key] = {'factory': 'Virtual', 'type': parameter['TYPE']}
+        elif parameter['TYPE'] == 'ENVIRASTER':
+            outputs[key] = _write_raster(uri)
+        else:
+            outputs[key] = {'url': uri}
+    return outputs
+
+
+def handle(engine, job):
+    """Handles a single job and returns the JSON response."""
+    if engine not in ENGINES:
+        raise StubError('Unknown engine: ' + engine)
+    task_name = job['taskName']
+    parameters = job.get('inputParameters') or {}
+
+    if task_name == 'QueryTaskCatalog':
+        outputs = {'TASKS': sorted(TASKS)}
+    elif task_name == 'QueryTask':
+        outputs = {'DEFINITION': _definition(parameters['TASK_NAME'] if
+                                             'TASK_NAME' in parameters else
+                                             parameters['Task_Name'])}
+    elif task_name == 'QueryTasks' and task_name in _custom_tasks():
+        names = parameters.get('TASK_NAMES') or sorted(TASKS)
+        outputs = {'DEFINITIONS': dict((name, _definition(name)) for name in names)}
+    elif task_name == 'BatchExecute' and task_name in _custom_tasks():
+        outputs = {'RESULTS': [_run_job(parameters['TASK_NAME'], job)
+                               for job in parameters['JOBS']]}
+    elif task_name == 'ProfileTask' and task_name in _custom_tasks():
+        outputs = _run_profiled(parameters['TASK_NAME'],
+                                parameters.get('INPUT_PARAMETERS') or {})
+    elif task_name == 'ChainRunner' and task_name in _custom_tasks():
+        outputs = _run_chain(parameters['STEPS'])
+    else:
+        outputs = run_task(task_name, parameters)
+    return {'outputParameters': outputs}
+
+
+def _run_profiled(task_name, parameters):
+    init = time.time()
+    definition = _definition(task_name)
+    task_start = time.time()
+    outputs = run_task(task_name, parameters)
+    task_end = time.time()
+    routines = [{'NAME': definition['NAME'].upper(), 'COUNT': 1,
+                 'ONLY_TIME': task_end - task_start, 'TIME': task_end - task_start,
+                 'SYSTEM': 0},
+                {'NAME': 'ENVITASK', 'COUNT': 1, 'ONLY_TIME': task_start - init,
+                 'TIME': task_start - init, 'SYSTEM': 1}]
+    return {'OUTPUT_PARAMETERS': outputs,
+            'PROFILE': routines,
+            'TIMESTAMPS': {'INIT': init, 'TASK_START': task_start, 'TASK_END': task_end}}
+
+
+def _run_chain(steps):
+    outputs = {}
+    for index, step in enumerate(steps):
+        definition = _definition(step['TASK_NAME'])
+        parameters = {}
+        for key, value in step['INPUT_PARAMETERS'].items():
+            if isinstance(value, dict) and 'REFERENCE' in value:
+                reference = value['REFERENCE']
+                value = outputs[reference['STEP']][reference['PARAMETER']]
+            parameters[key.upper()] = value
+        if index < len(steps) - 1:
+            for key in definition['PARAMETERS']:
+                if key + '_URI' in definition['PARAMETERS']:
+                    parameters.setdefault(key + '_URI', '!')
+        try:
+            outputs[step['NAME']] = run_task(step['TASK_NAME'], parameters)
+        except StubError as error:
+            return {'FAILED_STEP': step['NAME'], 'ERROR': str(error)}
+    return {'OUTPUT_PARAMETERS': outputs[steps[-1]['NAME']]}
+
+
+def _run_job(task_name, parameters):
+    try:
+        return {'outputParameters': run_task(task_name, parameters)}
+    except StubError as error:
+        return {'error': str(error)}
+
+
+def _consume(allocate, spin, files):
+    """Uses memory, CPU time and open files, failing like the engine would."""
+    try:
+        memory = bytearray(allocate)
+    except MemoryError:
+        raise StubError('Unable to allocate memory: to make array.')
+    deadline = time.process_time() + spin
+    while time.process_time() < deadline:
+        pass
+    opened = []
+    try:
+        for _ in range(files):
+            opened.append(open(os.devnull))
+    except (IOError, OSError) as error:
+        raise StubError('OPENR: Error opening file. ' + str(error))
+    finally:
+        for handle_file in opened:
+            handle_file.close()
+    del memory
+
+
+def main():
+    """Reads the job from stdin and writes the result to stdout."""
+    engine = sys.argv[1] if len(sys.argv) > 1 else ''
+    raw = sys.stdin.buffer.read() if hasattr(sys.stdin, 'buffer') else sys.stdin.read()
+    try:
+        job = json.loads(raw.decode('utf-8'))
+        parameters = job.get('inputParameters') or {}
+        delay = float(parameters.pop('STUB_DELAY', None) or
+                      os.environ.get('STUB_TASKENGINE_DELAY', 0))
+        payload = int(parameters.pop('STUB_PAYLOAD', None) or
+                      os.environ.get('STUB_TASKENGINE_PAYLOAD', 0))
+        allocate = int(parameters.pop('STUB_ALLOCATE', None) or
+                       os.environ.get('STUB_TASKENGINE_ALLOCATE', 0))
+        spin = float(parameters.pop('STUB_SPIN', None) or
+                     os.environ.get('STUB_TASKENGINE_SPIN', 0))
+        files = int(parameters.pop('STUB_OPEN', None) or
+                    os.environ.get('STUB_TASKENGINE_OPEN', 0))
+        if delay:
+            time.sleep(delay)
+        _consume(allocate, spin, files)
+        response = handle(engine, job)
+    except StubError as error:
+        sys.stderr.write(str(error))
+        return error.exit_code
+    if payload:
+        response['outputParameters']['PAYLOAD'] = 'x' * payload
+    output = json.dumps(response).encode('utf-8')
+    if hasattr(sys.stdout, 'buffer'):
+        sys.stdout.buffer.write(output)
+    else:
+        sys.stdout.write(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
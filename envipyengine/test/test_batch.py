@@ -0,0 +1,93 @@
+"""
+Tests the JSON lines batch runner
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from envipyengine import batch, Engine
+from envipyengine.error import TaskEngineTimeoutError
+
+from .. import test
+
+
+def _jobs(*jobs):
+    return [json.dumps(job) + '\n' for job in jobs]
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Test running batches against the stub engine
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_run(self):
+        """Results and errors are written as JSON lines."""
+        output = io.StringIO()
+        progress = batch.run(
+            _jobs({'id': 'a', 'task': 'Sleep', 'parameters': {'SECONDS': 0}},
+                  {'task': 'ENVI:Fail', 'parameters': {'MESSAGE': 'boom'}},
+                  {'parameters': {}}) + ['not json\n'],
+            output, max_workers=2)
+        records = dict((record['id'], record) for record in
+                       (json.loads(line) for line in output.getvalue().splitlines()))
+        self.assertEqual(records['a']['status'], batch.SUCCEEDED)
+        self.assertEqual(records['a']['task'], 'ENVI:Sleep')
+        self.assertEqual(records['a']['result']['outputParameters']['SLEPT'], 0)
+        self.assertEqual(records[2]['status'], batch.FAILED)
+        self.assertIn('boom', records[2]['error'])
+        self.assertIn('no task', records[3]['error'])
+        self.assertIn('Invalid job on line 4', records[4]['error'])
+        self.assertEqual((progress.succeeded, progress.failed), (1, 3))
+
+    def test_streaming(self):
+        """Jobs are read lazily, only a small window is in flight."""
+        output = io.StringIO()
+        in_flight = []
+
+        def _lines():
+            for index in range(20):
+                in_flight.append(index - len(output.getvalue().splitlines()))
+                yield json.dumps({'task': 'Sleep', 'parameters': {'SECONDS': 0}})
+
+        batch.run(_lines(), output, max_workers=2)
+        self.assertEqual(len(output.getvalue().splitlines()), 20)
+        self.assertLessEqual(max(in_flight), 4)
+
+    def test_timeout(self):
+        """Jobs exceeding the timeout are killed."""
+        start = time.time()
+        with self.assertRaises(TaskEngineTimeoutError):
+            Engine('ENVI').task('Sleep').execute({'SECONDS': 30}, timeout=0.5)
+        self.assertLess(time.time() - start, 10)
+
+    def test_resume(self):
+        """Resumed runs skip the jobs that succeeded."""
+        jobs = os.path.join(self.temp_dir, 'jobs.jsonl')
+        results = os.path.join(self.temp_dir, 'results.jsonl')
+        with open(jobs, 'w') as job_file:
+            job_file.writelines(_jobs(
+                {'id': 'a', 'task': 'Sleep', 'parameters': {'SECONDS': 0}},
+                {'id': 'b', 'task': 'Fail', 'parameters': {'MESSAGE': 'boom'}}))
+        self.assertEqual(batch.main([jobs, '-o', results, '-q']), 1)
+        self.assertEqual(batch.completed_jobs(results), set(['a']))
+        # A line cut short by a killed run is ignored
+        with open(results, 'a') as result_file:
+            result_file.write('{"id": "b", "sta')
+        self.assertEqual(batch.main([jobs, '-o', results, '-q', '--resume']), 1)
+        with open(results) as result_file:
+            ids = [json.loads(line)['id'] for line in result_file if line.endswith('}\n')]
+        self.assertEqual(ids.count('a'), 1)
+        # Failed jobs are run again
+        self.assertEqual(ids.count('b'), 2)
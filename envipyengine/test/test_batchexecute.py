@@ -0,0 +1,62 @@
+"""
+Tests running many jobs in one engine run with the bundled BatchExecute task
+"""
+
+from envipyengine import Engine
+from envipyengine.error import TaskEngineExecutionError, TaskEngineLimitError
+from envipyengine.error import TaskEngineTimeoutError
+from envipyengine.taskengine import limits
+
+from .. import test
+
+
+class TestBatchExecute(test.StubEngineTestCase):
+    """
+    Test Task.execute_batch against the stub engine
+    """
+
+    def test_batch(self):
+        """All jobs run in one engine run."""
+        results = Engine('ENVI').task('Sleep').execute_batch(
+            [{'SECONDS': 0}, {'SECONDS': 0.1}, {'SECONDS': 0.2}])
+        self.assertEqual(self.observer.tasks, ['BatchExecute'])
+        self.assertEqual([result['outputParameters']['SLEPT'] for result in results],
+                         [0, 0.1, 0.2])
+
+    def test_errors(self):
+        """Failing jobs do not stop the others."""
+        task = Engine('ENVI', cwd=self.temp_dir).task('SpectralIndex')
+        results = task.execute_batch([{'INPUT_RASTER': {'url': 'a.dat'}, 'INDEX': 'NDVI'},
+                                      {'INPUT_RASTER': {'url': 'b.dat'}},
+                                      {'INPUT_RASTER': {'url': 'c.dat'}, 'INDEX': 'NDVI'}])
+        self.assertIn('OUTPUT_RASTER', results[0]['outputParameters'])
+        self.assertIsInstance(results[1], TaskEngineExecutionError)
+        self.assertIn('INDEX', str(results[1]))
+        self.assertIn('OUTPUT_RASTER', results[2]['outputParameters'])
+        self.assertEqual(self.observer.tasks, ['BatchExecute'])
+
+    def test_fallback(self):
+        """Engines without BatchExecute run each job."""
+        with test.stub_config(bundled_tasks='false'):
+            results = Engine('ENVI').task('Fail').execute_batch(
+                [{'MESSAGE': 'first'}, {'MESSAGE': 'second'}])
+        self.assertEqual([str(result) for result in results], ['first', 'second'])
+        self.assertEqual(self.observer.tasks, ['BatchExecute', 'Fail', 'Fail'])
+
+    def test_batch_failure(self):
+        """A batch that fails as a whole is not run again job by job."""
+        if limits.resource is None:
+            self.skipTest('Resource limits are not supported')
+        with test.stub_config(limit_open_files=16,
+                              environment={'STUB_TASKENGINE_OPEN': '64'}):
+            with self.assertRaises(TaskEngineLimitError):
+                Engine('ENVI').task('Sleep').execute_batch([{'SECONDS': 0}] * 3)
+        self.assertEqual(self.observer.tasks, ['BatchExecute'])
+
+    def test_fallback_timeout(self):
+        """Jobs run one by one share the timeout of the batch."""
+        with test.stub_config(bundled_tasks='false'):
+            with self.assertRaises(TaskEngineTimeoutError):
+                Engine('ENVI').task('Sleep').execute_batch([{'SECONDS': 0.4}] * 4,
+                                                           timeout=1)
+        self.assertLess(len(self.observer.jobs), 5)
@@ -0,0 +1,145 @@
+"""
+Tests the indexed task catalog
+"""
+
+import json
+import os
+
+from envipyengine import Engine
+from envipyengine import config
+from envipyengine.catalog import Catalog, cache_file, task_directories
+
+from .. import test
+
+
+def _parameter(name, type_name, direction, required=False, **extra):
+    parameter = {'name': name,
+                 'display_name': name.replace('_', ' ').title(),
+                 'description': 'The ' + name.lower().replace('_', ' ') + '.',
+                 'type': type_name,
+                 'direction': direction,
+                 'required': required}
+    parameter.update(extra)
+    return parameter
+
+
+# The .task files of stub engine tasks
+_TASK_FILES = {
+    'SpectralIndex': {
+        'name': 'SpectralIndex',
+        'base_class': 'ENVITaskFromProcedure',
+        'routine': 'spectralindex',
+        'display_name': 'SpectralIndex',
+        'description': 'This task creates a spectral index raster for classification.',
+        'schema': 'envitask_3.1',
+        'parameters': [
+            _parameter('INPUT_RASTER', 'ENVIRaster', 'input', required=True),
+            _parameter('INDEX', 'String', 'input', required=True,
+                       choice_list=['Normalized Difference Vegetation Index']),
+            _parameter('OUTPUT_RASTER_URI', 'String', 'input',
+                       auto_extension='.dat', is_temporary=True),
+            _parameter('OUTPUT_RASTER', 'ENVIRaster', 'output', required=True)]},
+    'Sleep': {
+        'name': 'Sleep',
+        'base_class': 'IDLTaskFromProcedure',
+        'routine': 'sleep',
+        'display_name': 'Sleep',
+        'description': 'Sleeps for a number of seconds.',
+        'schema': 'idltask_1.0',
+        'parameters': [
+            _parameter('SECONDS', 'Double', 'input', min=0),
+            _parameter('SLEPT', 'Double', 'output', required=True)]},
+}
+
+
+class TestCatalog(test.StubEngineTestCase):
+    """
+    Test the catalog of the stub engine
+    """
+
+    def setUp(self):
+        super(TestCatalog, self).setUp()
+        self.catalog = Engine('ENVI').catalog
+
+    def test_find(self):
+        """Queries combine keywords, parameter types and names."""
+        self.assertEqual(self.catalog.find(input_type='ENVIRASTER', output_type='ENVIRASTER'),
+                         ['ROIToClassification', 'SpectralIndex'])
+        self.assertEqual(self.catalog.find(output_type='envivector'),
+                         ['ClassificationToShapefile'])
+        self.assertEqual(self.catalog.find(keyword='classif'),
+                         ['ClassificationToShapefile', 'ROIToClassification',
+                          'SpectralIndex'])
+        self.assertEqual(self.catalog.find(keyword='classification raster'),
+                         ['ClassificationToShapefile', 'ROIToClassification',
+                          'SpectralIndex'])
+        self.assertEqual(self.catalog.find(keyword='shapefile classes'),
+                         ['ClassificationToShapefile'])
+        self.assertEqual(self.catalog.find(keyword='classification',
+                                           input_type='ENVIROI'),
+                         ['ROIToClassification'])
+        self.assertEqual(self.catalog.find(parameter='seconds'), ['Sleep'])
+        self.assertEqual(self.catalog.find(keyword='no such words'), [])
+        self.assertEqual(self.catalog.find(), self.catalog.names)
+
+    def test_definitions(self):
+        """The catalog holds the normalized definitions."""
+        self.assertEqual(len(self.catalog), len(Engine('ENVI').tasks()))
+        self.assertIn('getcwd', self.catalog)
+        self.assertEqual(self.catalog['SpectralIndex'],
+                         Engine('ENVI').task('SpectralIndex').taskinfo())
+
+    def test_persisted(self):
+        """The catalog is built once and loaded from disk afterwards."""
+        started = len(self.observer.jobs)
+        catalog = Engine('ENVI').catalog
+        self.assertEqual(len(self.observer.jobs), started)
+        self.assertEqual(catalog.index, self.catalog.index)
+        self.assertEqual(catalog.definitions, self.catalog.definitions)
+        self.assertTrue(os.listdir(os.path.join(self.temp_dir, 'user', 'catalog')))
+
+    def test_profiles(self):
+        """Catalogs of engine profiles are keyed on the profile's engine."""
+        config.remove('engine')
+        config.set_profile('a', {'engine': test.stub_engine()}, environment={'SITE': 'a'})
+        config.set_profile('b', {'engine': test.stub_engine()}, environment={'SITE': 'b'})
+        self.assertNotEqual(cache_file('ENVI', 'a'), cache_file('ENVI', 'b'))
+        self.assertEqual(cache_file('ENVI', 'a'), cache_file('ENVI', 'a'))
+        catalog = Engine('ENVI', profile='b').catalog
+        self.assertEqual(catalog.definitions, self.catalog.definitions)
+        self.assertTrue(os.path.isfile(cache_file('ENVI', 'b')))
+
+    def test_rebuild(self):
+        """A catalog can be built from definitions without an engine."""
+        catalog = Catalog({'getcwd': self.catalog['getcwd']})
+        self.assertEqual(catalog.find(output_type='STRING'), ['getcwd'])
+
+    def test_task_files(self):
+        """Definitions parsed from .task files match the engine's."""
+        task_dir = os.path.join(self.temp_dir, 'tasks')
+        os.mkdir(task_dir)
+        for name, document in _TASK_FILES.items():
+            with open(os.path.join(task_dir, name + '.task'), 'w') as task_file:
+                json.dump(document, task_file)
+        with open(os.path.join(task_dir, 'broken.task'), 'w') as task_file:
+            task_file.write('{"name": ')
+
+        catalog = Catalog.from_task_files([task_dir, test.task_dir()])
+        self.assertEqual(catalog.names, ['Sleep', 'SpectralIndex', 'getcwd'])
+        self.assertEqual(catalog['SpectralIndex'], self.catalog['SpectralIndex'])
+        self.assertEqual(catalog['Sleep'], self.catalog['Sleep'])
+        self.assertEqual(catalog.find(output_type='STRING'), ['getcwd'])
+
+        # The engine's task directories follow IDL_PATH without the bundled tasks
+        with test.stub_config(environment={'IDL_PATH': '+' + test.task_dir()}):
+            self.assertEqual(task_directories()[0], test.task_dir())
+            catalog = Catalog.from_task_files()
+        self.assertIn('getcwd', catalog)
+        self.assertNotIn('QueryTasks', catalog)
+
+        # Profiles scan the IDL_PATH of their own environment
+        config.remove('engine')
+        config.set_profile('custom', {'engine': test.stub_engine()},
+                           environment={'IDL_PATH': task_dir})
+        self.assertEqual(task_directories(profile='custom')[0], task_dir)
+        self.assertIn('Sleep', Catalog.from_task_files(profile='custom'))
@@ -0,0 +1,93 @@
+"""
+Tests running task chains in one engine run
+"""
+
+import os
+
+from envipyengine import Engine
+from envipyengine.chain import Chain
+from envipyengine.error import PipelineError, PipelineExecutionError
+from envipyengine.error import TaskEngineExecutionError, TaskEngineLimitError
+from envipyengine.error import TaskEngineTimeoutError
+from envipyengine.pipeline import Output
+from envipyengine.taskengine import limits
+
+from .. import test
+
+
+class TestChain(test.StubEngineTestCase):
+    """
+    Test fused task chains against the stub engine
+    """
+
+    def _chain(self, index='Normalized Difference Vegetation Index'):
+        engine = Engine('ENVI', cwd=self.temp_dir)
+        chain = Chain(engine)
+        parameters = {'INPUT_RASTER': {'url': 'input.dat', 'factory': 'URLRaster'}}
+        if index:
+            parameters['INDEX'] = index
+        spectral = chain.add('index', engine.task('SpectralIndex'), parameters)
+        chain.add('export', engine.task('ClassificationToShapefile'),
+                  {'INPUT_RASTER': spectral.output('OUTPUT_RASTER'),
+                   'OUTPUT_VECTOR_URI': os.path.join(self.temp_dir, 'classes.shp')})
+        return chain
+
+    def test_fused(self):
+        """The chain runs in one engine run without writing intermediates."""
+        result = self._chain().execute()
+        self.assertEqual(self.observer.tasks, ['ChainRunner'])
+        self.assertEqual(result['outputParameters']['OUTPUT_VECTOR']['url'],
+                         os.path.join(self.temp_dir, 'classes.shp'))
+        self.assertFalse([name for name in os.listdir(self.temp_dir)
+                          if name.endswith('.dat')])
+
+    def test_failure(self):
+        """A failing step is reported with the steps it prevented."""
+        with self.assertRaises(PipelineExecutionError) as context:
+            self._chain(index=None).execute()
+        self.assertIsInstance(context.exception.errors['index'], TaskEngineExecutionError)
+        self.assertEqual(context.exception.skipped, ['export'])
+        self.assertEqual(self.observer.tasks, ['ChainRunner'])
+
+    def test_fallback(self):
+        """Engines without ChainRunner run each step."""
+        with test.stub_config(bundled_tasks='false'):
+            result = self._chain().execute()
+            with self.assertRaises(PipelineExecutionError) as context:
+                self._chain(index=None).execute()
+        self.assertIn('OUTPUT_VECTOR', result['outputParameters'])
+        self.assertEqual(self.observer.tasks,
+                         ['ChainRunner', 'SpectralIndex', 'ClassificationToShapefile',
+                          'ChainRunner', 'SpectralIndex'])
+        self.assertEqual(context.exception.skipped, ['export'])
+
+    def test_fallback_timeout(self):
+        """Steps run one by one share the timeout of the chain."""
+        engine = Engine('ENVI', cwd=self.temp_dir)
+        chain = Chain(engine)
+        for name in ('first', 'second', 'third'):
+            chain.add(name, engine.task('Sleep'), {'SECONDS': 0.4})
+        with test.stub_config(bundled_tasks='false'):
+            with self.assertRaises(TaskEngineTimeoutError):
+                chain.execute(timeout=0.6)
+        self.assertEqual(self.observer.tasks, ['ChainRunner', 'Sleep', 'Sleep'])
+
+    def test_runner_failure(self):
+        """A chain run that fails as a whole is not run again step by step."""
+        if limits.resource is None:
+            self.skipTest('Resource limits are not supported')
+        with test.stub_config(limit_open_files=16,
+                              environment={'STUB_TASKENGINE_OPEN': '64'}):
+            with self.assertRaises(TaskEngineLimitError):
+                self._chain().execute()
+        self.assertEqual(self.observer.tasks, ['ChainRunner'])
+
+    def test_references(self):
+        """Steps can only reference earlier steps."""
+        engine = Engine('ENVI')
+        chain = Chain(engine)
+        with self.assertRaises(PipelineError):
+            chain.add('export', engine.task('ClassificationToShapefile'),
+                      {'INPUT_RASTER': Output('index', 'OUTPUT_RASTER')})
+        with self.assertRaises(PipelineError):
+            chain.execute()
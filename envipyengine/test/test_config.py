@@ -160,3 +160,13 @@ class TestEngine(unittest.TestCase):
 
         result = envipyengine.config.get_environment()
         self.assertEqual(result, {})
+
+    def test_get_default(self):
+        """ Default returned when property does not exist """
+        self.assertIsNone(envipyengine.config.get('engine', default=None))
+
+    def test_get_boolean(self):
+        """ Boolean properties are parsed """
+        self.assertFalse(envipyengine.config.get_boolean('scratch-keep'))
+        envipyengine.config.set('scratch-keep', 'True')
+        self.assertTrue(envipyengine.config.get_boolean('scratch-keep'))
@@ -0,0 +1,71 @@
+"""
+Tests the doctor and bench diagnostics
+"""
+
+import unittest
+
+from envipyengine import config, diagnostics
+
+from .. import test
+
+
+class TestDiagnostics(unittest.TestCase):
+    """
+    Test the diagnostics against the stub engine
+    """
+
+    def test_doctor(self):
+        """All checks pass for a working engine."""
+        with test.stub_config(engine_args='--verbose'):
+            checks = diagnostics.doctor()
+        self.assertEqual([check.name for check in checks],
+                         ['config', 'engine', 'engine-args', 'environment', 'tasks'])
+        self.assertTrue(all(check.ok for check in checks))
+        self.assertEqual(checks[2].message, '--verbose')
+
+    def test_doctor_profiles(self):
+        """Every profile is checked, also without the 'engine' option."""
+        with test.stub_config():
+            engine = config.get('engine')
+            config.remove('engine')
+            config.set_profile('a', {'engine': engine, 'engine-args': '--verbose'})
+            config.set_profile('b', {'engine': '/no/such/taskengine'})
+            checks = diagnostics.doctor()
+        self.assertEqual([(check.name, check.ok) for check in checks],
+                         [('config', True), ('engine[a]', True), ('engine-args[a]', True),
+                          ('environment[a]', True), ('tasks[a]', True),
+                          ('engine[b]', False)])
+        self.assertEqual(checks[2].message, '--verbose')
+
+    def test_doctor_missing_engine(self):
+        """Checks stop at a missing engine executable."""
+        with test.stub_config(engine='/no/such/taskengine'):
+            checks = diagnostics.doctor()
+        self.assertFalse(checks[-1].ok)
+        self.assertEqual(checks[-1].name, 'engine')
+
+    def test_doctor_unknown_engine(self):
+        """Engines that fail to list their tasks are reported."""
+        with test.stub_config():
+            checks = diagnostics.doctor('NOSUCHENGINE')
+        self.assertFalse(checks[-1].ok)
+        self.assertIn('Unknown engine', checks[-1].message)
+
+    def test_bench(self):
+        """Latency percentiles are reported for every concurrency level."""
+        with test.stub_config():
+            results = diagnostics.bench(samples=3, max_concurrency=2)
+        self.assertEqual(list(results), ['cold_spawn', 'query_task_catalog', 'query_task',
+                                         'concurrency_1', 'concurrency_2',
+                                         'best_concurrency'])
+        summary = results['concurrency_2']
+        self.assertLessEqual(summary['p50'], summary['p95'])
+        self.assertLessEqual(summary['p95'], summary['p99'])
+        self.assertGreater(summary['throughput'], 0)
+        self.assertIn(results['best_concurrency'], (1, 2))
+
+    def test_percentile(self):
+        """Percentiles interpolate between ranks."""
+        self.assertEqual(diagnostics.percentile([4, 1, 3, 2], 0.5), 2.5)
+        self.assertEqual(diagnostics.percentile([1, 2, 3], 0.99), 2.98)
+        self.assertIsNone(diagnostics.percentile([], 0.5))
@@ -0,0 +1,95 @@
+"""
+Tests the job history store and estimator
+"""
+
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from envipyengine import Engine, history
+from envipyengine.scheduler import Cost
+
+from .. import test
+
+
+class TestHistory(unittest.TestCase):
+    """
+    Test the history store against the stub engine
+    """
+
+    def setUp(self):
+        config = test.stub_config(history='true')
+        self.temp_dir = config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+
+    def _raster(self, name, samples, lines, bands=1, data_type=1):
+        path = os.path.join(self.temp_dir, name + '.dat')
+        with open(os.path.splitext(path)[0] + '.hdr', 'w') as header:
+            header.write('ENVI\ndescription = {{\n  test}}\nsamples = {0}\nlines    = {1}\n'
+                         'bands = {2}\ndata type = {3}\n'.format(samples, lines, bands,
+                                                                 data_type))
+        return {'url': path, 'factory': 'URLRaster'}
+
+    def test_record(self):
+        """Every job is recorded."""
+        task = Engine('ENVI', cwd=self.temp_dir).task('SpectralIndex')
+        raster = self._raster('small', 10, 20, 4, 2)
+        task.execute({'INPUT_RASTER': raster, 'INDEX': 'NDVI'})
+        task.execute({'INPUT_RASTER': raster, 'INDEX': 'NDVI'})
+        runs = history.store().runs('SpectralIndex')
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(runs[0][0], 10 * 20 * 4 * 2)
+        self.assertGreater(runs[0][1], 0)
+        estimate = task.estimate({'INPUT_RASTER': raster, 'INDEX': 'NDVI'})
+        self.assertEqual(estimate.runs, 2)
+        self.assertGreater(estimate.duration, 0)
+        self.assertIsNone(Engine('ENVI').task('Sleep').estimate({'SECONDS': 1}))
+
+    def test_skipped(self):
+        """Profiled jobs are not recorded and coalesced jobs are recorded once."""
+        task = Engine('ENVI').task('Sleep')
+        task.execute({'SECONDS': 0}, profiler=True)
+        self.assertEqual(history.store().runs('Sleep'), [])
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(
+                lambda _: task.execute({'SECONDS': 0.5}, coalesce=True), range(4)))
+        self.assertEqual(sorted(result.coalesced for result in results),
+                         [False, True, True, True])
+        self.assertEqual(len(history.store().runs('Sleep')), 1)
+
+    def test_disabled(self):
+        """Jobs are not recorded unless enabled."""
+        with test.stub_config() as temp_dir:
+            Engine('ENVI').task('Sleep').execute({'SECONDS': 0})
+            self.assertIsNone(Engine('ENVI').task('Sleep').estimate({'SECONDS': 0}))
+            self.assertIsNone(history.store())
+            self.assertFalse(os.path.exists(os.path.join(temp_dir, 'user', 'history.sqlite')))
+
+    def test_estimate(self):
+        """Estimates follow the input size and prefer the same parameters."""
+        store = history.store()
+        for size, seconds in ((100, 10), (200, 20), (400, 40)):
+            raster = self._raster('r{0}'.format(size), size, 1)
+            store.record('SpectralIndex', {'INPUT_RASTER': raster, 'INDEX': 'NDVI'},
+                         seconds, size * 1000)
+        store.record('SpectralIndex', {'INPUT_RASTER': raster, 'INDEX': 'Other'}, 1000)
+
+        large = self._raster('large', 800, 1)
+        estimate = history.estimate('SpectralIndex', {'INPUT_RASTER': large, 'INDEX': 'NDVI',
+                                                      'OUTPUT_RASTER_URI': 'x.dat'})
+        self.assertAlmostEqual(estimate.duration, 80)
+        self.assertEqual(estimate.memory, 800000)
+        self.assertEqual(estimate.runs, 3)
+        # Unknown parameters fall back to all runs of the task
+        self.assertEqual(history.estimate('SpectralIndex', {'INDEX': 'new'}).runs, 4)
+        self.assertEqual(history.cost(Engine('ENVI').task('SpectralIndex'),
+                                      {'INPUT_RASTER': large, 'INDEX': 'NDVI'}),
+                         Cost(memory=800000))
+
+    def test_describe(self):
+        """Input rasters are described from their headers."""
+        features = history.describe({'INPUT_RASTER': self._raster('a', 3, 4, 5, 4),
+                                     'INDEX': 'NDVI', 'OUTPUT_RASTER_URI': 'a.dat'})
+        self.assertEqual(features[1:], (3, 4, 5, 4, 3 * 4 * 5 * 4))
+        self.assertEqual(features.fingerprint, history.describe({'INDEX': 'NDVI'}).fingerprint)
+        self.assertIsNone(history.describe({'INPUT_RASTER': {'url': 'missing.dat'}}).samples)
@@ -0,0 +1,107 @@
+"""
+Tests the resource limits of engine processes
+"""
+
+import os
+import unittest
+
+from envipyengine import config, Engine
+from envipyengine.error import TaskEngineLimitError
+from envipyengine.taskengine import limits, routing
+
+from .. import test
+
+
+@unittest.skipIf(limits.resource is None, 'requires the resource module')
+class TestLimits(test.StubEngineTestCase):
+    """
+    Test the limits against the stub engine
+    """
+
+    def setUp(self):
+        super(TestLimits, self).setUp()
+        self.task = Engine('ENVI').task('Sleep')
+
+    def _breach(self, parameters, **job_limits):
+        parameters['SECONDS'] = 0
+        with self.assertRaises(TaskEngineLimitError) as context:
+            self.task.execute(parameters, limits=job_limits or None)
+        return context.exception.limit, context.exception.value
+
+    def test_memory(self):
+        """Exceeding the memory limit raises a limit error."""
+        self.assertEqual(self._breach({'STUB_ALLOCATE': 1024 ** 3}, memory='256M'),
+                         ('memory', 256 * 1024 ** 2))
+        result = self.task.execute({'SECONDS': 0, 'STUB_ALLOCATE': 1024 ** 2},
+                                   limits={'memory': '256M'})
+        self.assertEqual(result['outputParameters']['SLEPT'], 0)
+
+    def test_cpu_seconds(self):
+        """Exceeding the CPU time limit raises a limit error."""
+        self.assertEqual(self._breach({'STUB_SPIN': 10}, cpu_seconds=1),
+                         ('cpu_seconds', 1))
+
+    def test_open_files(self):
+        """Limits default to the config and profile settings."""
+        config.set('limit-open-files', '16')
+        self.assertEqual(self._breach({'STUB_OPEN': 64}), ('open_files', 16))
+        config.set_profile('small', {'limit-open-files': '24'})
+        self.assertEqual(self._breach({'STUB_OPEN': 64}), ('open_files', 24))
+        self.assertEqual(self._breach({'STUB_OPEN': 64}, open_files=32), ('open_files', 32))
+
+    def test_command(self):
+        """Limits run the engine through prlimit, or apply it before exec without it."""
+        enforcement = limits.Enforcement(limits.Limits(cpu_seconds=60, open_files=16))
+        command = enforcement.command()
+        if command is not None:
+            self.assertEqual([os.path.basename(arg) for arg in command],
+                             ['prlimit', '--cpu=60:61', '--nofile=16:16', '--'])
+        self.assertEqual(limits.Enforcement(limits.Limits()).command(), [])
+
+        self.addCleanup(setattr, limits, 'which', limits.which)
+        limits.which = lambda name: None
+        self.assertIsNone(enforcement.command())
+        self.assertEqual(self._breach({'STUB_OPEN': 64}, open_files=16), ('open_files', 16))
+
+    def test_failure(self):
+        """Other failures are not reported as limit breaches."""
+        task = Engine('ENVI').task('Fail')
+        with self.assertRaises(Exception) as context:
+            task.execute({'MESSAGE': 'broken'}, limits={'memory': '1G', 'cpu_seconds': 60})
+        self.assertNotIsInstance(context.exception, TaskEngineLimitError)
+
+    def test_cgroup(self):
+        """The cgroup backend limits memory in a cgroup per job."""
+        root = os.path.join(self.temp_dir, 'cgroup')
+        os.mkdir(root)
+        self.assertFalse(limits.Cgroup.usable(root))
+        with open(os.path.join(root, 'cgroup.subtree_control'), 'w') as control:
+            control.write('cpu memory pids\n')
+        self.assertTrue(limits.Cgroup.usable(root))
+        config.set('cgroup-root', root)
+
+        enforcement = limits.Enforcement(limits.Limits(memory='1G'), backend=limits.AUTO)
+        cgroup = enforcement.cgroup.path
+        with open(os.path.join(cgroup, 'memory.max')) as control:
+            self.assertEqual(control.read(), str(1024 ** 3))
+        self.assertIsNone(enforcement.breach(-9, ''))
+        with open(os.path.join(cgroup, 'memory.events'), 'w') as events:
+            events.write('low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n')
+        self.assertEqual(enforcement.breach(-9, ''), ('memory', 1024 ** 3))
+
+        self.assertEqual(enforcement.command()[-1], enforcement.cgroup.procs)
+
+        no_cgroup = limits.Enforcement(limits.Limits(memory='1G'), backend=limits.RLIMIT)
+        self.assertIsNone(no_cgroup.cgroup)
+
+    def test_cgroup_error(self):
+        """A cgroup that cannot be created fails the job, not the engine profile."""
+        config.set('limit-backend', 'cgroup')
+        config.set('cgroup-root', os.path.join(self.temp_dir, 'missing'))
+        config.set_profile('small', {'limit-open-files': '24'})
+        routing.ROUTER.reset()
+        self.addCleanup(routing.ROUTER.reset)
+        with self.assertRaises(OSError):
+            self.task.execute({'SECONDS': 0}, limits={'memory': '1G'})
+        self.assertTrue(all(health['failures'] == 0 and health['active'] == 0
+                            for health in routing.ROUTER.health().values()))
@@ -0,0 +1,94 @@
+"""
+Tests the ENVI Py Engine metrics registry
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from envipyengine import Engine, metrics
+from envipyengine.chain import Chain
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test the metrics registry and Prometheus export
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+        metrics.REGISTRY.clear()
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+
+    def test_collect(self):
+        """Jobs, durations, failures and bytes are collected per operation."""
+        engine = Engine('ENVI')
+        engine.tasks()
+        task = engine.task('Sleep')
+        task.taskinfo()
+        task.execute({'SECONDS': 0})
+        with self.assertRaises(TaskEngineExecutionError):
+            engine.task('Fail').execute({})
+
+        self.assertEqual(metrics.JOBS.value(('tasks', 'QueryTaskCatalog', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('taskinfo', 'QueryTask', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('execute', 'Sleep', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('execute', 'Fail', 'ENVI', 'failure')), 1)
+        self.assertEqual(metrics.FAILURES.value(
+            ('execute', 'Fail', 'TaskEngineExecutionError')), 1)
+        self.assertGreater(metrics.BYTES_OUT.value(('execute', 'Sleep')), 0)
+        self.assertEqual(metrics.IN_FLIGHT.value(('ENVI',)), 0)
+
+    def test_bundled(self):
+        """Jobs of the bundled tasks are counted under the tasks they run."""
+        engine = Engine('ENVI')
+        task = engine.task('Sleep')
+        task.execute_batch([{'SECONDS': 0}] * 2)
+        task.execute({'SECONDS': 0}, profiler=True)
+        engine.definitions(['Sleep'])
+        chain = Chain(engine)
+        chain.add('first', task, {'SECONDS': 0})
+        chain.add('second', engine.task('getcwd'), {})
+        chain.execute()
+
+        self.assertEqual(metrics.JOBS.value(('batch', 'Sleep', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('profile', 'Sleep', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('taskinfo', 'QueryTasks', 'ENVI', 'success')), 1)
+        self.assertEqual(metrics.JOBS.value(('chain', 'Sleep>getcwd', 'ENVI', 'success')), 1)
+
+    def test_histogram(self):
+        """Histogram buckets are cumulative."""
+        histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(1, 2))
+        for value in (0.5, 1.5, 5):
+            histogram.observe(value)
+        samples = dict((labels.get('le', suffix), value)
+                       for suffix, labels, value in histogram.samples())
+        self.assertEqual(samples['1'], 1)
+        self.assertEqual(samples['2'], 2)
+        self.assertEqual(samples['+Inf'], 3)
+        self.assertEqual(samples['_count'], 3)
+        self.assertEqual(samples['_sum'], 7.0)
+
+    def test_dump(self):
+        """Metrics are written in the text exposition format."""
+        Engine('ENVI').task('Sleep').execute({'SECONDS': 0})
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        filename = os.path.join(temp_dir, 'envipyengine.prom')
+        metrics.dump(filename)
+
+        with open(filename) as prom:
+            text = prom.read()
+        self.assertIn('# TYPE envipyengine_jobs_total counter', text)
+        self.assertIn('envipyengine_jobs_total{engine="ENVI",operation="execute",'
+                      'status="success",task="Sleep"} 1', text)
+        self.assertIn('envipyengine_job_duration_seconds_bucket{le="+Inf",'
+                      'operation="execute",task="Sleep"} 1', text)
+        self.assertEqual(os.listdir(temp_dir), ['envipyengine.prom'])
@@ -0,0 +1,94 @@
+"""
+Tests pickling engines and tasks and the fork-safety hooks
+"""
+
+import multiprocessing
+import os
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from envipyengine import Engine
+from envipyengine.catalog import Catalog
+from envipyengine.taskengine import routing, singleflight, tracing
+
+from .. import test
+
+
+def _child_taskinfo(task):
+    """Returns the task name and the jobs run to get it in a child process."""
+    observer = test.JobObserver()
+    tracing.add_observer(observer)
+    return task.taskinfo()['name'], observer.tasks
+
+
+def _child_locks():
+    """Returns whether the module locks can be acquired in a child process."""
+    locks = [routing.ROUTER._lock, singleflight.FLIGHTS._lock,
+             tracing._OBSERVERS_LOCK]  # pylint: disable=protected-access
+    acquired = [lock.acquire(False) for lock in locks]
+    for lock in locks:
+        lock.release()
+    return acquired + [singleflight.FLIGHTS.in_flight()]
+
+
+class TestPickle(test.StubEngineTestCase):
+    """
+    Test pickling against the stub engine
+    """
+
+    def test_task(self):
+        """A pickled task carries its definition."""
+        task = Engine('ENVI').task('SpectralIndex')
+        info = task.taskinfo()
+        self.assertEqual(self.observer.tasks, ['QueryTask'])
+        copy = pickle.loads(pickle.dumps(task))
+        self.assertEqual(copy.taskinfo(), info)
+        self.assertEqual(copy.uri, 'ENVI:SpectralIndex')
+        self.assertEqual(self.observer.tasks, ['QueryTask'])
+
+    def test_engine(self):
+        """A pickled engine carries its task list and catalog."""
+        engine = Engine('ENVI')
+        catalog = engine.catalog
+        tasks = engine.tasks()
+        del self.observer.jobs[:]
+        copy = pickle.loads(pickle.dumps(engine))
+        self.assertEqual(copy.tasks(), tasks)
+        self.assertEqual(copy.catalog.find(keyword='shapefile'),
+                         catalog.find(keyword='shapefile'))
+        self.assertEqual(self.observer.tasks, [])
+
+    def test_catalog(self):
+        """A pickled catalog holds only the definitions and the index."""
+        catalog = Engine('ENVI').catalog
+        self.assertEqual(set(catalog.__getstate__()), set(['definitions', 'index']))
+        copy = pickle.loads(pickle.dumps(catalog))
+        self.assertIsInstance(copy, Catalog)
+        self.assertEqual(copy.find(keyword='classif'), catalog.find(keyword='classif'))
+
+    @unittest.skipUnless(hasattr(os, 'register_at_fork'), 'requires os.register_at_fork')
+    def test_process_pool(self):
+        """Tasks sent to a process pool do not query their definition again."""
+        task = Engine('ENVI').task('Sleep')
+        task.taskinfo()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(2, mp_context=context) as executor:
+            results = list(executor.map(_child_taskinfo, [task] * 4))
+        self.assertEqual(results, [('Sleep', [])] * 4)
+
+    @unittest.skipUnless(hasattr(os, 'register_at_fork'), 'requires os.register_at_fork')
+    def test_fork(self):
+        """Locks held in the parent are replaced in a forked child."""
+        # pylint: disable=protected-access
+        locks = [routing.ROUTER._lock, singleflight.FLIGHTS._lock,
+                 tracing._OBSERVERS_LOCK]
+        singleflight.FLIGHTS._calls['held'] = singleflight._Call()
+        self.addCleanup(singleflight.FLIGHTS._calls.pop, 'held')
+        for lock in locks:
+            lock.acquire()
+            self.addCleanup(lock.release)
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            self.assertEqual(executor.submit(_child_locks).result(timeout=30),
+                             [True, True, True, 0])
@@ -0,0 +1,129 @@
+"""
+Tests the ENVI Py Engine pipeline scheduler
+"""
+
+import threading
+import time
+import unittest
+
+from envipyengine.pipeline import Pipeline, Output
+from envipyengine.error import PipelineError, PipelineExecutionError
+
+
+class FakeTask(object):
+    """
+    Task stand-in that records its calls and echoes its inputs as outputs.
+    """
+    def __init__(self, name, delay=0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def execute(self, parameters, cwd=None, **kwargs):
+        with self._lock:
+            self.calls.append(parameters)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(self.name + ' failed')
+            outputs = dict(parameters)
+            outputs['OUTPUT_RASTER'] = self.name + '.dat'
+            return {'outputParameters': outputs}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    Test the pipeline scheduler
+    """
+
+    def test_references_resolved(self):
+        """Output references are replaced with upstream output values."""
+        pipeline = Pipeline()
+        first = pipeline.add('first', FakeTask('first'), dict(INPUT_RASTER='in.dat'))
+        second_task = FakeTask('second')
+        pipeline.add('second', second_task,
+                     dict(INPUT_RASTER=first.output('OUTPUT_RASTER'),
+                          EXTRA=[{'raster': first.output('OUTPUT_RASTER')}]))
+        results = pipeline.run()
+
+        self.assertEqual(second_task.calls[0]['INPUT_RASTER'], 'first.dat')
+        self.assertEqual(second_task.calls[0]['EXTRA'], [{'raster': 'first.dat'}])
+        self.assertEqual(results['second']['outputParameters']['OUTPUT_RASTER'],
+                         'second.dat')
+
+    def test_parallel_branches(self):
+        """Independent branches run concurrently up to max_workers."""
+        task = FakeTask('branch', delay=0.1)
+        pipeline = Pipeline(max_workers=2)
+        for index in range(4):
+            pipeline.add('branch%d' % index, task)
+        pipeline.run()
+        self.assertEqual(task.max_active, 2)
+
+    def test_failure_skips_dependents(self):
+        """Dependents of a failed node are skipped and independent nodes run."""
+        pipeline = Pipeline()
+        bad = pipeline.add('bad', FakeTask('bad', fail=True))
+        pipeline.add('child', FakeTask('child'),
+                     dict(INPUT_RASTER=bad.output('OUTPUT_RASTER')))
+        pipeline.add('other', FakeTask('other'))
+        with self.assertRaises(PipelineExecutionError) as context:
+            pipeline.run()
+        self.assertEqual(list(context.exception.errors), ['bad'])
+        self.assertEqual(context.exception.skipped, ['child'])
+        self.assertIn('other', context.exception.results)
+
+    def test_resubmit_reuses_results(self):
+        """Running again only executes nodes that did not complete."""
+        first_task = FakeTask('first')
+        second_task = FakeTask('second', fail=True)
+        pipeline = Pipeline()
+        first = pipeline.add('first', first_task)
+        pipeline.add('second', second_task,
+                     dict(INPUT_RASTER=first.output('OUTPUT_RASTER')))
+        with self.assertRaises(PipelineExecutionError):
+            pipeline.run()
+
+        second_task.fail = False
+        results = pipeline.run()
+        self.assertEqual(len(first_task.calls), 1)
+        self.assertEqual(len(second_task.calls), 2)
+        self.assertIn('second', results)
+
+    def test_reset_descendants(self):
+        """Resetting a node also resets the nodes depending on it."""
+        first_task = FakeTask('first')
+        pipeline = Pipeline()
+        first = pipeline.add('first', first_task)
+        pipeline.add('second', FakeTask('second'),
+                     dict(INPUT_RASTER=first.output('OUTPUT_RASTER')))
+        pipeline.run()
+        pipeline.reset('first')
+        self.assertEqual(pipeline.results, {})
+        pipeline.run()
+        self.assertEqual(len(first_task.calls), 2)
+
+    def test_unknown_reference(self):
+        """Referencing an unknown node raises a PipelineError."""
+        pipeline = Pipeline()
+        pipeline.add('index', FakeTask('index'),
+                     dict(INPUT_RASTER=Output('missing', 'OUTPUT_RASTER')))
+        with self.assertRaises(PipelineError):
+            pipeline.run()
+
+    def test_cycle(self):
+        """A cycle in the pipeline raises a PipelineError."""
+        pipeline = Pipeline()
+        pipeline.add('a', FakeTask('a'), dict(INPUT=Output('b', 'OUTPUT_RASTER')))
+        pipeline.add('b', FakeTask('b'), dict(INPUT=Output('a', 'OUTPUT_RASTER')))
+        with self.assertRaises(PipelineError):
+            pipeline.run()
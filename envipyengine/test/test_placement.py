@@ -0,0 +1,99 @@
+"""
+Tests CPU affinity and priority placement of engine processes
+"""
+
+import os
+import threading
+import time
+import unittest
+
+from envipyengine import config, Engine
+from envipyengine.taskengine import placement
+
+from .. import test
+
+
+@unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'requires os.sched_setaffinity')
+class TestPlacement(test.StubEngineTestCase):
+    """
+    Test placing the stub engine processes
+    """
+
+    def _placed(self, **options):
+        """Runs a job and returns the affinity and nice value of its engine."""
+        started = len(self.observer.jobs)
+        thread = threading.Thread(target=Engine('ENVI').task('Sleep').execute,
+                                  args=({'SECONDS': 1},), kwargs=options)
+        thread.start()
+        try:
+            while len(self.observer.jobs) == started or self.observer.jobs[-1].pid is None:
+                time.sleep(0.01)
+            pid = self.observer.jobs[-1].pid
+            time.sleep(0.2)
+            return os.sched_getaffinity(pid), os.getpriority(os.PRIO_PROCESS, pid)
+        finally:
+            thread.join()
+
+    def test_parse(self):
+        """Core lists and I/O priorities are parsed."""
+        self.assertEqual(placement.parse_cpus('0-3, 8,10-11'), set([0, 1, 2, 3, 8, 10, 11]))
+        self.assertEqual(placement.format_cpus(set([0, 1, 2, 3, 8, 10, 11])), '0-3,8,10-11')
+        self.assertEqual(placement.parse_cpus('AUTO'), placement.AUTO)
+        self.assertEqual(placement.parse_ionice('best-effort:4'), ('best-effort', 4))
+        self.assertEqual(placement.parse_ionice('idle'), ('idle', 7))
+        self.assertRaises(ValueError, placement.parse_ionice, 'fast:1')
+
+    def test_resolve(self):
+        """Job placements override profiles, which override the config."""
+        config.set('nice', '3')
+        config.set('cpu-affinity', '0')
+        profile = placement.Placement(nice=5)
+        resolved = placement.resolve(type('Profile', (), {'placement': profile}),
+                                     {'ionice': 'idle'})
+        self.assertEqual((resolved.cpus, resolved.nice, resolved.ionice),
+                         (set([0]), 5, ('idle', 7)))
+        self.assertFalse(placement.Placement())
+
+    def test_execute(self):
+        """Affinity and nice value are applied to the engine process."""
+        cpu = min(placement.available_cpus())
+        nice = os.getpriority(os.PRIO_PROCESS, 0) + 2
+        self.assertEqual(self._placed(placement={'cpus': [cpu], 'nice': nice}),
+                         (set([cpu]), nice))
+        config.set('cpu-affinity', str(cpu))
+        self.assertEqual(self._placed()[0], set([cpu]))
+
+    def test_command(self):
+        """Placements run the engine through taskset, nice and ionice when installed."""
+        cpu = min(placement.available_cpus())
+        nice = os.getpriority(os.PRIO_PROCESS, 0) + 2
+        placed = placement.Placement(cpus=[cpu], nice=nice, ionice='idle')
+        command = placed.command()
+        if command is not None:
+            self.assertEqual([os.path.basename(arg) for arg in command],
+                             ['taskset', '-c', str(cpu), 'nice', '-n', '2', 'ionice', '-c', '3'])
+        self.assertEqual(placement.Placement().command(), [])
+
+        # Without the commands the placement is applied before exec
+        self.addCleanup(setattr, placement, 'which', placement.which)
+        placement.which = lambda name: None
+        self.assertIsNone(placed.command())
+        self.assertEqual(self._placed(placement={'cpus': [cpu], 'nice': nice}),
+                         (set([cpu]), nice))
+
+    def test_auto(self):
+        """Concurrent jobs take turns over the core partitions."""
+        partitioner = placement.CorePartitioner(partition_size=1)
+        cpus = sorted(placement.available_cpus())
+        first = partitioner.acquire()
+        second = partitioner.acquire()
+        if len(cpus) > 1:
+            self.assertNotEqual(first, second)
+        partitioner.release(first)
+        self.assertEqual(partitioner.acquire(), first)
+        self.assertEqual(sum(len(partition) for partition in partitioner.partitions()),
+                         len(cpus))
+
+        config.set('cpu-affinity', 'auto')
+        config.set('cpu-partition-size', '1')
+        self.assertEqual(len(self._placed()[0]), 1)
@@ -0,0 +1,44 @@
+"""
+Tests running jobs under the IDL profiler
+"""
+
+from envipyengine import Engine
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+
+class TestProfiling(test.StubEngineTestCase):
+    """
+    Test profiled jobs against the stub engine
+    """
+
+    def test_profile(self):
+        """The result holds the task output and its profile."""
+        result = Engine('ENVI').task('Sleep').execute({'SECONDS': 0.2}, profiler=True)
+        self.assertEqual(self.observer.tasks, ['ProfileTask'])
+        self.assertEqual(result['outputParameters'], {'SLEPT': 0.2})
+        profile = result.profile
+        self.assertGreaterEqual(profile.task_time, 0.2)
+        self.assertGreater(profile.startup_time, 0)
+        self.assertGreaterEqual(profile.shutdown_time, 0)
+        self.assertLess(profile.started, profile.init)
+        self.assertLessEqual(profile.task_end, profile.finished)
+        self.assertEqual(profile.top(1)[0].name, 'SLEEP')
+        self.assertEqual(profile.top(1)[0].calls, 1)
+        self.assertEqual(len(profile.as_dict()['routines']), 2)
+
+    def test_isolated(self):
+        """Outputs of profiled jobs are collected from isolated working directories."""
+        result = Engine('ENVI', cwd=self.temp_dir).task('SpectralIndex').execute(
+            {'INPUT_RASTER': {'url': 'input.dat'}, 'INDEX': 'NDVI'},
+            isolate=True, profiler=True)
+        self.assertTrue(result['outputParameters']['OUTPUT_RASTER']['url'].startswith(
+            self.temp_dir))
+        self.assertIsNotNone(result.profile)
+
+    def test_not_profiled(self):
+        """Jobs are not profiled by default."""
+        self.assertIsNone(Engine('ENVI').task('Sleep').execute({}).profile)
+        with self.assertRaises(TaskEngineExecutionError):
+            Engine('ENVI').task('Fail').execute({}, profiler=True)
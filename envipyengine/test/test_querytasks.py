@@ -0,0 +1,74 @@
+"""
+Tests querying task definitions with the bundled QueryTasks task
+"""
+
+import os
+
+from envipyengine import Engine
+from envipyengine.error import TaskEngineExecutionError
+from envipyengine.taskengine import taskengine
+
+from .. import test
+
+
+class TestQueryTasks(test.StubEngineTestCase):
+    """
+    Test Engine.definitions against the stub engine
+    """
+
+    def test_all(self):
+        """All definitions are queried in one engine run."""
+        engine = Engine('ENVI')
+        definitions = engine.definitions()
+        self.assertEqual(self.observer.tasks, ['QueryTaskCatalog', 'QueryTasks'])
+        self.assertEqual(sorted(definitions), engine.tasks())
+        self.assertEqual(engine.task('Sleep').taskinfo(), definitions['Sleep'])
+        self.assertEqual(engine.catalog.find(output_type='STRING'), ['getcwd'])
+        self.assertEqual(self.observer.tasks, ['QueryTaskCatalog', 'QueryTasks'])
+        # The definitions match those of QueryTask
+        self.assertEqual(Engine('ENVI').task('SpectralIndex').taskinfo(),
+                         definitions['SpectralIndex'])
+
+    def test_names(self):
+        """Only the definitions not known yet are queried."""
+        engine = Engine('ENVI')
+        self.assertEqual(sorted(engine.definitions(['Sleep', 'getcwd'])), ['Sleep', 'getcwd'])
+        self.assertEqual(sorted(engine.definitions(['Sleep', 'Fail'])), ['Fail', 'Sleep'])
+        engine.definitions(['Fail'])
+        self.assertEqual(self.observer.tasks, ['QueryTasks', 'QueryTasks'])
+
+    def test_unknown(self):
+        """An unknown task name fails without giving up on QueryTasks."""
+        engine = Engine('ENVI')
+        with self.assertRaises(TaskEngineExecutionError):
+            engine.definitions(['SpectralIndex', 'NoSuchTask'])
+        engine.definitions(['Sleep', 'Fail', 'getcwd'])
+        self.assertEqual(self.observer.tasks, ['QueryTasks', 'QueryTasks'])
+
+    def test_fallback(self):
+        """Engines without QueryTasks query each task."""
+        with test.stub_config(bundled_tasks='false'):
+            engine = Engine('ENVI')
+            definitions = engine.definitions(['Sleep', 'getcwd'])
+            engine.definitions(['Fail'])
+        self.assertEqual(definitions['getcwd']['parameters'][0]['name'], 'CWD')
+        self.assertEqual(self.observer.tasks,
+                         ['QueryTasks', 'QueryTask', 'QueryTask', 'QueryTask'])
+
+    def test_idl_path(self):
+        """The bundled tasks follow the configured IDL_PATH."""
+        # pylint: disable=protected-access
+        with test.stub_config(environment={'IDL_PATH': 'user-path'}):
+            _, environment = taskengine._resolve_engine('ENVI', task_name='QueryTasks')
+            _, other = taskengine._resolve_engine('ENVI', task_name='getcwd')
+        self.assertEqual(environment['IDL_PATH'].split(os.pathsep),
+                         ['user-path', taskengine.bundled_task_dir()])
+        self.assertEqual(other['IDL_PATH'], 'user-path')
+
+        # Other jobs leave an IDL_PATH of the IDL preferences in effect
+        if 'IDL_PATH' not in os.environ:
+            with test.stub_config():
+                _, environment = taskengine._resolve_engine('ENVI', task_name='getcwd')
+            self.assertIsNone(environment)
+        self.assertTrue(os.path.isfile(os.path.join(taskengine.bundled_task_dir(),
+                                                    'QueryTasks.task')))
@@ -0,0 +1,125 @@
+"""
+Tests the job queue, spool broker and worker
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from envipyengine.queue import JobQueue, SQLiteBroker, QUEUED, LEASED, SUCCEEDED, FAILED
+from envipyengine.queue.worker import Worker
+from envipyengine.error import JobFailedError
+
+from .. import test
+
+
+class TestSpool(unittest.TestCase):
+    """
+    Test the SQLite spool broker
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.broker = SQLiteBroker(os.path.join(self.temp_dir, 'jobs.db'))
+
+    def test_lease_once(self):
+        """A leased job is not handed out to another worker."""
+        job_id = self.broker.put('ENVI:Sleep', {'SECONDS': 0})
+        job = self.broker.lease('a', 60)
+        self.assertEqual(job.id, job_id)
+        self.assertEqual(job.parameters, {'SECONDS': 0})
+        self.assertIsNone(self.broker.lease('b', 60))
+        self.assertEqual(self.broker.get(job_id).state, LEASED)
+
+    def test_redelivery(self):
+        """A job whose lease expired is handed out again."""
+        job_id = self.broker.put('ENVI:Sleep', {})
+        self.broker.lease('a', 0.05)
+        time.sleep(0.1)
+        job = self.broker.lease('b', 60)
+        self.assertEqual(job.id, job_id)
+        self.assertEqual(job.attempts, 2)
+        self.assertFalse(self.broker.complete(job_id, 'a', {}))
+        self.assertTrue(self.broker.complete(job_id, 'b', {'ok': True}))
+        self.assertEqual(self.broker.get(job_id).result, {'ok': True})
+
+    def test_heartbeat(self):
+        """Heartbeats keep the lease alive."""
+        self.broker.put('ENVI:Sleep', {})
+        job = self.broker.lease('a', 0.2)
+        for _ in range(3):
+            time.sleep(0.1)
+            self.assertTrue(self.broker.heartbeat(job.id, 'a', 0.2))
+        self.assertIsNone(self.broker.lease('b', 60))
+
+    def test_max_attempts(self):
+        """Jobs are failed once their attempts are used up."""
+        job_id = self.broker.put('ENVI:Sleep', {}, max_attempts=1)
+        self.broker.lease('a', 0.01)
+        time.sleep(0.05)
+        self.assertIsNone(self.broker.lease('b', 60))
+        self.assertEqual(self.broker.get(job_id).state, FAILED)
+
+    def test_retry(self):
+        """Retried failures are queued again."""
+        job_id = self.broker.put('ENVI:Sleep', {})
+        self.broker.fail(self.broker.lease('a', 60).id, 'a', 'spawn failed', retry=True)
+        self.assertEqual(self.broker.get(job_id).state, QUEUED)
+        self.assertEqual(self.broker.counts()[QUEUED], 1)
+
+
+class TestWorker(unittest.TestCase):
+    """
+    Test workers draining the queue against the stub engine
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.queue = JobQueue(os.path.join(self.temp_dir, 'jobs.db'))
+
+    def test_workers(self):
+        """Several workers drain the queue and store the results."""
+        job_ids = [self.queue.submit('ENVI:Sleep', {'SECONDS': 0.05}) for _ in range(6)]
+        failed_id = self.queue.submit('ENVI:Fail', {'MESSAGE': 'boom'})
+        workers = [Worker(self.queue.broker, slots=2, poll_interval=0.05)
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        try:
+            for job_id in job_ids:
+                result = self.queue.result(job_id, timeout=30, poll_interval=0.05)
+                self.assertEqual(result['outputParameters']['SLEPT'], 0.05)
+            with self.assertRaises(JobFailedError):
+                self.queue.result(failed_id, timeout=30, poll_interval=0.05)
+        finally:
+            for worker in workers:
+                worker.stop()
+        self.assertEqual(self.queue.broker.counts()[SUCCEEDED], 6)
+
+    def test_stop_heartbeats(self):
+        """A stopped worker keeps its heartbeat interval until its jobs end."""
+        job_id = self.queue.submit('ENVI:Sleep', {'SECONDS': 1.0})
+        worker = Worker(self.queue.broker, lease_seconds=0.3, poll_interval=0.05)
+        beats = []
+        heartbeat = worker.broker.heartbeat
+
+        def _counting_heartbeat(*args):
+            beats.append(time.time())
+            return heartbeat(*args)
+
+        worker.broker.heartbeat = _counting_heartbeat
+        worker.start()
+        while self.queue.broker.counts()[LEASED] == 0:
+            time.sleep(0.01)
+        worker.stop()
+        self.assertEqual(self.queue.result(job_id, timeout=0)['outputParameters']['SLEPT'], 1.0)
+        # One heartbeat every 0.1 seconds for about a second
+        self.assertGreater(len(beats), 3)
+        self.assertLess(len(beats), 20)
@@ -0,0 +1,120 @@
+"""
+Tests the HTTP job service and the remote engine backend
+"""
+
+import threading
+import time
+import unittest
+
+from envipyengine import Engine
+from envipyengine.error import RemoteEngineError, RemoteServiceBusyError
+from envipyengine.error import TaskEngineExecutionError, TaskEngineTimeoutError
+from envipyengine.error import TaskEngineLimitError
+from envipyengine.remote import RemoteEngine
+from envipyengine.remote.client import Client
+from envipyengine.remote.server import serve
+from envipyengine.taskengine import limits
+
+from .. import test
+
+
+class TestRemote(unittest.TestCase):
+    """
+    Test the job service on localhost against the stub engine
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        self.temp_dir = config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+        self.server = serve(port=0, max_workers=2, max_queued=1, wait=0.2)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.service.shutdown)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.engine = RemoteEngine(self.server.url, cwd=self.temp_dir)
+        self.addCleanup(self.engine.client.close)
+
+    def test_tasks(self):
+        """Tasks and definitions match the local engine."""
+        self.assertEqual(self.engine.tasks(), Engine('ENVI').tasks())
+        task = self.engine.task('SpectralIndex')
+        self.assertEqual(task.taskinfo(), Engine('ENVI').task('SpectralIndex').taskinfo())
+        self.assertEqual(task.name, 'SpectralIndex')
+        self.assertRaises(TaskEngineExecutionError, self.engine.task('Missing').taskinfo)
+
+    def test_execute(self):
+        """Short jobs are answered directly and long jobs are polled."""
+        result = self.engine.task('getcwd').execute({})
+        self.assertEqual(result['outputParameters']['CWD'], self.temp_dir)
+        self.assertIsNotNone(result.resources.wall_time)
+
+        # The submission is answered with 202 before the job finishes
+        status, headers, record = self.engine.client.request(
+            'POST', '/engines/ENVI/tasks/Sleep/jobs',
+            {'parameters': {'SECONDS': 0.5}, 'wait': 0})
+        self.assertEqual(status, 202)
+        self.assertIn(record['status'], ('queued', 'running'))
+        self.assertEqual(headers['Location'], record['url'])
+        result = self.engine.task('Sleep').execute({'SECONDS': 0.5})
+        self.assertEqual(result['outputParameters']['SLEPT'], 0.5)
+
+    def test_errors(self):
+        """Job errors are raised with their original type."""
+        with self.assertRaises(TaskEngineExecutionError) as context:
+            self.engine.task('Fail').execute({'MESSAGE': 'remote failure'})
+        self.assertIn('remote failure', str(context.exception))
+        if limits.resource is not None:
+            with self.assertRaises(TaskEngineLimitError) as context:
+                self.engine.task('Sleep').execute({'STUB_OPEN': 64},
+                                                  limits={'open_files': 16})
+            self.assertEqual(context.exception.limit, 'open_files')
+        results = self.engine.task('Fail').execute_batch([{'MESSAGE': 'a'}, {'MESSAGE': 'b'}])
+        self.assertEqual([str(result) for result in results], ['a', 'b'])
+        self.assertRaises(RemoteEngineError, self.engine.client.get, '/nothing')
+        self.assertRaises(RemoteEngineError, RemoteEngine('http://127.0.0.1:1').tasks)
+
+    def test_bounded(self):
+        """Jobs beyond the workers and queue are refused."""
+        task = self.engine.task('Sleep')
+        records = [task._submit({'SECONDS': 0.5}, {}, 0) for _ in range(3)]
+        with self.assertRaises(RemoteServiceBusyError) as context:
+            task._submit({'SECONDS': 0.5}, {}, 0)
+        self.assertEqual(context.exception.retry_after, 1)
+        self.assertEqual([task._wait(record)['status'] for record in records],
+                         ['succeeded'] * 3)
+
+    def test_batch_busy(self):
+        """Batches larger than the workers and queue wait for free slots."""
+        server = serve(port=0, max_workers=1, max_queued=1, wait=0.2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.service.shutdown)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        engine = RemoteEngine(server.url, cwd=self.temp_dir)
+        self.addCleanup(engine.client.close)
+        results = engine.task('Sleep').execute_batch([{'SECONDS': 0.2}] * 5)
+        self.assertEqual([result['outputParameters']['SLEPT'] for result in results],
+                         [0.2] * 5)
+
+    def test_batch_timeout(self):
+        """The jobs of a batch share its timeout."""
+        start = time.time()
+        with self.assertRaises(TaskEngineTimeoutError):
+            self.engine.task('Sleep').execute_batch([{'SECONDS': 0.6}] * 5, timeout=1)
+        self.assertLess(time.time() - start, 2)
+
+    def test_keep_alive(self):
+        """Requests of all tasks share kept-alive connections."""
+        for _ in range(5):
+            self.engine.task('getcwd').execute({})
+        self.engine.tasks()
+        self.assertEqual(self.server.connections, 1)
+        client = Client(self.server.url, pool_size=0)
+        client.get('/engines/ENVI/tasks')
+        client.get('/engines/ENVI/tasks')
+        self.assertEqual(self.server.connections, 3)
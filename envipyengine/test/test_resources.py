@@ -0,0 +1,62 @@
+"""
+Tests the per-job resource accounting
+"""
+
+import os
+import unittest
+
+from envipyengine import Engine, metrics
+from envipyengine.taskengine import resources
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+
+class TestResources(unittest.TestCase):
+    """
+    Test the resource usage of engine processes
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+
+    @unittest.skipUnless(hasattr(os, 'wait4'), 'requires os.wait4')
+    def test_rusage(self):
+        """CPU times and peak RSS are attached to the result."""
+        result = Engine('ENVI').task('Sleep').execute({'SECONDS': 0})
+        usage = result.resources
+        self.assertGreater(usage.wall_time, 0)
+        self.assertGreater(usage.cpu_time, 0)
+        self.assertGreater(usage.max_rss, 1024 * 1024)
+        self.assertIsNone(usage.sampled_rss)
+
+    @unittest.skipUnless(resources.RSSSampler.available(), 'requires /proc')
+    def test_sampled_rss(self):
+        """The RSS of long jobs can be sampled from /proc."""
+        result = Engine('ENVI').task('Sleep').execute({'SECONDS': 0.3}, rss_interval=0.05)
+        self.assertGreater(result.resources.sampled_rss, 1024 * 1024)
+
+    def test_recorder(self):
+        """Resource usage is recorded per task name and exported as metrics."""
+        resources.RECORDER.clear()
+        resources.enable()
+        self.addCleanup(resources.disable)
+        metrics.REGISTRY.clear()
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+
+        task = Engine('ENVI').task('Sleep')
+        task.execute({'SECONDS': 0})
+        task.execute({'SECONDS': 0})
+        self.assertEqual(len(resources.usage('Sleep')), 2)
+        self.assertIn('Sleep', resources.RECORDER.tasks())
+        if hasattr(os, 'wait4'):
+            self.assertGreater(metrics.CPU_SECONDS.value(('execute', 'Sleep', 'user')), 0)
+
+    def test_exit_code(self):
+        """Return codes are preserved when reaping with wait4."""
+        with self.assertRaises(TaskEngineExecutionError) as context:
+            Engine('ENVI').task('Fail').execute({'MESSAGE': '', 'EXIT_CODE': 3})
+        self.assertEqual(str(context.exception), 'Task Engine exited with code: 3')
@@ -0,0 +1,92 @@
+"""
+Tests routing jobs across engine profiles
+"""
+
+import os
+import threading
+import time
+
+from envipyengine import config, Engine
+from envipyengine.error import TaskEngineNotFoundError
+from envipyengine.taskengine import routing
+
+from .. import test
+
+
+class TestRouting(test.StubEngineTestCase):
+    """
+    Test the engine profile router against the stub engine
+    """
+
+    def setUp(self):
+        super(TestRouting, self).setUp()
+        routing.ROUTER.reset()
+        self.addCleanup(routing.ROUTER.reset)
+
+    def _profiles(self, **profiles):
+        for name, properties in profiles.items():
+            config.set_profile(name, properties)
+
+    def test_no_profiles(self):
+        """Without profiles the main engine setting is used."""
+        Engine('ENVI').task('getcwd').execute({})
+        self.assertEqual(self.observer.profiles, [None])
+
+    def test_round_robin(self):
+        """Profiles take turns."""
+        self._profiles(a={'engine': test.stub_engine()}, b={})
+        for _ in range(4):
+            Engine('ENVI').task('getcwd').execute({})
+        self.assertEqual(sorted(self.observer.profiles), ['a', 'a', 'b', 'b'])
+
+    def test_least_loaded(self):
+        """Jobs go to the profile with the fewest running jobs."""
+        self._profiles(a={}, b={})
+        config.set('routing', routing.LEAST_LOADED)
+        busy = threading.Thread(target=Engine('ENVI').task('Sleep').execute,
+                                args=({'SECONDS': 1},))
+        busy.start()
+        try:
+            while not any(state['active'] for state in routing.ROUTER.health().values()):
+                time.sleep(0.01)
+            for _ in range(3):
+                Engine('ENVI').task('getcwd').execute({})
+        finally:
+            busy.join()
+        self.assertEqual(len(set(self.observer.profiles[1:])), 1)
+        self.assertNotEqual(self.observer.profiles[0], self.observer.profiles[-1])
+
+    def test_pinned(self):
+        """Pinned tasks only run on their profiles."""
+        self._profiles(a={}, b={'tasks': 'Sleep, getcwd'})
+        config.set('routing', routing.PINNED)
+        for _ in range(3):
+            Engine('ENVI').task('getcwd').execute({})
+        self.assertEqual(self.observer.profiles, ['b', 'b', 'b'])
+
+    def test_profile_and_version(self):
+        """Jobs can be pinned to a profile or version."""
+        self._profiles(a={'version': '5.6'}, b={'version': '6.0'})
+        Engine('ENVI', profile='a').task('getcwd').execute({})
+        Engine('ENVI', version='6.0').task('getcwd').execute({})
+        self.assertEqual(self.observer.profiles, ['a', 'b'])
+        with self.assertRaises(TaskEngineNotFoundError):
+            Engine('ENVI', profile='c').task('getcwd').execute({})
+
+    def test_health(self):
+        """Profiles failing to spawn are retried elsewhere and taken out of rotation."""
+        broken = os.path.join(self.temp_dir, 'taskengine')
+        with open(broken, 'w') as engine_file:
+            engine_file.write('not executable')
+        self._profiles(good={}, broken={'engine': broken},
+                       missing={'engine': '/no/such/taskengine'})
+        config.set('profile-failures', '2')
+        for _ in range(6):
+            Engine('ENVI').task('getcwd').execute({})
+        self.assertEqual(self.observer.profiles, ['good'] * 6)
+        health = routing.ROUTER.health()
+        self.assertTrue(health['good']['healthy'])
+        self.assertFalse(health['broken']['healthy'])
+        self.assertFalse(health['missing']['healthy'])
+        self.assertEqual(health['broken']['failures'], 2)
+        self.assertEqual(sum(state['active'] for state in health.values()), 0)
@@ -0,0 +1,76 @@
+"""
+Tests the resource-aware scheduler
+"""
+
+import threading
+import time
+import unittest
+
+from envipyengine.scheduler import Scheduler, Cost
+from envipyengine.error import SchedulerError
+
+
+class FakeTask(object):
+    """Task stand-in that records the scheduler usage while it runs."""
+    def __init__(self, name, scheduler=None, delay=0.05):
+        self.uri = 'ENVI:' + name
+        self.scheduler = scheduler
+        self.delay = delay
+        self.peak = Cost(0, 0, 0)
+        self._lock = threading.Lock()
+
+    def execute(self, parameters, **kwargs):
+        in_use = self.scheduler.in_use
+        with self._lock:
+            self.peak = Cost(max(self.peak.memory, in_use.memory),
+                             max(self.peak.cpus, in_use.cpus),
+                             max(self.peak.seats, in_use.seats))
+        time.sleep(self.delay)
+        return {'outputParameters': parameters}
+
+
+class TestScheduler(unittest.TestCase):
+    """
+    Test the resource-aware scheduler
+    """
+
+    def test_memory_budget(self):
+        """Jobs are queued so memory is never oversubscribed."""
+        scheduler = Scheduler(memory='4G', cpus=16, seats=16,
+                              costs={'Big': Cost(memory='3G')})
+        task = FakeTask('Big', scheduler)
+        with scheduler:
+            futures = [scheduler.submit(task, {'N': index}) for index in range(3)]
+            results = [future.result() for future in futures]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(task.peak.memory, 3 * 1024 ** 3)
+        self.assertEqual(scheduler.in_use, Cost(0, 0, 0))
+
+    def test_seat_budget(self):
+        """Jobs never use more license seats than available."""
+        scheduler = Scheduler(cpus=16, seats=2)
+        task = FakeTask('SpectralIndex', scheduler)
+        with scheduler:
+            for future in [scheduler.submit(task, {}) for _ in range(6)]:
+                future.result()
+        self.assertEqual(task.peak.seats, 2)
+
+    def test_explicit_cost(self):
+        """An explicit cost overrides the cost table."""
+        scheduler = Scheduler(cpus=8, costs={'SpectralIndex': Cost(cpus=1)})
+        task = FakeTask('SpectralIndex')
+        self.assertEqual(scheduler.cost(task), Cost(cpus=1))
+        self.assertEqual(scheduler.cost(task, cost={'cpus': 4}), Cost(cpus=4))
+        self.assertEqual(scheduler.cost(FakeTask('Other')), Cost())
+
+    def test_estimator(self):
+        """The estimator is used before the cost table."""
+        scheduler = Scheduler(cpus=8, costs={'SpectralIndex': Cost(cpus=1)},
+                              estimator=lambda task, parameters: Cost(memory='1G'))
+        self.assertEqual(scheduler.cost(FakeTask('SpectralIndex')).memory, 1024 ** 3)
+
+    def test_too_large(self):
+        """A job that can never fit raises a SchedulerError."""
+        scheduler = Scheduler(memory='1G', cpus=2)
+        with self.assertRaises(SchedulerError):
+            scheduler.submit(FakeTask('Big'), {}, cost=Cost(memory='2G'))
@@ -0,0 +1,111 @@
+"""
+Tests the ENVI Py Engine scratch space manager
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from envipyengine.pipeline import Pipeline
+from envipyengine.scratch import ScratchSpace
+from envipyengine.error import ScratchQuotaExceededError
+
+
+class FakeTask(object):
+    """
+    Task stand-in with a temporary output URI that writes its output file.
+    """
+    parameters = [
+        {'name': 'INPUT_RASTER', 'direction': 'input'},
+        {'name': 'OUTPUT_RASTER_URI', 'direction': 'input',
+         'is_temporary': True, 'auto_extension': '.dat'},
+        {'name': 'OUTPUT_RASTER', 'direction': 'output'},
+    ]
+
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, parameters, cwd=None, **kwargs):
+        self.calls.append(parameters)
+        uri = parameters['OUTPUT_RASTER_URI']
+        for filename in (uri, os.path.splitext(uri)[0] + '.hdr'):
+            with open(filename, 'w') as output:
+                output.write('data')
+        return {'outputParameters': {'OUTPUT_RASTER': uri}}
+
+
+class TestScratch(unittest.TestCase):
+    """
+    Test the scratch space manager
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_assign(self):
+        """Unspecified temporary parameters are assigned into the scratch space."""
+        scratch = ScratchSpace(self.root)
+        parameters = scratch.assign(FakeTask(), {'INPUT_RASTER': 'in.dat'}, owner='job')
+        uri = parameters['OUTPUT_RASTER_URI']
+        self.assertTrue(uri.startswith(self.root))
+        self.assertTrue(uri.endswith('.dat'))
+        self.assertEqual(scratch.allocations('job'), [uri])
+
+    def test_specified_not_assigned(self):
+        """Explicit output URIs are left unchanged."""
+        scratch = ScratchSpace(self.root)
+        parameters = scratch.assign(FakeTask(), {'output_raster_uri': 'mine.dat'})
+        self.assertEqual(parameters, {'output_raster_uri': 'mine.dat'})
+
+    def test_release_deletes(self):
+        """Files are deleted once the last consumer releases them."""
+        scratch = ScratchSpace(self.root)
+        task = FakeTask()
+        result = task.execute(scratch.assign(task, {}, owner='job'))
+        uri = result['outputParameters']['OUTPUT_RASTER']
+        scratch.retain('job', 2)
+
+        scratch.release('job')
+        self.assertTrue(os.path.exists(uri))
+        scratch.release('job')
+        self.assertFalse(os.path.exists(uri))
+        self.assertFalse(os.path.exists(os.path.splitext(uri)[0] + '.hdr'))
+
+    def test_keep(self):
+        """Files are kept for debugging when keep is set."""
+        scratch = ScratchSpace(self.root, keep=True)
+        task = FakeTask()
+        with scratch.job() as job:
+            result = task.execute(scratch.assign(task, {}, owner=job))
+        self.assertTrue(os.path.exists(result['outputParameters']['OUTPUT_RASTER']))
+
+    def test_quota(self):
+        """Allocations fail once the quota is used up."""
+        scratch = ScratchSpace(self.root, quota=4)
+        task = FakeTask()
+        task.execute(scratch.assign(task, {}, owner='first'))
+        with self.assertRaises(ScratchQuotaExceededError):
+            scratch.assign(task, {}, owner='second')
+        self.assertEqual(ScratchSpace(self.root, quota='8G').quota, 8 * 1024 ** 3)
+
+    def test_pipeline(self):
+        """Pipeline intermediates are deleted after their consumers complete."""
+        scratch = ScratchSpace(self.root)
+        first_task = FakeTask()
+        last_task = FakeTask()
+        pipeline = Pipeline(scratch=scratch)
+        first = pipeline.add('first', first_task)
+        pipeline.add('last', last_task,
+                     dict(INPUT_RASTER=first.output('OUTPUT_RASTER'),
+                          OUTPUT_RASTER_URI=os.path.join(self.root, 'final.dat')))
+        pipeline.run()
+
+        intermediate = first_task.calls[0]['OUTPUT_RASTER_URI']
+        self.assertTrue(intermediate.startswith(self.root))
+        self.assertEqual(last_task.calls[0]['INPUT_RASTER'], intermediate)
+        self.assertFalse(os.path.exists(intermediate))
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'final.dat')))
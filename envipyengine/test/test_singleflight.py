@@ -0,0 +1,87 @@
+"""
+Tests coalescing identical concurrent jobs
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from envipyengine import Engine
+from envipyengine.error import TaskEngineExecutionError
+from envipyengine.taskengine import singleflight
+from envipyengine.taskengine.limits import Limits
+
+from .. import test
+
+
+class TestSingleFlight(test.StubEngineTestCase):
+    """
+    Test single-flight execution against the stub engine
+    """
+
+    stub_properties = {'coalesce': 'true'}
+
+    def _concurrently(self, func, count=4):
+        with ThreadPoolExecutor(count) as executor:
+            futures = [executor.submit(func) for _ in range(count)]
+        return futures
+
+    def test_execute(self):
+        """Identical concurrent jobs share one engine run."""
+        task = Engine('ENVI').task('Sleep')
+        futures = self._concurrently(lambda: task.execute({'SECONDS': 0.5}))
+        results = [future.result() for future in futures]
+        self.assertEqual(self.observer.tasks, ['Sleep'])
+        self.assertTrue(all(result == results[0] for result in results))
+        # Every caller gets its own copy
+        results[0]['outputParameters']['SLEPT'] = 'changed'
+        self.assertEqual(results[1]['outputParameters']['SLEPT'], 0.5)
+
+    def test_different_parameters(self):
+        """Jobs with different parameters are not coalesced."""
+        task = Engine('ENVI').task('Sleep')
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lambda seconds: task.execute({'SECONDS': seconds}),
+                              [0.3, 0.31]))
+        self.assertEqual(len(self.observer.jobs), 2)
+
+    def test_error(self):
+        """All callers receive the exception of the shared run."""
+        task = Engine('ENVI').task('Fail')
+        futures = self._concurrently(lambda: task.execute({'MESSAGE': 'boom',
+                                                           'STUB_DELAY': 0.5}))
+        for future in futures:
+            self.assertIsInstance(future.exception(), TaskEngineExecutionError)
+        self.assertEqual(self.observer.tasks, ['Fail'])
+
+    def test_queries(self):
+        """Concurrent taskinfo and tasks calls are coalesced too."""
+        with test.stub_config(coalesce='true',
+                              environment={'STUB_TASKENGINE_DELAY': '0.5'}):
+            self._concurrently(lambda: Engine('ENVI').tasks())
+            self._concurrently(lambda: Engine('ENVI').task('Sleep').taskinfo())
+        self.assertEqual(self.observer.tasks, ['QueryTaskCatalog', 'QueryTask'])
+
+    def test_opt_in(self):
+        """Jobs are not coalesced unless enabled."""
+        task = Engine('ENVI').task('Sleep')
+        self._concurrently(lambda: task.execute({'SECONDS': 0.3}, coalesce=False), count=2)
+        self.assertEqual(len(self.observer.jobs), 2)
+
+    def test_job_key(self):
+        """The job key does not depend on the order of the parameters."""
+        first = singleflight.job_key({'taskName': 'a', 'inputParameters': {'X': 1, 'Y': 2}},
+                                     'ENVI', '/tmp')
+        second = singleflight.job_key({'inputParameters': {'Y': 2, 'X': 1}, 'taskName': 'a'},
+                                      'ENVI', '/tmp')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, singleflight.job_key(
+            {'taskName': 'a', 'inputParameters': {'X': 1, 'Y': 2}}, 'IDL', '/tmp'))
+
+        # Jobs with other timeouts, placement, limits or threads do not coalesce
+        job = {'taskName': 'a', 'inputParameters': {'X': 1, 'Y': 2}}
+        keys = [singleflight.job_key(job, 'ENVI', '/tmp', timeout=5),
+                singleflight.job_key(job, 'ENVI', '/tmp', placement={'nice': 10}),
+                singleflight.job_key(job, 'ENVI', '/tmp', limits=Limits(memory='1G')),
+                singleflight.job_key(job, 'ENVI', '/tmp', threads=2)]
+        self.assertEqual(len(set([first] + keys)), 5)
+        self.assertEqual(keys[2], singleflight.job_key(job, 'ENVI', '/tmp',
+                                                       limits=Limits(memory='1G')))
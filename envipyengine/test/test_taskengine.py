@@ -0,0 +1,50 @@
+"""
+Tests the taskengine module against the stub taskengine executable
+"""
+
+import unittest
+
+from envipyengine import Engine
+from envipyengine.taskengine import taskengine
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+
+class TestTaskEngine(unittest.TestCase):
+    """
+    Test the taskengine module without an ENVI installation
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+
+    def test_execute(self):
+        """A job round-trips through the engine executable."""
+        result = taskengine.execute({'taskName': 'Sleep',
+                                     'inputParameters': {'SECONDS': 0}}, 'ENVI')
+        self.assertEqual(result['outputParameters']['SLEPT'], 0)
+
+    def test_execute_error(self):
+        """Engine errors raise a TaskEngineExecutionError with stderr."""
+        with self.assertRaises(TaskEngineExecutionError) as context:
+            taskengine.execute({'taskName': 'Fail',
+                                'inputParameters': {'MESSAGE': 'boom'}}, 'ENVI')
+        self.assertEqual(str(context.exception), 'boom')
+
+    def test_tasks(self):
+        """Engine.tasks() returns the task catalog."""
+        self.assertIn('SpectralIndex', Engine('ENVI').tasks())
+
+    def test_taskinfo(self):
+        """Task information is normalized."""
+        task = Engine('ENVI').task('ClassificationToShapefile')
+        self.assertEqual(task.name, 'ClassificationToShapefile')
+        parameters = dict((parameter['name'], parameter)
+                          for parameter in task.parameters)
+        self.assertEqual(parameters['EXPORT_CLASSES']['type'], 'STRING')
+        self.assertEqual(parameters['EXPORT_CLASSES']['dimensions'], '[*]')
+        self.assertEqual(parameters['OUTPUT_VECTOR']['direction'], 'output')
+        self.assertTrue(parameters['OUTPUT_VECTOR_URI']['is_temporary'])
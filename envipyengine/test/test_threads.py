@@ -0,0 +1,89 @@
+"""
+Tests the thread budgets of engine processes
+"""
+
+import os
+import threading
+import time
+import unittest
+
+from envipyengine import config, Engine
+from envipyengine.pipeline import Pipeline
+from envipyengine.scheduler import Cost, Scheduler
+from envipyengine.taskengine import threads
+
+from .. import test
+
+
+class _RecordingTask(object):
+    uri = 'ENVI:Record'
+
+    def __init__(self):
+        self.kwargs = []
+
+    def execute(self, parameters, **kwargs):
+        self.kwargs.append(kwargs)
+        return {}
+
+
+class TestThreads(test.StubEngineTestCase):
+    """
+    Test the thread budgets against the stub engine
+    """
+
+    def _environment(self, **options):
+        """Runs a job and returns the thread variables of its engine."""
+        started = len(self.observer.jobs)
+        thread = threading.Thread(target=Engine('ENVI').task('Sleep').execute,
+                                  args=({'SECONDS': 1},), kwargs=options)
+        thread.start()
+        try:
+            jobs = self.observer.jobs
+            while len(jobs) == started or jobs[-1].pid is None:
+                time.sleep(0.01)
+            time.sleep(0.2)
+            with open('/proc/{0}/environ'.format(jobs[-1].pid), 'rb') as environ:
+                variables = dict(item.decode('utf-8').split('=', 1)
+                                 for item in environ.read().split(b'\0') if b'=' in item)
+        finally:
+            thread.join()
+        return dict((name, variables.get(name)) for name in threads.THREAD_VARIABLES)
+
+    def test_budget(self):
+        """The cores are split between the concurrent jobs."""
+        self.assertEqual(threads.budget(16, cpus=32), 2)
+        self.assertEqual(threads.budget(64, cpus=8), 1)
+        self.assertEqual(threads.budget(1, cpus=8), 8)
+
+    def test_environment(self):
+        """Explicit environment settings take precedence over the budget."""
+        self.assertIsNone(threads.environment(None, None))
+        environment = threads.environment({'PATH': '/bin'}, 4)
+        self.assertEqual(environment['IDL_CPU_TPOOL_NTHREADS'], '4')
+        self.assertEqual(environment['OMP_NUM_THREADS'], '4')
+        config.set_environment({'IDL_CPU_TPOOL_NTHREADS': '12'})
+        environment = threads.environment({'PATH': '/bin'}, 4)
+        self.assertNotIn('IDL_CPU_TPOOL_NTHREADS', environment)
+        self.assertEqual(environment['MKL_NUM_THREADS'], '4')
+
+    @unittest.skipUnless(os.path.isdir('/proc/self'), 'requires /proc')
+    def test_execute(self):
+        """The budget is set in the environment of the engine."""
+        self.assertEqual(set(self._environment(threads=3).values()), set(['3']))
+        config.set_environment({'IDL_CPU_TPOOL_NTHREADS': '7'})
+        variables = self._environment(threads=3)
+        self.assertEqual(variables['IDL_CPU_TPOOL_NTHREADS'], '7')
+        self.assertEqual(variables['OMP_NUM_THREADS'], '3')
+
+    def test_layers(self):
+        """Schedulers and pipelines pass a budget to the jobs they run."""
+        task = _RecordingTask()
+        with Scheduler(cpus=8) as scheduler:
+            scheduler.execute(task, {}, cost=Cost(cpus=2))
+            scheduler.execute(task, {}, cost=Cost(cpus=2), threads=6)
+        self.assertEqual([kwargs['threads'] for kwargs in task.kwargs], [2, 6])
+
+        pipeline = Pipeline(max_workers=4)
+        pipeline.add('a', task, {})
+        pipeline.run()
+        self.assertEqual(task.kwargs[-1]['threads'], threads.budget(4))
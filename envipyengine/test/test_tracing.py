@@ -0,0 +1,94 @@
+"""
+Tests the taskengine tracing hooks
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from envipyengine.taskengine import taskengine, tracing
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+
+class RecordingObserver(tracing.Observer):
+    """Observer that records every notification."""
+    def __init__(self):
+        self.started = []
+        self.spans = []
+        self.finished = []
+
+    def job_started(self, job):
+        self.started.append(job)
+
+    def span(self, job, phase, start, end):
+        self.spans.append((phase, end - start))
+
+    def job_finished(self, job):
+        self.finished.append(job)
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Test the tracing observers
+    """
+
+    def setUp(self):
+        config = test.stub_config()
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+        self.observer = RecordingObserver()
+        tracing.add_observer(self.observer)
+        self.addCleanup(tracing.remove_observer, self.observer)
+
+    def test_phases(self):
+        """All phases of a job are reported with tags."""
+        taskengine.execute({'taskName': 'Sleep', 'inputParameters': {}}, 'ENVI')
+        phases = [phase for phase, _ in self.observer.spans]
+        self.assertEqual(phases, ['config', 'encode', 'spawn', 'write_stdin',
+                                  'engine', 'read_stdout', 'decode'])
+        job = self.observer.finished[0]
+        self.assertEqual(job.task, 'Sleep')
+        self.assertEqual(job.engine, 'ENVI')
+        self.assertIsNotNone(job.pid)
+        self.assertGreater(job.bytes_in, 0)
+        self.assertGreater(job.bytes_out, 0)
+        self.assertIsNone(job.error)
+
+    def test_error(self):
+        """Failed jobs are reported with their error."""
+        with self.assertRaises(TaskEngineExecutionError):
+            taskengine.execute({'taskName': 'Fail'}, 'ENVI')
+        self.assertIsInstance(self.observer.finished[0].error, TaskEngineExecutionError)
+
+    def test_chrome_trace(self):
+        """The Chrome trace exporter writes complete events."""
+        trace = tracing.ChromeTraceObserver()
+        tracing.add_observer(trace)
+        self.addCleanup(tracing.remove_observer, trace)
+        taskengine.execute({'taskName': 'Sleep', 'inputParameters': {}}, 'ENVI')
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        filename = os.path.join(temp_dir, 'trace.json')
+        trace.save(filename)
+        with open(filename) as trace_file:
+            events = json.load(trace_file)['traceEvents']
+        self.assertEqual(len(events), 8)
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+        self.assertEqual(events[-1]['name'], 'Sleep')
+        self.assertEqual(events[-1]['args']['engine'], 'ENVI')
+
+    def test_faulty_observer(self):
+        """A failing observer does not fail the job."""
+        class FaultyObserver(tracing.Observer):
+            def span(self, job, phase, start, end):
+                raise RuntimeError('observer failure')
+        faulty = FaultyObserver()
+        tracing.add_observer(faulty)
+        self.addCleanup(tracing.remove_observer, faulty)
+        result = taskengine.execute({'taskName': 'Sleep', 'inputParameters': {}}, 'ENVI')
+        self.assertIn('SLEPT', result['outputParameters'])
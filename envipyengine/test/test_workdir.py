@@ -0,0 +1,79 @@
+"""
+Tests the per-job working directories
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from envipyengine import Engine
+from envipyengine.error import TaskEngineExecutionError
+
+from .. import test
+
+_RASTER = {'url': '/data/in.dat', 'factory': 'URLRaster'}
+
+
+class TestWorkDir(unittest.TestCase):
+    """
+    Test isolated job execution against the stub engine
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.root = os.path.join(self.temp_dir, 'work')
+        self.output_dir = os.path.join(self.temp_dir, 'out')
+        os.mkdir(self.output_dir)
+        config = test.stub_config(workdir_root=self.root)
+        config.__enter__()
+        self.addCleanup(config.__exit__, None, None, None)
+
+    def test_unique_cwd(self):
+        """Each job runs in a new directory which is removed afterwards."""
+        task = Engine('ENVI', cwd=self.output_dir, isolate=True).task('getcwd')
+        with ThreadPoolExecutor(4) as executor:
+            cwds = list(executor.map(
+                lambda _: task.execute({})['outputParameters']['CWD'], range(4)))
+        self.assertEqual(len(set(cwds)), 4)
+        for cwd in cwds:
+            self.assertTrue(cwd.startswith(self.root))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_outputs_collected(self):
+        """Referenced outputs are moved to cwd, the rest is removed."""
+        task = Engine('ENVI').task('SpectralIndex')
+        result = task.execute(dict(INPUT_RASTER=_RASTER, INDEX='NDVI',
+                                   OUTPUT_RASTER_URI='ndvi.dat'),
+                              cwd=self.output_dir, isolate=True)
+        raster = result['outputParameters']['OUTPUT_RASTER']
+        self.assertEqual(raster['url'], 'ndvi.dat')
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['ndvi.dat', 'ndvi.hdr'])
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_absolute_outputs_relocated(self):
+        """Absolute output paths within the working directory are updated."""
+        task = Engine('ENVI').task('SpectralIndex')
+        result = task.execute(dict(INPUT_RASTER=_RASTER, INDEX='NDVI'),
+                              cwd=self.output_dir, isolate=True)
+        url = result['outputParameters']['OUTPUT_RASTER']['url']
+        self.assertEqual(os.path.dirname(url), self.output_dir)
+        self.assertTrue(os.path.exists(url))
+
+    def test_keep_failed(self):
+        """The directory of a failed job is kept with the 'failed' policy."""
+        with test.stub_config(workdir_root=self.root, workdir_keep='failed',
+                              workdir_isolation='true'):
+            task = Engine('ENVI').task('Fail')
+            with self.assertRaises(TaskEngineExecutionError):
+                task.execute({'MESSAGE': 'boom'}, cwd=self.output_dir)
+            self.assertEqual(len(os.listdir(self.root)), 1)
+
+    def test_disabled(self):
+        """Without isolation the engine runs in cwd."""
+        task = Engine('ENVI').task('getcwd')
+        result = task.execute({}, cwd=self.output_dir)
+        self.assertEqual(os.path.realpath(result['outputParameters']['CWD']),
+                         os.path.realpath(self.output_dir))
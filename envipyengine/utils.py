@@ -1,6 +1,8 @@
 """
-Provides metaclass compatibility for Python 2 and Python 3.
+Provides metaclass compatibility for Python 2 and Python 3 and other utility functions.
 """
+import os
+import shutil
 
 
 def with_metaclass(meta, *bases):
@@ -36,3 +38,83 @@ def with_metaclass(meta, *bases):
                 return type.__new__(cls, name, (), d)
             return meta(name, bases, d)
     return metaclass('temporary_class', None, {})
+
+
+_SIZE_UNITS = {'': 1, 'B': 1,
+               'K': 1024, 'KB': 1024, 'KIB': 1024,
+               'M': 1024 ** 2, 'MB': 1024 ** 2, 'MIB': 1024 ** 2,
+               'G': 1024 ** 3, 'GB': 1024 ** 3, 'GIB': 1024 ** 3,
+               'T': 1024 ** 4, 'TB': 1024 ** 4, 'TIB': 1024 ** 4}
+
+
+def parse_size(value):
+    """
+    Converts a size such as 512, '512M' or '4 GiB' into a number of bytes.
+    Units are binary, so '1K' is 1024 bytes.
+
+    :param value: An integer number of bytes or a string with an optional unit.
+    :return: The integer number of bytes, or None if value is None.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    text = str(value).strip().upper()
+    number = text.rstrip('KMGTIB ')
+    unit = text[len(number):].strip()
+    if unit not in _SIZE_UNITS or not number:
+        raise ValueError('Invalid size: {0!r}'.format(value))
+    return int(float(number) * _SIZE_UNITS[unit])
+
+
+def related_paths(path):
+    """
+    Returns a raster or vector path along with the auxiliary files ENVI
+    writes next to it, such as headers: the existing files of the same
+    directory whose name is the stem of path or starts with the stem and a dot.
+
+    :param path: The path of the data file.
+    :return: A list of paths, empty if the directory does not exist.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        return []
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name == stem or name.startswith(stem + '.')]
+
+
+def register_at_fork(func):
+    """
+    Registers a function to run in the child process after ``os.fork()``.
+    Modules use it to replace locks and state that may have been held by
+    other threads of the parent process when it forked.  Does nothing on
+    platforms without ``os.register_at_fork``.
+
+    Usage::
+
+        @register_at_fork
+        def _after_fork():
+            global _LOCK
+            _LOCK = threading.Lock()
+
+    :param func: The function to call without arguments.
+    :return: func, so this may be used as a decorator.
+    """
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=func)
+    return func
+
+
+_WHICH = {}
+
+
+def which(name):
+    """
+    Returns the path of an executable found on the PATH, or None.  Results
+    are cached per PATH, as they are looked up for every engine spawn.
+
+    :param name: The name of the executable.
+    """
+    key = (name, os.environ.get('PATH'))
+    if key not in _WHICH:
+        _WHICH[key] = shutil.which(name)
+    return _WHICH[key]
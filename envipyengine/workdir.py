@@ -0,0 +1,208 @@
+"""
+The workdir module runs each job in its own working directory.
+
+Tasks write relative output paths and auxiliary files into the working
+directory of the engine, so jobs sharing a working directory can overwrite
+each other.  A :class:`WorkDir` is a unique directory created for a single
+job, on a configurable fast filesystem.  Once the job finished, the files
+referenced by its output parameters, and any files matching the ``collect``
+patterns, are moved to the destination directory and the output parameters
+are updated to the new locations.  The rest is removed according to the keep
+policy:
+
+========== ==========================================================
+Policy     Description
+========== ==========================================================
+never      Always remove the working directory (default).
+failed     Keep the working directory of failed jobs for debugging.
+always     Never remove the working directory.
+========== ==========================================================
+
+Isolation is enabled per call with ``Task.execute(parameters, isolate=True)``,
+per engine with ``Engine('ENVI', isolate=True)`` or for all jobs with the
+``workdir-isolation`` configuration property.  Input files should be given as
+absolute paths, since relative paths resolve within the new directory.
+
+:Example:
+
+>>> from envipyengine import Engine
+>>> task = Engine('ENVI', cwd='/data/out', isolate=True).task('SpectralIndex')
+>>> parameters = dict(INPUT_RASTER=input_raster, OUTPUT_RASTER_URI='ndvi.dat',
+...                   INDEX='Normalized Difference Vegetation Index')
+>>> result = task.execute(parameters)
+>>> result['outputParameters']['OUTPUT_RASTER']['url']
+'/data/out/ndvi.dat'
+
+"""
+from __future__ import absolute_import
+
+import fnmatch
+import logging
+import os
+import shutil
+import tempfile
+
+from . import config
+from .utils import related_paths
+
+_LOGGER = logging.getLogger(__name__)
+
+KEEP_NEVER = 'never'
+KEEP_FAILED = 'failed'
+KEEP_ALWAYS = 'always'
+
+
+class WorkDir(object):
+    """
+    A unique working directory for a single job, used as a context manager.
+
+    :param destination: The directory collected files are moved to.  Defaults
+                        to the python current working directory.
+    :param root: The directory the working directories are created in.
+                 Defaults to the ``workdir-root`` config option, the
+                 ``scratch-dir`` config option or the system temporary directory.
+    :param keep: The keep policy: 'never', 'failed' or 'always'.  Defaults to
+                 the ``workdir-keep`` config option or 'never'.
+    :param collect: Optionally specify a list of glob patterns, relative to
+                    the working directory, of additional files to move to
+                    the destination.
+    """
+
+    def __init__(self, destination=None, root=None, keep=None, collect=None):
+        if root is None:
+            root = config.get('workdir-root', default=None) or \
+                config.get('scratch-dir', default=None) or \
+                os.path.join(tempfile.gettempdir(), 'envipyengine-work')
+        if keep is None:
+            keep = config.get('workdir-keep', default=KEEP_NEVER)
+        if keep not in (KEEP_NEVER, KEEP_FAILED, KEEP_ALWAYS):
+            raise ValueError('Unknown keep policy: {0}'.format(keep))
+
+        self.destination = os.path.abspath(destination or os.getcwd())
+        self.root = os.path.abspath(root)
+        self.keep = keep
+        self.collect_patterns = list(collect or [])
+        self.path = None
+
+    def create(self):
+        """
+        Creates the working directory.
+
+        :return: The path of the working directory.
+        """
+        if not os.path.isdir(self.root):
+            try:
+                os.makedirs(self.root)
+            except OSError:
+                # Created concurrently by another job
+                if not os.path.isdir(self.root):
+                    raise
+        self.path = tempfile.mkdtemp(prefix='job-', dir=self.root)
+        return self.path
+
+    def collect(self, result=None):
+        """
+        Moves the output files of a job to the destination directory.
+
+        :param result: Optionally specify the dictionary returned by the task
+                       engine.  Files referenced by its output parameters are
+                       moved and the references updated in place.
+        :return: A dictionary mapping the moved paths to their new locations.
+        """
+        moved = {}
+        candidates = []
+        if result is not None:
+            candidates.extend(self._referenced(result.get('outputParameters')))
+        for pattern in self.collect_patterns:
+            candidates.extend(self._matching(pattern))
+
+        for path in candidates:
+            for related in related_paths(path):
+                if related in moved:
+                    continue
+                target = os.path.join(self.destination, os.path.relpath(related, self.path))
+                target_dir = os.path.dirname(target)
+                if not os.path.isdir(target_dir):
+                    os.makedirs(target_dir)
+                shutil.move(related, target)
+                moved[related] = target
+
+        if result is not None and 'outputParameters' in result:
+            result['outputParameters'] = _relocate(result['outputParameters'], moved)
+        return moved
+
+    def cleanup(self, failed=False):
+        """
+        Removes the working directory according to the keep policy.
+
+        :param failed: Set to True if the job failed.
+        """
+        if self.path is None:
+            return
+        if self.keep == KEEP_ALWAYS or (failed and self.keep == KEEP_FAILED):
+            _LOGGER.info('Keeping working directory %s', self.path)
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+    def __enter__(self):
+        self.create()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup(failed=exc_type is not None)
+
+    def _referenced(self, value):
+        """
+        Returns the files within the working directory referenced by strings
+        in a value.
+        """
+        if isinstance(value, dict):
+            return [path for item in value.values() for path in self._referenced(item)]
+        if isinstance(value, list):
+            return [path for item in value for path in self._referenced(item)]
+        if not isinstance(value, str) or not value or '\n' in value:
+            return []
+        path = os.path.normpath(os.path.join(self.path, value))
+        if _within(path, self.path) and path != self.path and os.path.exists(path):
+            return [path]
+        return []
+
+    def _matching(self, pattern):
+        matches = []
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for name in filenames + dirnames:
+                path = os.path.join(dirpath, name)
+                if fnmatch.fnmatch(os.path.relpath(path, self.path), pattern):
+                    matches.append(path)
+        return matches
+
+
+def isolation_enabled(isolate=None):
+    """
+    Returns whether jobs run in their own working directory.
+
+    :param isolate: True or False to override the ``workdir-isolation``
+                    config option.
+    """
+    if isolate is not None:
+        return isolate
+    return config.get_boolean('workdir-isolation')
+
+
+def _within(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def _relocate(value, moved):
+    """
+    Returns a copy of an output value with absolute paths to moved files
+    replaced by their new locations.
+    """
+    if isinstance(value, dict):
+        return value.__class__((key, _relocate(item, moved)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_relocate(item, moved) for item in value]
+    if isinstance(value, str) and os.path.isabs(value):
+        return moved.get(os.path.normpath(value), value)
+    return value
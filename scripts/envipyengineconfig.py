@@ -3,8 +3,11 @@
 """
 from __future__ import print_function
 import argparse
+import json
+import sys
 
 from envipyengine import config
+from envipyengine import diagnostics
 
 system_option = argparse.ArgumentParser(add_help=False)
 system_option.add_argument('-s', '--system', action='store_true',
@@ -47,6 +50,50 @@ remove_command = sub_commands.add_parser('remove',
 remove_command.set_defaults(func=remove)
 remove_command.add_argument('property_name', help='the name of the property to remove')
 
+# DOCTOR COMMAND
+def doctor(doctor_args):
+    checks = diagnostics.doctor(doctor_args.engine, timeout=doctor_args.timeout)
+    for check in checks:
+        print('{0:<4} {1:<12} {2}'.format('ok' if check.ok else 'FAIL', check.name,
+                                          check.message))
+    if not all(check.ok for check in checks):
+        sys.exit(1)
+
+doctor_command = sub_commands.add_parser('doctor',
+                                         help='validates the engine executable, args and environment')
+doctor_command.set_defaults(func=doctor)
+doctor_command.add_argument('-e', '--engine', default='ENVI', help='the engine to check')
+doctor_command.add_argument('--timeout', type=float, default=120,
+                            help='seconds the engine may take to list its tasks')
+
+# BENCH COMMAND
+def bench(bench_args):
+    results = diagnostics.bench(bench_args.engine, samples=bench_args.samples,
+                                max_concurrency=bench_args.max_concurrency,
+                                task_name=bench_args.task)
+    if bench_args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{0:<20} {1:>6} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+        'measurement', 'jobs', 'p50 (s)', 'p95 (s)', 'p99 (s)', 'jobs/s'))
+    for name, summary in results.items():
+        if isinstance(summary, dict):
+            print('{0:<20} {1:>6} {2:>10.4f} {3:>10.4f} {4:>10.4f} {5:>10.2f}'.format(
+                name, summary['samples'], summary['p50'], summary['p95'],
+                summary['p99'], summary['throughput']))
+    print('best concurrency: {0}'.format(results['best_concurrency']))
+
+bench_command = sub_commands.add_parser('bench',
+                                        help='measures engine latency and throughput')
+bench_command.set_defaults(func=bench)
+bench_command.add_argument('-e', '--engine', default='ENVI', help='the engine to measure')
+bench_command.add_argument('-n', '--samples', type=int, default=20,
+                           help='number of jobs timed per measurement')
+bench_command.add_argument('-k', '--max-concurrency', type=int, default=4,
+                           help='highest number of concurrent jobs measured')
+bench_command.add_argument('--task', help='the task queried, defaults to the first task')
+bench_command.add_argument('--json', action='store_true', help='print the results as JSON')
+
 # PARSE
 args = main_parser.parse_args()
 args.func(args)
@@ -48,8 +48,18 @@ setup(name='envipyengine',
       url='https://github.com/envi-idl/envipyengine',
       author='NV5 Geospatial Solutions, Inc.',
       packages=['envipyengine',
+                'envipyengine.queue',
+                'envipyengine.remote',
                 'envipyengine.taskengine'],
+      package_data={'envipyengine': ['tasks/*.task', 'tasks/*.pro']},
       scripts=['scripts/envipyengineconfig.py'],
+      entry_points={
+        'console_scripts': [
+            'envipyengine-run = envipyengine.batch:main',
+            'envipyengine-worker = envipyengine.queue.worker:main',
+            'envipyengine-serve = envipyengine.remote.server:main'
+        ]
+      },
       extras_require={
         'dev': [
             'coverage',